@@ -0,0 +1,169 @@
+"""Headless batch runner for the MCP chat client.
+
+Reads conversations from a JSONL file and runs them through the same
+ChatSession logic as the interactive client, several at a time over one
+shared set of servers. Each input line is either
+
+    {"id": "q1", "prompt": "How many txt files are on my desktop?"}
+
+or a multi-turn conversation
+
+    {"id": "q2", "turns": ["Fetch https://example.com", "Summarize it"]}
+
+One result line is written per conversation as soon as it finishes, with the
+response, per-stage timings (llm_1, tools, llm_2) and trace id of every turn.
+
+Usage (from the clients directory):
+    python batch_main.py conversations.jsonl -o results.jsonl --concurrency 8
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from typing import Any, TextIO
+
+from core.http_pool import get_http_pool
+from core.metrics import start_metrics_server
+from core.tracing import get_tracer
+from test_main import ChatSession, Configuration, build_chat_session
+
+logger = logging.getLogger(__name__)
+
+
+def read_conversations(path: str) -> list[dict[str, Any]]:
+    """Read conversations from a JSONL file.
+
+    Args:
+        path: Path to the input file.
+
+    Returns:
+        A list of {"id", "turns"} dictionaries.
+
+    Raises:
+        ValueError: If a line has neither "turns" nor "prompt".
+    """
+    conversations = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            turns = item.get("turns")
+            if turns is None and "prompt" in item:
+                turns = [item["prompt"]]
+            if not turns:
+                raise ValueError(f"Line {line_number} has neither 'turns' nor 'prompt'")
+            conversations.append({"id": item.get("id", line_number), "turns": turns})
+    return conversations
+
+
+async def run_conversation(
+    chat_session: ChatSession, conversation: dict[str, Any]
+) -> dict[str, Any]:
+    """Run all turns of one conversation with its own history.
+
+    Args:
+        chat_session: The shared chat session.
+        conversation: A {"id", "turns"} dictionary.
+
+    Returns:
+        The result record for the output file.
+    """
+    context_window = chat_session.create_context_window()
+    messages = [chat_session.build_system_message()]
+    record: dict[str, Any] = {"id": conversation["id"], "turns": [], "error": None}
+    start = time.perf_counter()
+    try:
+        for user_input in conversation["turns"]:
+            turn = await chat_session.run_turn(messages, user_input, context_window)
+            record["turns"].append(turn.to_dict())
+    except Exception as e:
+        logger.error(f"Conversation {conversation['id']} failed: {e}")
+        record["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        context_window.close()
+    record["elapsed"] = round(time.perf_counter() - start, 4)
+    return record
+
+
+async def run_batch(
+    chat_session: ChatSession,
+    conversations: list[dict[str, Any]],
+    output: TextIO,
+    concurrency: int,
+) -> int:
+    """Run conversations with bounded concurrency, streaming results.
+
+    Args:
+        chat_session: A chat session whose servers are started.
+        conversations: The conversations to run.
+        output: Where result lines are written.
+        concurrency: Maximum number of conversations in flight.
+
+    Returns:
+        The number of conversations that failed.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    failures = 0
+
+    async def run_one(conversation: dict[str, Any]) -> None:
+        nonlocal failures
+        async with semaphore:
+            record = await run_conversation(chat_session, conversation)
+        if record["error"]:
+            failures += 1
+        output.write(json.dumps(record, ensure_ascii=False) + "\n")
+        output.flush()
+
+    await asyncio.gather(*(run_one(conversation) for conversation in conversations))
+    return failures
+
+
+async def main() -> int:
+    """Parse arguments, start the servers once and run the batch."""
+    parser = argparse.ArgumentParser(description="Run chat conversations from a JSONL file")
+    parser.add_argument("input", help="input JSONL file with one conversation per line")
+    parser.add_argument("-o", "--output", help="output JSONL file (default: stdout)")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--config", default="servers_config.json")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    conversations = read_conversations(args.input)
+    config = Configuration()
+    chat_session = build_chat_session(config, config.load_config(args.config))
+    start_metrics_server()
+
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    start = time.perf_counter()
+    try:
+        await chat_session.start_servers()
+        await chat_session.refresh_tools()
+        failures = await run_batch(
+            chat_session, conversations, output, max(1, args.concurrency)
+        )
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        chat_session.context_window.close()
+        await chat_session.cleanup_servers()
+        get_http_pool().close()
+        get_tracer().shutdown()
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"{len(conversations)} conversations, {failures} failed, "
+        f"{elapsed:.2f}s ({len(conversations) / elapsed:.2f}/s)",
+        file=sys.stderr,
+    )
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
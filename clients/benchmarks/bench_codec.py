@@ -0,0 +1,88 @@
+"""
+编解码微基准 - 对比逐次递归处理模板/解析路径与预编译编解码器
+
+用法（在clients目录下）:
+    python -m benchmarks.bench_codec --number 100000
+"""
+
+import argparse
+import json
+import os
+import timeit
+
+from core.codec import ProviderCodec
+
+
+def legacy_prepare_payload(template, model_id, messages, parameters):
+    """旧实现：每次请求递归遍历模板"""
+    def process_template(template, data):
+        if isinstance(template, dict):
+            return {k: process_template(v, data) for k, v in template.items()}
+        elif isinstance(template, list):
+            return [process_template(item, data) for item in template]
+        elif isinstance(template, str):
+            if template == "{model_id}":
+                return model_id
+            elif template == "{messages}":
+                return messages
+            elif template == "{parameters}":
+                return parameters
+            elif template in data:
+                return data[template.strip("{}")]
+            return template
+        return template
+
+    return process_template(template, parameters)
+
+
+def legacy_extract_content(content_path, response_data):
+    """旧实现：每次响应重新拆分并解析路径"""
+    data = response_data
+    for part in content_path.split("."):
+        if "[" in part and "]" in part:
+            name, index_str = part.split("[", 1)
+            index = int(index_str.split("]")[0])
+            data = data[name][index]
+        else:
+            data = data[part]
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description="提供商编解码微基准")
+    parser.add_argument("--number", type=int, default=100000)
+    args = parser.parse_args()
+
+    config_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "models_config.json")
+    with open(config_path, "r", encoding="utf-8") as f:
+        models_config = json.load(f)
+
+    provider_info = models_config["providers"]["aliyun"]
+    parameters = models_config["models"]["qwen-max"]["default_parameters"]
+    messages = [{"role": "user", "content": "你好"}]
+    response_data = {"output": {"choices": [{"message": {"role": "assistant", "content": "你好"}}]}}
+
+    template = provider_info["request_format"]
+    content_path = provider_info["response_format"]["content_path"]
+    codec = ProviderCodec(provider_info)
+
+    assert codec.encode("qwen-max", messages, parameters) == legacy_prepare_payload(
+        template, "qwen-max", messages, parameters
+    )
+    assert codec.decode(response_data) == legacy_extract_content(content_path, response_data)
+
+    cases = [
+        ("encode/legacy", lambda: legacy_prepare_payload(template, "qwen-max", messages, parameters)),
+        ("encode/codec", lambda: codec.encode("qwen-max", messages, parameters)),
+        ("decode/legacy", lambda: legacy_extract_content(content_path, response_data)),
+        ("decode/codec", lambda: codec.decode(response_data)),
+    ]
+
+    print(f"{'case':<16}{'ns/op':>10}")
+    for name, func in cases:
+        seconds = min(timeit.repeat(func, number=args.number, repeat=5))
+        print(f"{name:<16}{seconds / args.number * 1e9:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+"""
+端到端基准 - 在本地桩LLM和合成MCP服务器上测量一轮对话各阶段的延迟和吞吐量
+
+每个请求是一轮完整的工具调用对话：第一次LLM调用返回echo工具调用，执行工具，
+再以工具结果请求最终回复。分别驱动两条路径：
+
+    chat_session      test_main.ChatSession.run_turn（CLI和批处理使用的路径）
+    message_processor gui.chat_panel.MessageProcessor.run（GUI的后台处理流程，
+                      在工作线程中直接调用，不启动Qt事件循环）
+
+对每个并发度报告 llm_1 / tools / llm_2 / total 的 p50/p95/p99（毫秒）和吞吐量，
+结果以JSON写入 --output，便于跟踪性能回退。
+指定 --tool-model 时启用按阶段的模型路由：工具选择阶段发给该模型（桩LLM对它使用 --tool-model-latency），
+最终回答仍由 qwen-max 生成。
+
+用法（在clients目录下）:
+    python -m benchmarks.bench_e2e --concurrency 1 4 16 --requests 64 \\
+        --llm-latency 0.05 --reply-tokens 200 --tool-latency 0.02 --payload-bytes 1024 \\
+        --output bench_e2e.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import platform
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from core.async_runtime import get_runtime
+from core.context_window import ContextWindow, budget_for_model
+from core.http_pool import get_http_pool
+from core.prompt import PromptBuilder
+from core.routing import STAGE_ANSWER, STAGE_TOOL_SELECTION, ModelRouter
+from core.startup import start_servers
+from core.tool_index import ToolSelector
+from core.tools import ToolRegistry
+from core.tracing import get_tracer
+from gui.chat_panel import MessageProcessor
+from gui.server_manager import ServerManager, ServerWorker
+from gui.utils import create_llm_client
+from test_main import ChatSession, LLMClient, Server
+from .stub_llm import StubLLMServer
+
+STUB_SERVER = os.path.join(os.path.dirname(__file__), "stub_mcp_server.py")
+STAGES = ("llm_1", "tools", "llm_2", "total")
+PROMPT = "请把 benchmark 原样返回"
+
+
+def percentiles(samples):
+    """计算延迟统计（毫秒），分位数按最近秩法取值"""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def rank(q):
+        return ordered[max(0, math.ceil(q * len(ordered)) - 1)] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean": round(statistics.fmean(ordered) * 1000, 3),
+        "p50": round(rank(0.50), 3),
+        "p95": round(rank(0.95), 3),
+        "p99": round(rank(0.99), 3),
+    }
+
+
+def summarize(driver, concurrency, timings, errors, elapsed):
+    """汇总一个并发度下的结果"""
+    completed = len(timings)
+    return {
+        "driver": driver,
+        "concurrency": concurrency,
+        "requests": completed + errors,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 4),
+        "throughput_rps": round(completed / elapsed, 3) if elapsed else 0.0,
+        "stages": {
+            stage: percentiles([timing[stage] for timing in timings if stage in timing])
+            for stage in STAGES
+        },
+    }
+
+
+def routing_config(args):
+    """--tool-model 对应的 models_config.json "routing" 配置"""
+    return {"enabled": bool(args.tool_model), STAGE_TOOL_SELECTION: args.tool_model}
+
+
+def server_config(args):
+    """合成MCP服务器的启动配置"""
+    return {
+        "command": sys.executable,
+        "args": [STUB_SERVER, "--latency", str(args.tool_latency),
+                 "--payload-bytes", str(args.payload_bytes)],
+    }
+
+
+async def bench_chat_session(args, url, levels):
+    """驱动 test_main.ChatSession，所有请求共享同一组服务器"""
+    chat_session = ChatSession(
+        [Server("stub", server_config(args))],
+        LLMClient("benchmark", url=url),
+        30.0,
+        ContextWindow(budget_for_model({})),
+        tool_selector=ToolSelector(),
+        function_calling=args.native,
+        router=ModelRouter(routing_config(args)),
+    )
+    results = []
+    try:
+        await chat_session.start_servers()
+        await chat_session.refresh_tools()
+
+        for concurrency in levels:
+            semaphore = asyncio.Semaphore(concurrency)
+            timings = []
+            errors = 0
+
+            async def run_one():
+                nonlocal errors
+                async with semaphore:
+                    messages = [chat_session.build_system_message()]
+                    context_window = chat_session.create_context_window()
+                    start = time.perf_counter()
+                    try:
+                        turn = await chat_session.run_turn(messages, PROMPT, context_window)
+                    except Exception:
+                        errors += 1
+                        return
+                    finally:
+                        context_window.close()
+                    turn.timings["total"] = time.perf_counter() - start
+                    timings.append(turn.timings)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(run_one() for _ in range(args.requests)))
+            results.append(summarize("chat_session", concurrency, timings, errors,
+                                     time.perf_counter() - start))
+    finally:
+        chat_session.context_window.close()
+        await chat_session.cleanup_servers()
+    return results
+
+
+class HeadlessServerManager:
+    """不带界面的服务器管理器，工具执行复用 ServerManager 的实现"""
+
+    execute_tools = ServerManager.execute_tools
+    find_worker = ServerManager.find_worker
+
+    def __init__(self, config):
+        self.registry = ToolRegistry()
+        self.workers = {"stub": ServerWorker("stub", config)}
+
+    def start(self):
+        runtime = get_runtime()
+        for name, worker in self.workers.items():
+            runtime.run(start_servers([worker.connection], 30.0), timeout=60)
+            tools = runtime.run(worker.connection.list_tools(), timeout=60)
+            worker.annotations = {tool.name: tool.annotations for tool in tools}
+            self.registry.update_server(name, tools)
+
+    def get_all_tools(self):
+        return self.registry.tools()
+
+    def close(self):
+        for worker in self.workers.values():
+            worker.cleanup()
+
+
+class HeadlessModelSelector:
+    """只提供LLM客户端的模型选择器，模型指向桩服务"""
+
+    def __init__(self, url, routing=None):
+        with open("models_config.json", "r", encoding="utf-8") as f:
+            self.models_config = json.load(f)
+        self.url = url
+        self.router = ModelRouter(routing)
+        self.llm_client = self.get_llm_client("qwen-max")
+
+    def get_current_model(self):
+        return "qwen-max"
+
+    def get_llm_client(self, model_id):
+        model_info = dict(self.models_config["models"][model_id], base_url=self.url)
+        provider_info = self.models_config["providers"][model_info["provider"]]
+        return create_llm_client("benchmark", model_id, model_info, provider_info)
+
+    def get_current_llm_client(self):
+        return self.llm_client
+
+
+def bench_message_processor(args, url, levels):
+    """在工作线程中直接运行 MessageProcessor.run，记录各信号的时间点"""
+    server_manager = HeadlessServerManager(server_config(args))
+    server_manager.start()
+    model_selector = HeadlessModelSelector(url, routing_config(args))
+    router = model_selector.router
+    routing = {
+        STAGE_TOOL_SELECTION: router.model_for(STAGE_TOOL_SELECTION, "qwen-max"),
+        STAGE_ANSWER: router.model_for(STAGE_ANSWER, "qwen-max"),
+        "reanswer": router.reanswer,
+    } if router.enabled else None
+    tools = server_manager.get_all_tools()
+    system_prompt = PromptBuilder().build(tools, native=args.native)
+    native_tools = tools if args.native and model_selector.llm_client.supports_tool_calls() else None
+
+    def run_one(_):
+        marks = {}
+        errors = []
+        turn_span = get_tracer().span("chat.turn", root=True, model="qwen-max")
+        processor = MessageProcessor(
+            server_manager, model_selector, PROMPT,
+            [{"role": "system", "content": system_prompt}, {"role": "user", "content": PROMPT}],
+            context_window=ContextWindow(budget_for_model({})),
+            tools=native_tools,
+            trace_span=turn_span,
+            routing=routing,
+        )
+        # 在当前线程连接并直接调用run，信号以直接连接方式同步触发
+        processor.response_ready.connect(lambda *_: marks.setdefault("llm_1", time.perf_counter()))
+        processor.tool_result_ready.connect(lambda *_: marks.setdefault("tools", time.perf_counter()))
+        processor.final_response_ready.connect(lambda *_: marks.setdefault("llm_2", time.perf_counter()))
+        processor.error_occurred.connect(errors.append)
+
+        start = time.perf_counter()
+        processor.run()
+        end = time.perf_counter()
+        turn_span.end()
+        processor.context_window.close()
+        if errors or "llm_2" not in marks:
+            return None
+        return {
+            "llm_1": marks["llm_1"] - start,
+            "tools": marks["tools"] - marks["llm_1"],
+            "llm_2": marks["llm_2"] - marks["tools"],
+            "total": end - start,
+        }
+
+    results = []
+    try:
+        for concurrency in levels:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                outcomes = list(executor.map(run_one, range(args.requests)))
+            timings = [outcome for outcome in outcomes if outcome is not None]
+            results.append(summarize("message_processor", concurrency, timings,
+                                     len(outcomes) - len(timings), time.perf_counter() - start))
+    finally:
+        server_manager.close()
+    return results
+
+
+def print_table(results):
+    print(f"{'driver':<18} {'conc':>4} {'rps':>8} {'err':>4} "
+          + " ".join(f"{stage + ' p50/p95/p99':>26}" for stage in STAGES))
+    for result in results:
+        cells = []
+        for stage in STAGES:
+            stats = result["stages"][stage]
+            cells.append(f"{stats.get('p50', 0):>8.1f}/{stats.get('p95', 0):>8.1f}/{stats.get('p99', 0):>8.1f}")
+        print(f"{result['driver']:<18} {result['concurrency']:>4} {result['throughput_rps']:>8.2f} "
+              f"{result['errors']:>4} " + " ".join(f"{cell:>26}" for cell in cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端基准")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=64, help="每个并发度的请求数")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="桩LLM的处理延迟（秒）")
+    parser.add_argument("--reply-tokens", type=int, default=200, help="桩LLM最终回复的token数")
+    parser.add_argument("--tool-latency", type=float, default=0.02, help="合成工具的执行延迟（秒）")
+    parser.add_argument("--payload-bytes", type=int, default=1024, help="合成工具返回内容的大小")
+    parser.add_argument("--native", action="store_true", help="使用原生函数调用")
+    parser.add_argument("--tool-model", help="工具选择阶段路由到的模型，如 qwen-turbo")
+    parser.add_argument("--tool-model-latency", type=float, default=0.01,
+                        help="桩LLM对工具选择模型的处理延迟（秒）")
+    parser.add_argument("--drivers", nargs="+", default=["chat_session", "message_processor"],
+                        choices=["chat_session", "message_processor"])
+    parser.add_argument("--output", help="结果JSON文件")
+    args = parser.parse_args()
+
+    # test_main 在导入时把根日志级别设为DEBUG，基准只保留警告
+    logging.getLogger().setLevel(logging.WARNING)
+
+    model_latency = {args.tool_model: args.tool_model_latency} if args.tool_model else None
+    stub = StubLLMServer(latency=args.llm_latency, reply_tokens=args.reply_tokens,
+                         chunk_chars=16, tool_calls=[("echo", {"text": "benchmark"})],
+                         model_latency=model_latency).start()
+    results = []
+    try:
+        if "chat_session" in args.drivers:
+            results += asyncio.run(bench_chat_session(args, stub.url, args.concurrency))
+        if "message_processor" in args.drivers:
+            results += bench_message_processor(args, stub.url, args.concurrency)
+    finally:
+        stub.stop()
+        get_http_pool().close()
+        get_runtime().stop()
+        get_tracer().shutdown()
+
+    print_table(results)
+    if args.output:
+        report = {
+            "benchmark": "e2e",
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "config": vars(args),
+            "results": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
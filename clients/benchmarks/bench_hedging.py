@@ -0,0 +1,103 @@
+"""
+对冲请求基准测试 - 在带长尾延迟的桩LLM上对比单次请求与对冲请求的延迟分位数
+
+桩LLM按 --slow-rate 的比例把处理延迟从 --latency 换成 --slow-latency，
+模拟提供商偶发的慢请求。对冲模式下主请求超过自适应阈值后发出重复请求，
+报告两种模式的延迟分位数，以及对冲发出和胜出的次数。
+
+用法（在clients目录下）:
+    python -m benchmarks.bench_hedging --calls 300 --concurrency 4 --slow-rate 0.05 \\
+        --output bench_hedging.json
+"""
+
+import argparse
+import json
+import logging
+import platform
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from core.async_runtime import get_runtime
+from core.hedging import HedgePolicy
+from core.http_pool import get_http_pool
+from test_main import LLMClient
+from .bench_e2e import percentiles
+from .stub_llm import StubLLMServer
+
+
+def run_calls(client, calls, concurrency):
+    """并发发出calls次请求，返回 (每次请求的耗时, 错误数)"""
+    messages = [{"role": "user", "content": "你好"}]
+
+    def call(_):
+        start = time.perf_counter()
+        reply = client.get_response(messages)
+        return time.perf_counter() - start, reply.startswith("我遇到了一个错误")
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(call, range(calls)))
+    return [elapsed for elapsed, _ in results], sum(failed for _, failed in results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对冲请求基准测试")
+    parser.add_argument("--calls", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.05, help="桩LLM的正常处理延迟（秒）")
+    parser.add_argument("--slow-rate", type=float, default=0.05, help="慢请求的比例")
+    parser.add_argument("--slow-latency", type=float, default=1.0, help="慢请求的处理延迟（秒）")
+    parser.add_argument("--percentile", type=float, default=0.9, help="对冲阈值的分位数")
+    parser.add_argument("--max-ratio", type=float, default=0.1, help="对冲请求最多占请求数的比例")
+    parser.add_argument("--output", help="结果JSON文件")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    stub = StubLLMServer(latency=args.latency, slow_rate=args.slow_rate,
+                         slow_latency=args.slow_latency).start()
+    try:
+        baseline_client = LLMClient("benchmark", url=stub.url)
+        baseline, baseline_errors = run_calls(baseline_client, args.calls, args.concurrency)
+
+        policy = HedgePolicy("benchmark", {
+            "percentile": args.percentile,
+            "initial_delay": args.latency * 4,
+            "min_delay": 0.0,
+            "max_ratio": args.max_ratio,
+        })
+        hedged_client = LLMClient("benchmark", url=stub.url, hedging=policy)
+        hedged, hedged_errors = run_calls(hedged_client, args.calls, args.concurrency)
+    finally:
+        stub.stop()
+        get_http_pool().close()
+        get_runtime().stop()
+
+    result = {
+        "single": {**percentiles(baseline), "errors": baseline_errors},
+        "hedged": {**percentiles(hedged), "errors": hedged_errors, "policy": policy.stats()},
+    }
+
+    print(f"{'mode':<10}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'errors':>8}")
+    for mode in ("single", "hedged"):
+        stats = result[mode]
+        print(f"{mode:<10}{stats['p50']:>10.1f}{stats['p95']:>10.1f}{stats['p99']:>10.1f}"
+              f"{stats['errors']:>8}")
+    stats = policy.stats()
+    print(f"hedges fired={stats['fired']} won={stats['won']} "
+          f"threshold={stats['threshold'] * 1000:.1f}ms")
+
+    if args.output:
+        report = {
+            "benchmark": "hedging",
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "config": vars(args),
+            "result": result,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
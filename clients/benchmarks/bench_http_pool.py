@@ -0,0 +1,85 @@
+"""
+HTTP连接池基准测试 - 对比每次新建httpx.Client与共享长连接传输的单次调用延迟
+
+用法（在clients目录下）:
+    python -m benchmarks.bench_http_pool --calls 200 --latency 0.005
+"""
+
+import argparse
+import statistics
+import time
+
+import httpx
+
+from core.http_pool import ProviderTransport
+from .stub_llm import StubLLMServer
+
+
+def summarize(samples):
+    """计算延迟统计（毫秒）"""
+    ordered = sorted(samples)
+    return {
+        "mean": statistics.fmean(ordered) * 1000,
+        "p50": ordered[len(ordered) // 2] * 1000,
+        "p95": ordered[int(len(ordered) * 0.95) - 1] * 1000,
+    }
+
+
+def bench_new_client(url, payload, calls):
+    """旧实现：每次请求新建客户端"""
+    samples = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        with httpx.Client(timeout=60.0) as client:
+            response = client.post(url, json=payload)
+            response.raise_for_status()
+            response.json()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def bench_pooled(url, payload, calls, options):
+    """新实现：共享长连接传输"""
+    transport = ProviderTransport("bench", options)
+    samples = []
+    try:
+        for _ in range(calls):
+            start = time.perf_counter()
+            response = transport.post(url, {}, payload)
+            response.raise_for_status()
+            response.json()
+            samples.append(time.perf_counter() - start)
+    finally:
+        transport.close()
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP连接池基准测试")
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.0, help="桩服务的处理延迟（秒）")
+    parser.add_argument("--gzip-min-bytes", type=int, default=0)
+    parser.add_argument("--message-bytes", type=int, default=2000, help="请求中消息的大小")
+    args = parser.parse_args()
+
+    payload = {
+        "model": "qwen-max",
+        "input": {"messages": [{"role": "user", "content": "x" * args.message_bytes}]},
+        "parameters": {"result_format": "message"},
+    }
+    options = {"http2": False, "gzip_min_bytes": args.gzip_min_bytes}
+
+    with StubLLMServer(latency=args.latency) as server:
+        # 预热
+        bench_pooled(server.url, payload, 5, options)
+
+        before = summarize(bench_new_client(server.url, payload, args.calls))
+        after = summarize(bench_pooled(server.url, payload, args.calls, options))
+
+    print(f"{'mode':<12}{'mean(ms)':>10}{'p50(ms)':>10}{'p95(ms)':>10}")
+    for name, stats in (("new-client", before), ("pooled", after)):
+        print(f"{name:<12}{stats['mean']:>10.2f}{stats['p50']:>10.2f}{stats['p95']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+系统提示基准 - 对比每次请求重新格式化工具目录与按指纹缓存的紧凑提示
+
+生成N个与FastMCP工具结构相同的合成工具（docstring描述、无参数说明的schema），
+报告两种格式的系统提示和完整请求体大小、估算token数，以及每次请求构建提示的耗时。
+
+用法（在clients目录下）:
+    python -m benchmarks.bench_prompt --tools 120 --number 200
+"""
+
+import argparse
+import json
+import os
+import timeit
+
+from core.codec import ProviderCodec
+from core.context_window import estimate_tokens
+from core.prompt import (
+    PROMPT_STYLE_COMPACT,
+    PROMPT_STYLE_TEXT,
+    PromptBuilder,
+    build_system_prompt,
+    format_tools,
+)
+from core.tools import Tool
+
+
+def synthetic_tools(count):
+    """生成合成工具目录"""
+    tools = []
+    for index in range(count):
+        description = (
+            f"查询第 {index} 类数据并返回统计结果。\n    \n    Args:\n"
+            f"        query: 查询关键字，支持空格分隔的多个词\n"
+            f"        limit: 返回的最大条目数，默认为10\n    \n"
+            f"    Returns:\n        格式化的统计结果文本\n    "
+        )
+        schema = {
+            "properties": {
+                "query": {"title": "Query", "type": "string"},
+                "limit": {"default": 10, "title": "Limit", "type": "integer"},
+            },
+            "required": ["query"],
+            "title": f"synthetic_tool_{index}Arguments",
+            "type": "object",
+        }
+        tools.append(Tool(f"synthetic_tool_{index}", description, schema, "synthetic"))
+    return tools
+
+
+def main():
+    parser = argparse.ArgumentParser(description="系统提示基准")
+    parser.add_argument("--tools", type=int, default=120)
+    parser.add_argument("--number", type=int, default=200, help="构建耗时的重复次数")
+    args = parser.parse_args()
+
+    config_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "models_config.json")
+    with open(config_path, "r", encoding="utf-8") as f:
+        models_config = json.load(f)
+    codec = ProviderCodec(models_config["providers"]["aliyun"])
+    parameters = models_config["models"]["qwen-max"]["default_parameters"]
+
+    tools = synthetic_tools(args.tools)
+    messages = [{"role": "user", "content": "统计一下第3类数据"}]
+
+    print(f"tools={args.tools}")
+    for style in (PROMPT_STYLE_TEXT, PROMPT_STYLE_COMPACT):
+        prompt = build_system_prompt(format_tools(tools, style), style)
+        body = codec.encode("qwen-max", [{"role": "system", "content": prompt}] + messages, parameters)
+        body_bytes = len(json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        print(f"  {style:<8} prompt={len(prompt.encode('utf-8')):>7} bytes "
+              f"~{estimate_tokens(prompt):>6} tokens  request_body={body_bytes:>7} bytes")
+
+    # 每次请求都重新格式化（旧实现） vs 指纹未变时复用缓存
+    def rebuild():
+        return build_system_prompt(format_tools(tools, PROMPT_STYLE_TEXT))
+
+    builder = PromptBuilder(PROMPT_STYLE_COMPACT)
+
+    def cached():
+        return builder.build(tools, version=1)
+
+    for name, func in (("rebuild_each_request", rebuild), ("cached_by_version", cached)):
+        elapsed = timeit.timeit(func, number=args.number)
+        print(f"  {name:<22} {elapsed / args.number * 1e6:>10.1f} us/request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+工具检索基准 - 工具目录增大时，对比完整提示与BM25 top-k提示的大小和耗时
+
+合成目录由 领域 x 操作 组合生成，每个工具带docstring风格的描述和参数。
+对每个目录大小报告：索引构建耗时、单次检索耗时、完整提示与top-k提示的字节数，
+以及检索结果是否包含目标工具。
+
+用法（在clients目录下）:
+    python -m benchmarks.bench_tool_index --sizes 100 200 500 1000 --top-k 8
+"""
+
+import argparse
+import time
+import timeit
+
+from core.prompt import PROMPT_STYLE_COMPACT, build_system_prompt, format_tools
+from core.tool_index import ToolIndex
+from core.tools import Tool
+
+DOMAINS = [
+    ("weather", "天气", "城市名称"),
+    ("stock", "股票行情", "股票代码"),
+    ("email", "邮件", "收件人地址"),
+    ("calendar", "日历事件", "日期"),
+    ("file", "本地文件", "文件路径"),
+    ("database", "数据库记录", "表名"),
+    ("translate", "文本翻译", "目标语言"),
+    ("map", "地图路线", "目的地"),
+    ("news", "新闻资讯", "关键词"),
+    ("image", "图片", "图片地址"),
+    ("webpage", "网页内容", "网页URL"),
+    ("music", "音乐播放列表", "歌曲名称"),
+]
+ACTIONS = [
+    ("query", "查询"),
+    ("create", "创建"),
+    ("delete", "删除"),
+    ("count", "统计"),
+    ("search", "搜索"),
+    ("export", "导出"),
+]
+
+QUERIES = [
+    ("帮我查询一下北京明天的天气", "weather_query"),
+    ("统计桌面上有多少本地文件", "file_count"),
+    ("搜索最近关于人工智能的新闻资讯", "news_search"),
+]
+
+
+def synthetic_catalog(size):
+    """生成指定大小的合成工具目录"""
+    tools = []
+    index = 0
+    while len(tools) < size:
+        for domain, domain_desc, param_desc in DOMAINS:
+            for action, action_desc in ACTIONS:
+                if len(tools) >= size:
+                    break
+                suffix = f"_{index}" if index else ""
+                description = (
+                    f"{action_desc}{domain_desc}并返回结果。\n    \n    Args:\n"
+                    f"        target: {param_desc}\n"
+                    f"        limit: 返回的最大条目数\n    "
+                )
+                schema = {
+                    "properties": {
+                        "target": {"title": "Target", "type": "string"},
+                        "limit": {"default": 10, "title": "Limit", "type": "integer"},
+                    },
+                    "required": ["target"],
+                    "type": "object",
+                }
+                tools.append(Tool(f"{domain}_{action}{suffix}", description, schema, "synthetic"))
+        index += 1
+    return tools
+
+
+def main():
+    parser = argparse.ArgumentParser(description="工具检索基准")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 200, 500, 1000])
+    parser.add_argument("--top-k", type=int, default=8)
+    parser.add_argument("--number", type=int, default=200, help="检索耗时的重复次数")
+    args = parser.parse_args()
+
+    print(f"{'tools':>6} {'build_ms':>9} {'search_us':>10} {'full_bytes':>11} {'topk_bytes':>11} {'hits':>5}")
+    for size in args.sizes:
+        tools = synthetic_catalog(size)
+
+        start = time.perf_counter()
+        index = ToolIndex(tools)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        search_us = timeit.timeit(
+            lambda: index.search(QUERIES[0][0], args.top_k), number=args.number
+        ) / args.number * 1e6
+
+        full_bytes = len(build_system_prompt(
+            format_tools(tools, PROMPT_STYLE_COMPACT), PROMPT_STYLE_COMPACT
+        ).encode("utf-8"))
+        selected = index.search(QUERIES[0][0], args.top_k)
+        topk_bytes = len(build_system_prompt(
+            format_tools(selected, PROMPT_STYLE_COMPACT), PROMPT_STYLE_COMPACT
+        ).encode("utf-8"))
+
+        hits = sum(
+            expected in [tool.name for tool in index.search(query, args.top_k)]
+            for query, expected in QUERIES
+        )
+        print(f"{size:>6} {build_ms:>9.1f} {search_us:>10.1f} {full_bytes:>11} {topk_bytes:>11} "
+              f"{hits:>2}/{len(QUERIES)}")
+
+
+if __name__ == "__main__":
+    main()
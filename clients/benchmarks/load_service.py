@@ -0,0 +1,202 @@
+"""
+服务压力测试 - 在本地桩LLM和合成MCP服务器上对ASGI聊天服务施加并发负载
+
+在进程内启动桩LLM、ChatService（uvicorn，后台线程）和合成MCP服务器，
+然后模拟若干并发用户，每个用户创建自己的会话并连续发送多轮消息，
+每轮都包含一次工具调用。报告请求延迟分位数、吞吐量和错误数，
+并校验每个会话的历史只包含自己的消息（会话隔离）。
+指定 --spill-dir 和 --idle-timeout 时，用户每轮之间停顿 --think-time 秒，
+空闲会话会被换出到磁盘再恢复，用于校验换出后历史不丢失。
+
+用法（在clients目录下）:
+    python -m benchmarks.load_service --users 50 --turns 4 --llm-latency 0.05 --stream \\
+        --output load_service.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import socket
+import threading
+import time
+
+import httpx
+import uvicorn
+
+from core.context_window import ContextWindow, budget_for_model
+from core.tool_index import ToolSelector
+from service_main import ChatService
+from test_main import ChatSession, LLMClient, Server
+from .bench_e2e import percentiles, server_config
+from .stub_llm import StubLLMServer
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_service(app, port):
+    """在后台线程中运行uvicorn，等待启动完成"""
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, name="service", daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 60
+    while not server.started:
+        if not thread.is_alive() or time.monotonic() > deadline:
+            raise RuntimeError("服务启动失败")
+        time.sleep(0.05)
+    return server, thread
+
+
+async def chat_stream(client, session_id, message):
+    """发送流式请求，返回最后的done事件数据"""
+    done = None
+    event = None
+    async with client.stream("POST", "/chat/stream",
+                             json={"session_id": session_id, "message": message}) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: ") and event in ("done", "error"):
+                data = json.loads(line[len("data: "):])
+                if event == "error":
+                    raise RuntimeError(data["error"])
+                done = data
+    if done is None:
+        raise RuntimeError("流式响应缺少done事件")
+    return done
+
+
+async def run_user(client, user, args, latencies, stage_timings):
+    """一个用户：创建会话，发送多轮消息，最后校验历史"""
+    response = await client.post("/sessions")
+    response.raise_for_status()
+    session_id = response.json()["session_id"]
+
+    for turn in range(args.turns):
+        message = f"user-{user} turn-{turn}"
+        start = time.perf_counter()
+        if args.stream:
+            result = await chat_stream(client, session_id, message)
+        else:
+            response = await client.post("/chat", json={"session_id": session_id, "message": message})
+            response.raise_for_status()
+            result = response.json()
+        latencies.append(time.perf_counter() - start)
+        stage_timings.append(result["timings"])
+        if args.think_time:
+            await asyncio.sleep(args.think_time)
+
+    response = await client.get(f"/sessions/{session_id}")
+    response.raise_for_status()
+    user_messages = [m["content"] for m in response.json()["messages"] if m["role"] == "user"]
+    expected = [f"user-{user} turn-{turn}" for turn in range(args.turns)]
+    if user_messages != expected:
+        raise RuntimeError(f"会话 {session_id} 的历史混入了其他会话的消息")
+
+    await client.delete(f"/sessions/{session_id}")
+
+
+async def run_load(base_url, args):
+    latencies = []
+    stage_timings = []
+    limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120.0, limits=limits) as client:
+        start = time.perf_counter()
+        outcomes = await asyncio.gather(
+            *(run_user(client, user, args, latencies, stage_timings) for user in range(args.users)),
+            return_exceptions=True,
+        )
+        elapsed = time.perf_counter() - start
+        metrics = (await client.get("/metrics")).text
+        health = (await client.get("/healthz")).json()
+
+    errors = [repr(outcome) for outcome in outcomes if isinstance(outcome, Exception)]
+    return {
+        "users": args.users,
+        "turns_per_user": args.turns,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "elapsed_s": round(elapsed, 4),
+        "throughput_rps": round(len(latencies) / elapsed, 3) if elapsed else 0.0,
+        "latency": percentiles(latencies),
+        "stages": {
+            stage: percentiles([timing[stage] for timing in stage_timings if stage in timing])
+            for stage in ("llm_1", "tools", "llm_2")
+        },
+        "metrics_bytes": len(metrics),
+        "sessions_after": {"active": health["sessions"], "spilled": health["spilled_sessions"]},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ASGI聊天服务压力测试")
+    parser.add_argument("--users", type=int, default=50, help="并发用户（会话）数")
+    parser.add_argument("--turns", type=int, default=4, help="每个用户的对话轮数")
+    parser.add_argument("--stream", action="store_true", help="使用 /chat/stream")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="桩LLM的处理延迟（秒）")
+    parser.add_argument("--reply-tokens", type=int, default=200, help="桩LLM最终回复的token数")
+    parser.add_argument("--tool-latency", type=float, default=0.02, help="合成工具的执行延迟（秒）")
+    parser.add_argument("--payload-bytes", type=int, default=1024, help="合成工具返回内容的大小")
+    parser.add_argument("--replicas", type=int, default=1, help="合成MCP服务器的副本数")
+    parser.add_argument("--llm-workers", type=int, default=64, help="服务的LLM工作线程数")
+    parser.add_argument("--think-time", type=float, default=0.0, help="用户每轮之间的停顿（秒）")
+    parser.add_argument("--idle-timeout", type=float, help="会话空闲多少秒后换出")
+    parser.add_argument("--spill-dir", help="换出会话的目录")
+    parser.add_argument("--sweep-interval", type=float, default=1.0, help="换出空闲会话的检查间隔（秒）")
+    parser.add_argument("--output", help="结果JSON文件")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    stub = StubLLMServer(latency=args.llm_latency, reply_tokens=args.reply_tokens,
+                         tool_calls=[("echo", {"text": "load"})]).start()
+    chat_session = ChatSession(
+        [Server("stub", {**server_config(args), "replicas": args.replicas})],
+        LLMClient("load-test", url=stub.url),
+        30.0,
+        ContextWindow(budget_for_model({})),
+        tool_selector=ToolSelector(),
+    )
+    app = ChatService(chat_session, llm_workers=args.llm_workers, idle_timeout=args.idle_timeout,
+                      spill_dir=args.spill_dir, sweep_interval=args.sweep_interval)
+
+    port = free_port()
+    server, thread = start_service(app, port)
+    try:
+        result = asyncio.run(run_load(f"http://127.0.0.1:{port}", args))
+    finally:
+        server.should_exit = True
+        thread.join(timeout=30)
+        stub.stop()
+
+    latency = result["latency"]
+    print(f"users={result['users']} requests={result['requests']} errors={result['errors']} "
+          f"elapsed={result['elapsed_s']:.2f}s throughput={result['throughput_rps']:.1f}/s "
+          f"p50={latency.get('p50', 0):.1f}ms p95={latency.get('p95', 0):.1f}ms "
+          f"p99={latency.get('p99', 0):.1f}ms")
+    for sample in result["error_samples"]:
+        print(f"  error: {sample}")
+
+    if args.output:
+        report = {
+            "benchmark": "load_service",
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "config": vars(args),
+            "result": result,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+异步运行时压力测试 - 从多个线程向共享运行时并发提交大量工具调用
+
+启动若干合成MCP服务器，所有会话由同一个后台事件循环持有，
+然后从线程池中并发调用工具并校验每个结果。
+
+用法（在clients目录下）:
+    python -m benchmarks.stress_runtime --servers 3 --threads 16 --calls 500 --latency 0.02
+    python -m benchmarks.stress_runtime --servers 1 --replicas 4 --blocking --calls 100 --latency 0.05
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from core.async_runtime import get_runtime
+from core.pool import ServerPool
+
+STUB_SERVER = os.path.join(os.path.dirname(__file__), "stub_mcp_server.py")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="异步运行时压力测试")
+    parser.add_argument("--servers", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.02, help="合成工具的执行延迟（秒）")
+    parser.add_argument("--replicas", type=int, default=1, help="每个服务器的副本数")
+    parser.add_argument("--blocking", action="store_true", help="合成工具以阻塞方式执行延迟")
+    args = parser.parse_args()
+
+    runtime = get_runtime()
+    stub_args = [STUB_SERVER, "--latency", str(args.latency)]
+    if args.blocking:
+        stub_args.append("--blocking")
+    connections = [
+        ServerPool(
+            f"stub-{index}",
+            {"command": sys.executable, "args": stub_args, "replicas": args.replicas},
+        )
+        for index in range(args.servers)
+    ]
+
+    async def start_all():
+        await asyncio.gather(*(connection.start() for connection in connections))
+
+    async def close_all():
+        await asyncio.gather(*(connection.close() for connection in connections))
+
+    runtime.run(start_all(), timeout=60)
+
+    def call(index):
+        connection = connections[index % len(connections)]
+        text = f"call-{index}"
+        result = runtime.run(connection.call_tool("echo", {"text": text}), timeout=60)
+        return result.content[0].text == text
+
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as executor:
+            results = list(executor.map(call, range(args.calls)))
+        elapsed = time.perf_counter() - start
+    finally:
+        runtime.run(close_all(), timeout=30)
+        runtime.stop()
+
+    failures = results.count(False)
+    sequential = args.calls * args.latency
+    print(f"calls={args.calls} failures={failures} elapsed={elapsed:.2f}s "
+          f"throughput={args.calls / elapsed:.1f}/s sequential_estimate={sequential:.2f}s")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
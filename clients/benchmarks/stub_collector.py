@@ -0,0 +1,143 @@
+"""
+本地OTLP收集器桩 - 接收OTLP/HTTP JSON格式的span并逐行写入JSONL
+
+用于在没有真实收集器时验证 OTEL_EXPORTER_OTLP_ENDPOINT 导出，
+每个span展开为一行，包含服务名和解码后的属性。
+
+用法（在clients目录下）:
+    python -m benchmarks.stub_collector --port 4318 --output spans.jsonl
+    OTEL_EXPORTER_OTLP_ENDPOINT=http://127.0.0.1:4318 python batch_main.py conversations.jsonl
+"""
+
+import argparse
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _decode_value(value):
+    """把OTLP AnyValue还原为Python值"""
+    for key, convert in (("stringValue", str), ("intValue", int), ("doubleValue", float),
+                         ("boolValue", bool)):
+        if key in value:
+            return convert(value[key])
+    return value
+
+
+def flatten(request):
+    """把ExportTraceServiceRequest展开为span字典列表"""
+    spans = []
+    for resource_spans in request.get("resourceSpans", []):
+        resource = {
+            item["key"]: _decode_value(item["value"])
+            for item in resource_spans.get("resource", {}).get("attributes", [])
+        }
+        for scope_spans in resource_spans.get("scopeSpans", []):
+            for span in scope_spans.get("spans", []):
+                start = int(span["startTimeUnixNano"])
+                end = int(span["endTimeUnixNano"])
+                spans.append({
+                    "service": resource.get("service.name"),
+                    "trace_id": span["traceId"],
+                    "span_id": span["spanId"],
+                    "parent_id": span.get("parentSpanId"),
+                    "name": span["name"],
+                    "duration_ms": (end - start) / 1e6,
+                    "status": span.get("status", {}).get("code"),
+                    "attributes": {
+                        item["key"]: _decode_value(item["value"])
+                        for item in span.get("attributes", [])
+                    },
+                })
+    return spans
+
+
+class CollectorHandler(BaseHTTPRequestHandler):
+    """处理 POST /v1/traces"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path != "/v1/traces":
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        spans = flatten(json.loads(body))
+        with self.server.lock:
+            self.server.spans.extend(spans)
+            if self.server.output is not None:
+                for span in spans:
+                    self.server.output.write(json.dumps(span, ensure_ascii=False) + "\n")
+                self.server.output.flush()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubCollector:
+    """在后台线程中运行的OTLP收集器桩，收到的span同时保存在 spans 列表中"""
+
+    def __init__(self, host="127.0.0.1", port=0, output=None):
+        self.httpd = ThreadingHTTPServer((host, port), CollectorHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.spans = []
+        self.httpd.lock = threading.Lock()
+        self.httpd.output = output
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def endpoint(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def spans(self):
+        return self.httpd.spans
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地OTLP收集器桩")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4318)
+    parser.add_argument("--output", help="span写入的JSONL文件（默认标准输出）")
+    args = parser.parse_args()
+
+    output = open(args.output, "a", encoding="utf-8") if args.output else sys.stdout
+    collector = StubCollector(args.host, args.port, output)
+    print(f"OTLP收集器桩监听 {collector.endpoint}/v1/traces", file=sys.stderr)
+    try:
+        collector.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        collector.httpd.server_close()
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+本地LLM桩服务 - 以千问(DashScope)格式返回固定回复
+
+用于基准测试，避免依赖真实的LLM端点。服务运行在后台线程中，
+支持HTTP/1.1 keep-alive，请求头 X-DashScope-SSE: enable 时以SSE分块返回。
+配置了 tool_calls 时，对以用户消息结尾的请求返回这些调用：请求参数中带有 tools 时
+以原生函数调用格式返回，否则以文本协议的JSON返回；工具结果之后的请求返回普通回复。
+reply_tokens 用于生成指定长度的回复（每个汉字约一个token）。
+model_latency 按请求中的模型覆盖处理延迟，如 {"qwen-turbo": 0.02}，用于测试按阶段路由模型。
+slow_rate 用于模拟长尾：按该比例随机把处理延迟换成 slow_latency。
+error_rate 用于注入故障：按该比例随机返回 error_status 状态码（默认503），用于测试重试和熔断。
+"""
+
+import gzip
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_response(content, tool_calls=None, finish_reason="stop"):
+    """构造DashScope格式的响应体
+
+    Args:
+        content: 回复文本
+        tool_calls: 可选，[(工具名, 参数字典)] 形式的原生工具调用
+        finish_reason: 结束原因，流式响应中未结束的事件为 "null"
+    """
+    message = {"role": "assistant", "content": content}
+    if tool_calls:
+        message["tool_calls"] = [
+            {
+                "id": f"call_{index}",
+                "type": "function",
+                "function": {"name": name, "arguments": json.dumps(arguments, ensure_ascii=False)},
+            }
+            for index, (name, arguments) in enumerate(tool_calls)
+        ]
+        finish_reason = "tool_calls"
+
+    return {
+        "output": {
+            "choices": [{"finish_reason": finish_reason, "message": message}]
+        },
+        "usage": {"input_tokens": 0, "output_tokens": len(content)},
+        "request_id": "stub",
+    }
+
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    """处理POST请求并返回固定回复"""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = self._load_request(self.rfile.read(length))
+
+        latency = self.server.model_latency.get(request.get("model"), self.server.latency)
+        if self.server.slow_rate and random.random() < self.server.slow_rate:
+            latency = self.server.slow_latency
+        if latency:
+            time.sleep(latency)
+
+        if self.server.error_rate and random.random() < self.server.error_rate:
+            self._send_error(self.server.error_status)
+            return
+
+        reply = self.server.reply
+        tool_calls = self.server.tool_calls if self._awaits_tool_call(request) else None
+        if tool_calls and not request.get("parameters", {}).get("tools"):
+            calls = [{"tool": name, "arguments": arguments} for name, arguments in tool_calls]
+            reply = json.dumps(calls[0] if len(calls) == 1 else calls, ensure_ascii=False)
+            tool_calls = None
+
+        if self.headers.get("X-DashScope-SSE") == "enable":
+            self._send_stream(reply)
+            return
+
+        response = make_response("" if tool_calls else reply, tool_calls)
+        body = json.dumps(response, ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status):
+        body = json.dumps({"code": "Throttling", "message": "stub failure"}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _load_request(self, body):
+        """解析（可能经过gzip压缩的）请求体，无法解析时返回空字典"""
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        try:
+            request = json.loads(body)
+        except ValueError:
+            return {}
+        return request if isinstance(request, dict) else {}
+
+    def _awaits_tool_call(self, request):
+        """配置了工具调用且最后一条消息来自用户时返回工具调用"""
+        if not self.server.tool_calls:
+            return False
+        messages = request.get("input", {}).get("messages") or [{}]
+        return messages[-1].get("role") == "user"
+
+    def _send_stream(self, reply):
+        """按固定片段大小以SSE分块返回回复"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        size = self.server.chunk_chars
+        for index in range(0, len(reply), size):
+            if self.server.chunk_delay:
+                time.sleep(self.server.chunk_delay)
+            last = index + size >= len(reply)
+            event = json.dumps(
+                make_response(reply[index:index + size], finish_reason="stop" if last else "null"),
+                ensure_ascii=False,
+            )
+            self._write_chunk(f"id:{index}\ndata:{event}\n\n".encode("utf-8"))
+        self._write_chunk(b"")
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubLLMServer:
+    """在后台线程中运行的LLM桩服务"""
+
+    def __init__(self, reply="你好，我是桩服务。", latency=0.0, chunk_chars=4, chunk_delay=0.0,
+                 host="127.0.0.1", port=0, tool_calls=None, reply_tokens=None, error_rate=0.0,
+                 error_status=503, slow_rate=0.0, slow_latency=1.0, model_latency=None):
+        self.httpd = ThreadingHTTPServer((host, port), StubLLMHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.reply = "好" * reply_tokens if reply_tokens else reply
+        self.httpd.latency = latency
+        self.httpd.chunk_chars = chunk_chars
+        self.httpd.chunk_delay = chunk_delay
+        self.httpd.tool_calls = tool_calls
+        self.httpd.error_rate = error_rate
+        self.httpd.error_status = error_status
+        self.httpd.slow_rate = slow_rate
+        self.httpd.slow_latency = slow_latency
+        self.httpd.model_latency = model_latency or {}
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/api/v1/services/aigc/text-generation/generation"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
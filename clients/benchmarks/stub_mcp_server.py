@@ -0,0 +1,60 @@
+"""
+合成MCP服务器 - 提供延迟和返回大小可配置的工具，用于基准和压力测试
+
+用法:
+    python benchmarks/stub_mcp_server.py --latency 0.05 --payload-bytes 1024 --extra-tools 0 [--blocking]
+"""
+
+import argparse
+import asyncio
+import time
+
+from mcp.server.fastmcp import FastMCP
+
+
+def build_server(latency, payload_bytes, extra_tools, blocking=False):
+    """构建合成服务器"""
+    mcp = FastMCP("合成基准服务器")
+    padding = "x" * payload_bytes
+
+    @mcp.tool()
+    async def echo(text: str) -> str:
+        """原样返回输入文本，并按配置延迟和填充返回内容。
+
+        Args:
+            text: 要返回的文本
+        """
+        if latency and blocking:
+            # 模拟同步实现的工具（如webget），执行期间阻塞整个服务器
+            time.sleep(latency)
+        elif latency:
+            await asyncio.sleep(latency)
+        return text + padding
+
+    # 额外的合成工具，用于模拟较大的工具目录
+    for index in range(extra_tools):
+        async def synthetic(query: str) -> str:
+            return query
+
+        mcp.add_tool(
+            synthetic,
+            name=f"synthetic_tool_{index}",
+            description=f"合成工具 {index}，用于测试第 {index} 类数据的查询和统计。",
+        )
+
+    return mcp
+
+
+def main():
+    parser = argparse.ArgumentParser(description="合成MCP服务器")
+    parser.add_argument("--latency", type=float, default=0.0, help="工具执行延迟（秒）")
+    parser.add_argument("--payload-bytes", type=int, default=0, help="工具返回内容的填充大小")
+    parser.add_argument("--extra-tools", type=int, default=0, help="额外合成工具的数量")
+    parser.add_argument("--blocking", action="store_true", help="以阻塞方式执行延迟")
+    args = parser.parse_args()
+
+    build_server(args.latency, args.payload_bytes, args.extra_tools, args.blocking).run()
+
+
+if __name__ == "__main__":
+    main()
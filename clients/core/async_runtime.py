@@ -0,0 +1,118 @@
+"""
+异步运行时模块 - 在专用后台线程中运行唯一的asyncio事件循环
+
+所有MCP会话（ClientSession）都在这个事件循环中创建、使用和关闭。
+其他线程（Qt主线程、MessageProcessor线程）通过线程安全的future接口提交协程，
+因此不同服务器上的工具调用可以并发执行，也不会在线程之间来回切换事件循环。
+"""
+
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncRuntime:
+    """拥有独立线程和事件循环的异步运行时"""
+
+    def __init__(self, name="mcp-runtime"):
+        self.name = name
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self):
+        """运行时的事件循环，首次访问时启动"""
+        self.start()
+        return self._loop
+
+    def start(self):
+        """启动后台线程和事件循环（已启动时不做任何事）"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+
+            self._loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run_loop():
+                asyncio.set_event_loop(self._loop)
+                self._loop.call_soon(ready.set)
+                self._loop.run_forever()
+
+            self._thread = threading.Thread(target=run_loop, name=self.name, daemon=True)
+            self._thread.start()
+            ready.wait()
+            logger.info(f"异步运行时 {self.name} 已启动")
+
+    def in_runtime_thread(self):
+        """当前是否运行在运行时线程中"""
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def submit(self, coro):
+        """从任意线程提交协程
+
+        Returns:
+            concurrent.futures.Future，可用于等待结果或取消
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """提交协程并阻塞等待结果
+
+        Raises:
+            RuntimeError: 在运行时线程内调用（会导致死锁）
+            concurrent.futures.TimeoutError: 超时未完成（协程会被取消）
+        """
+        if self.in_runtime_thread():
+            coro.close()
+            raise RuntimeError("不能在运行时线程中阻塞等待协程")
+
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    def call_soon(self, callback, *args):
+        """在运行时线程中调度一个回调"""
+        self.loop.call_soon_threadsafe(callback, *args)
+
+    def stop(self, timeout=5.0):
+        """取消剩余任务并停止事件循环"""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = None
+            self._thread = None
+
+        if loop is None or thread is None:
+            return
+
+        async def shutdown():
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        try:
+            asyncio.run_coroutine_threadsafe(shutdown(), loop).result(timeout)
+        except Exception as e:
+            logger.error(f"停止异步运行时出错: {str(e)}")
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(timeout)
+            if not thread.is_alive():
+                loop.close()
+            logger.info(f"异步运行时 {self.name} 已停止")
+
+
+# 进程内共享的运行时，拥有所有MCP会话
+_runtime = AsyncRuntime()
+
+
+def get_runtime():
+    """获取进程内共享的异步运行时"""
+    return _runtime
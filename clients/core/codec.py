@@ -0,0 +1,212 @@
+"""
+提供商编解码模块 - 预编译请求模板和响应路径
+
+models_config.json 中每个提供商的 request_format 模板和 content_path 等响应路径
+在加载配置时编译一次，之后每次请求只执行编译好的构建函数和取值函数，
+不再递归遍历模板或重复解析路径字符串。
+
+提供商配置了 function_calling 时，工具定义作为请求参数发送，
+工具调用从 tool_calls_path 指定的结构化字段读取，而不是从回复文本中解析。
+"""
+
+import logging
+import re
+
+from .tool_calls import from_native_tool_calls, tool_specs
+
+logger = logging.getLogger(__name__)
+
+# 未配置 request_format / response_format 时使用千问格式
+DEFAULT_REQUEST_FORMAT = {
+    "model": "{model_id}",
+    "input": {"messages": "{messages}"},
+    "parameters": "{parameters}",
+}
+DEFAULT_CONTENT_PATH = "output.choices[0].message.content"
+
+_PATH_PART = re.compile(r"([^.\[\]]+)|\[(\d+)\]")
+
+
+def compile_path(path):
+    """将 output.choices[0].message.content 形式的路径编译为键序列
+
+    Returns:
+        由字符串键和整数下标组成的元组
+    """
+    keys = []
+    for name, index in _PATH_PART.findall(path):
+        keys.append(int(index) if index else name)
+    return tuple(keys)
+
+
+def resolve_path(data, keys):
+    """按编译好的键序列取值
+
+    Raises:
+        KeyError, IndexError, TypeError: 路径在数据中不存在
+    """
+    for key in keys:
+        data = data[key]
+    return data
+
+
+def compile_template(template):
+    """将请求模板编译为构建函数
+
+    模板中的字符串 "{model_id}"、"{messages}"、"{parameters}" 会被替换为对应的值，
+    其他形如 "{name}" 的字符串替换为参数中的同名项（不存在时保留原字符串）。
+    不含变量的子树在编译时确定，构建出的负载会共享这些子树，调用方不应修改负载。
+
+    Returns:
+        build(model_id, messages, parameters) 函数
+    """
+    if isinstance(template, dict):
+        items = [(key, compile_template(value)) for key, value in template.items()]
+        return lambda model_id, messages, parameters: {
+            key: build(model_id, messages, parameters) for key, build in items
+        }
+
+    if isinstance(template, list):
+        builders = [compile_template(item) for item in template]
+        return lambda model_id, messages, parameters: [
+            build(model_id, messages, parameters) for build in builders
+        ]
+
+    if isinstance(template, str) and template.startswith("{") and template.endswith("}"):
+        name = template[1:-1]
+        if name == "model_id":
+            return lambda model_id, messages, parameters: model_id
+        if name == "messages":
+            return lambda model_id, messages, parameters: messages
+        if name == "parameters":
+            return lambda model_id, messages, parameters: parameters
+        return lambda model_id, messages, parameters: parameters.get(name, template)
+
+    return lambda model_id, messages, parameters: template
+
+
+class ProviderCodec:
+    """单个提供商的请求编码和响应解码，加载配置时创建并在所有请求间复用"""
+
+    def __init__(self, provider_info=None):
+        self.provider_info = provider_info or {}
+
+        self._header_template = self.provider_info.get("headers")
+        self._headers_cache = {}
+
+        self._build_payload = compile_template(
+            self.provider_info.get("request_format", DEFAULT_REQUEST_FORMAT)
+        )
+
+        response_format = self.provider_info.get("response_format")
+        if response_format is None:
+            self.content_path = DEFAULT_CONTENT_PATH
+        else:
+            self.content_path = response_format.get("content_path")
+        self._content_keys = compile_path(self.content_path) if self.content_path else None
+
+        delta_path = (response_format or {}).get("delta_path")
+        self._delta_keys = compile_path(delta_path) if delta_path else None
+        finish_reason_path = (response_format or {}).get("finish_reason_path")
+        self._finish_reason_keys = compile_path(finish_reason_path) if finish_reason_path else None
+
+        self.stream_config = self.provider_info.get("stream", {})
+
+        function_calling = self.provider_info.get("function_calling", {})
+        tool_calls_path = function_calling.get("tool_calls_path")
+        self._tool_calls_keys = (
+            compile_path(tool_calls_path)
+            if function_calling.get("enabled") and tool_calls_path
+            else None
+        )
+        self.tools_parameter = function_calling.get("parameter", "tools")
+
+    @property
+    def supports_tool_calls(self):
+        """是否启用了原生函数调用"""
+        return self._tool_calls_keys is not None
+
+    @property
+    def supports_streaming(self):
+        """是否启用了SSE流式响应"""
+        return bool(self.stream_config.get("enabled") and self._delta_keys)
+
+    def build_headers(self, api_key):
+        """构建请求头，按API密钥缓存"""
+        headers = self._headers_cache.get(api_key)
+        if headers is not None:
+            return headers
+
+        if not self._header_template:
+            headers = {"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"}
+        else:
+            headers = {}
+            for key, value in self._header_template.items():
+                # 替换变量
+                if isinstance(value, str):
+                    value = value.replace("{api_key}", api_key)
+                headers[key] = value
+
+        self._headers_cache[api_key] = headers
+        return headers
+
+    def encode(self, model_id, messages, parameters):
+        """构建请求负载"""
+        return self._build_payload(model_id, messages, parameters)
+
+    def decode(self, response_data):
+        """从响应数据中提取内容，失败时返回错误说明"""
+        try:
+            return self.decode_content(response_data)
+        except ValueError as e:
+            if self._content_keys is None:
+                logger.error("未配置内容路径")
+            else:
+                logger.error(f"路径不存在: {self.content_path} in {response_data}")
+            return str(e)
+
+    def decode_content(self, response_data):
+        """从响应数据中提取内容
+
+        Raises:
+            ValueError: 未配置内容路径或响应中不存在该路径
+        """
+        if self._content_keys is None:
+            raise ValueError("未配置内容路径")
+        try:
+            return resolve_path(response_data, self._content_keys)
+        except (KeyError, IndexError, TypeError) as e:
+            raise ValueError("路径不存在") from e
+
+    def encode_tools(self, parameters, tools):
+        """返回加入了工具定义的请求参数（不修改传入的参数）"""
+        return {**parameters, self.tools_parameter: tool_specs(tools)}
+
+    def decode_tool_calls(self, response_data):
+        """从响应数据中提取结构化的工具调用，没有调用时返回None"""
+        try:
+            tool_calls = resolve_path(response_data, self._tool_calls_keys)
+        except (KeyError, IndexError, TypeError):
+            return None
+        return from_native_tool_calls(tool_calls)
+
+    def decode_delta(self, event_data):
+        """从SSE事件中提取增量文本，缺少该路径的事件（如结束事件）返回None"""
+        try:
+            delta = resolve_path(event_data, self._delta_keys)
+        except (KeyError, IndexError, TypeError):
+            return None
+        return delta if isinstance(delta, str) else None
+
+    def decode_finish_reason(self, event_data):
+        """从SSE事件中提取结束原因，未配置 finish_reason_path 或尚未结束时返回None"""
+        if self._finish_reason_keys is None:
+            return None
+        try:
+            reason = resolve_path(event_data, self._finish_reason_keys)
+        except (KeyError, IndexError, TypeError):
+            return None
+        # DashScope在未结束的事件中返回字符串 "null"
+        if not isinstance(reason, str) or reason in ("", "null"):
+            return None
+        return reason
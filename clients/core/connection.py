@@ -0,0 +1,344 @@
+"""
+服务器连接模块 - 管理单个MCP服务器的stdio会话
+
+会话的上下文（stdio_client、ClientSession）在一个专属任务中进入和退出，
+满足anyio要求同一任务进入并退出取消作用域的约束；
+其他协程通过 list_tools / call_tool 使用会话，通过 close 通知该任务退出。
+
+工具列表在会话内缓存，只有收到 notifications/tools/list_changed 通知或重新连接时才失效，
+tools_version 在每次失效时递增，供提示构建方判断是否需要重建。
+
+配置 "lazy": true 的服务器以延迟模式运行：工具目录来自快照，子进程在第一次 call_tool 时
+才启动，空闲超过 idle_timeout 秒后关闭，下次调用时再重新启动。
+"""
+
+import asyncio
+import logging
+import os
+import shutil
+import time
+import weakref
+from contextlib import AsyncExitStack
+
+from mcp import ClientSession, StdioServerParameters, types
+from mcp.client.stdio import stdio_client
+
+from .metrics import TOOL_CALL_ERRORS, TOOL_CALL_SECONDS, get_metrics
+from .snapshots import load_snapshot, save_snapshot
+from .tools import Tool
+from .tracing import get_tracer
+
+logger = logging.getLogger(__name__)
+
+# 延迟模式下未配置 idle_timeout 时的默认空闲期限（秒）
+DEFAULT_IDLE_TIMEOUT = 300.0
+
+# 所有连接（弱引用），用于统计存活的子进程数
+_connections = weakref.WeakSet()
+
+
+def _live_processes():
+    counts = {}
+    for connection in list(_connections):
+        key = (connection.name,)
+        counts[key] = counts.get(key, 0) + (connection.session is not None)
+    return counts
+
+
+get_metrics().gauge_callback(
+    "mcp_server_processes", "存活的MCP服务器子进程数", ("server",), _live_processes
+)
+
+
+class ServerConnection:
+    """单个MCP服务器的连接"""
+
+    def __init__(self, name, config, on_tools_changed=None):
+        self.name = name
+        self.config = config
+        self.session = None
+        self._task = None
+        self._closing = None
+
+        # 工具列表缓存
+        self.on_tools_changed = on_tools_changed
+        self.tools_version = 0
+        self._tools = None
+        self._tools_lock = None
+
+        # 延迟启动和空闲回收
+        self.lazy = bool(config.get("lazy", False))
+        self.idle_timeout = config.get("idle_timeout", DEFAULT_IDLE_TIMEOUT)
+        self.in_flight = 0
+        self.last_used = 0.0
+        self._started = False
+        self._spawn_lock = None
+        self._reap_handle = None
+        self._stop_task = None
+        _connections.add(self)
+
+    @property
+    def ready(self):
+        """连接是否可用（延迟模式下子进程可能尚未启动）"""
+        return self.session is not None or (self.lazy and self._started)
+
+    def _server_params(self):
+        """根据配置构建stdio启动参数"""
+        command = (
+            shutil.which("npx")
+            if self.config["command"] == "npx"
+            else self.config["command"]
+        )
+        if command is None:
+            raise ValueError("无法找到指定命令")
+
+        return StdioServerParameters(
+            command=command,
+            args=self.config["args"],
+            env={**os.environ, **self.config["env"]}
+            if self.config.get("env")
+            else None,
+        )
+
+    async def start(self):
+        """启动连接
+
+        普通模式下启动子进程并完成initialize握手；延迟模式下有快照时只加载快照，
+        没有快照时启动一次子进程获取工具目录并保存快照，之后按空闲期限回收。
+
+        Returns:
+            已初始化的ClientSession，延迟模式下未启动子进程时为None
+        """
+        if self.ready:
+            return self.session
+
+        self.invalidate_tools()
+
+        if self.lazy:
+            tools = load_snapshot(self.name, self.config)
+            if tools is not None:
+                self._tools = tools
+                self._started = True
+                logger.info(f"服务器 {self.name} 以延迟模式启动，使用工具目录快照: {len(tools)} 个工具")
+                return None
+
+        session = await self._spawn()
+        self._started = True
+        if self.lazy:
+            await self.list_tools()
+            self._touch()
+        return session
+
+    async def _spawn(self):
+        """启动子进程并等待会话就绪"""
+        server_params = self._server_params()
+        ready = asyncio.get_running_loop().create_future()
+        self._closing = asyncio.Event()
+        self._task = asyncio.create_task(
+            self._run_session(server_params, ready), name=f"mcp-session-{self.name}"
+        )
+
+        try:
+            return await ready
+        except BaseException:
+            # 启动失败或被取消（如超过启动期限）时直接取消会话任务
+            task, self._task = self._task, None
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            raise
+
+    async def _run_session(self, server_params, ready):
+        """在专属任务中持有会话，直到收到关闭通知"""
+        session = None
+        try:
+            async with AsyncExitStack() as exit_stack:
+                read, write = await exit_stack.enter_async_context(
+                    stdio_client(server_params)
+                )
+                session = await exit_stack.enter_async_context(
+                    ClientSession(read, write, message_handler=self._handle_message)
+                )
+                await session.initialize()
+
+                self.session = session
+                if not ready.done():
+                    ready.set_result(session)
+
+                await self._closing.wait()
+        except BaseException as e:
+            if not ready.done():
+                ready.set_exception(e)
+            elif not isinstance(e, asyncio.CancelledError):
+                logger.error(f"服务器 {self.name} 会话异常退出: {str(e)}")
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        finally:
+            # 回收后可能已经启动了新会话，只清除自己持有的会话
+            if self.session is session:
+                self.session = None
+
+    async def _acquire_session(self):
+        """登记一次进行中的请求并返回可用会话，延迟模式下按需启动子进程
+
+        登记和启动都持有 _spawn_lock，与空闲回收互斥：回收在同一把锁中确认没有进行中的请求后
+        才关闭会话，已取得会话的请求不会被中途关闭。调用方结束后必须调用 _release()。
+        """
+        if not self.ready:
+            raise RuntimeError(f"服务器 {self.name} 未初始化")
+
+        if self._spawn_lock is None:
+            self._spawn_lock = asyncio.Lock()
+
+        async with self._spawn_lock:
+            self.in_flight += 1
+            try:
+                if self.session is None:
+                    logger.info(f"服务器 {self.name} 按需启动子进程")
+                    await self._spawn()
+                return self.session
+            except BaseException:
+                self.in_flight -= 1
+                raise
+
+    def _release(self):
+        """结束一次进行中的请求"""
+        self.in_flight -= 1
+        self._touch()
+
+    async def _handle_message(self, message):
+        """处理服务器主动发送的消息，工具列表变化时使缓存失效"""
+        if isinstance(message, Exception):
+            logger.warning(f"服务器 {self.name} 消息处理异常: {str(message)}")
+            return
+
+        if isinstance(message, types.ServerNotification) and isinstance(
+            message.root, types.ToolListChangedNotification
+        ):
+            logger.info(f"服务器 {self.name} 的工具列表已变化")
+            self.invalidate_tools()
+            # 回调中不能直接等待会话请求，否则会阻塞消息接收
+            if self.on_tools_changed:
+                self.on_tools_changed(self)
+
+    def invalidate_tools(self):
+        """使工具列表缓存失效"""
+        self._tools = None
+        self.tools_version += 1
+
+    async def list_tools(self):
+        """获取服务器提供的工具列表，优先使用缓存
+
+        Returns:
+            Tool列表
+        """
+        if not self.ready:
+            raise RuntimeError(f"服务器 {self.name} 未初始化")
+        if self._tools is not None:
+            return list(self._tools)
+
+        if self._tools_lock is None:
+            self._tools_lock = asyncio.Lock()
+
+        async with self._tools_lock:
+            if self._tools is None:
+                session = await self._acquire_session()
+                try:
+                    version = self.tools_version
+                    result = await session.list_tools()
+                finally:
+                    self._release()
+                tools = [Tool.from_mcp(tool, self.name) for tool in result.tools]
+
+                # 获取期间收到变化通知时不写入缓存，下次重新获取
+                if version != self.tools_version:
+                    return tools
+                self._tools = tools
+                logger.debug(f"服务器 {self.name} 的工具列表已缓存: {len(tools)} 个工具")
+
+                if self.lazy:
+                    save_snapshot(self.name, self.config, tools)
+
+            return list(self._tools)
+
+    async def call_tool(self, tool_name, arguments):
+        """调用工具并返回结果"""
+        span = get_tracer().span("mcp.call_tool", server=self.name, tool=tool_name)
+        start = time.perf_counter()
+        failed = True
+        acquired = False
+        try:
+            with span:
+                span.set_attribute("spawned", self.session is None)
+                session = await self._acquire_session()
+                acquired = True
+                logger.debug(f"开始调用工具 {tool_name} 参数: {arguments}")
+                result = await session.call_tool(tool_name, arguments)
+                failed = bool(result.isError)
+                span.set_attribute("is_error", failed)
+                return result
+        finally:
+            if acquired:
+                self._release()
+            TOOL_CALL_SECONDS.labels(self.name, tool_name).observe(time.perf_counter() - start)
+            if failed:
+                TOOL_CALL_ERRORS.labels(self.name, tool_name).inc()
+
+    def _touch(self):
+        """记录最近一次使用时间，延迟模式下重新安排空闲回收"""
+        self.last_used = time.monotonic()
+        if not self.lazy or not self.idle_timeout:
+            return
+        if self._reap_handle is not None:
+            self._reap_handle.cancel()
+        self._reap_handle = asyncio.get_running_loop().call_later(
+            self.idle_timeout, self._reap_if_idle
+        )
+
+    def _idle(self):
+        return (
+            self.session is not None
+            and not self.in_flight
+            and time.monotonic() - self.last_used >= self.idle_timeout
+        )
+
+    def _reap_if_idle(self):
+        """空闲超过期限时关闭子进程，保留工具目录"""
+        self._reap_handle = None
+        if self._idle():
+            self._stop_task = asyncio.get_running_loop().create_task(self._reap())
+
+    async def _reap(self):
+        """持有 _spawn_lock 再次确认空闲后关闭子进程，期间到达的请求等待回收完成后重新启动"""
+        if self._spawn_lock is None:
+            self._spawn_lock = asyncio.Lock()
+
+        async with self._spawn_lock:
+            if not self._idle():
+                return
+            logger.info(f"服务器 {self.name} 空闲超过 {self.idle_timeout} 秒，关闭子进程")
+            await self._stop_session()
+
+    async def _stop_session(self, timeout=5.0):
+        """通知会话任务退出并等待子进程关闭"""
+        task, self._task = self._task, None
+        self.session = None
+        if task is None:
+            return
+
+        self._closing.set()
+        try:
+            await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"服务器 {self.name} 关闭超时，取消会话任务")
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        except Exception as e:
+            logger.error(f"关闭服务器 {self.name} 时出错: {str(e)}")
+
+    async def close(self, timeout=5.0):
+        """关闭连接"""
+        self._started = False
+        if self._reap_handle is not None:
+            self._reap_handle.cancel()
+            self._reap_handle = None
+        await self._stop_session(timeout)
@@ -0,0 +1,241 @@
+"""
+上下文窗口模块 - 按token预算裁剪发送给LLM的对话历史
+
+完整的对话历史仍由调用方保存，每次请求前通过 ContextWindow.fit 得到预算内的消息列表：
+系统提示和当前轮次（最后一条用户消息及其后的工具调用与结果）始终保留，
+较早的轮次从新到旧装入剩余预算，装不下的轮次被丢弃，
+并交给后台线程用较便宜的模型压缩为摘要，之后的请求以摘要代替这些轮次。
+
+预算在models_config.json中按模型配置：
+
+    "context": {
+        "max_tokens": 24000,
+        "reserve_tokens": 2000,
+        "max_message_tokens": 4000,
+        "compaction_model": "qwen-turbo"
+    }
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .metrics import HISTORY_TOKENS
+from .tracing import get_tracer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONTEXT = {
+    "max_tokens": 24000,
+    "reserve_tokens": 2000,
+    "max_message_tokens": 4000,
+    "compaction_model": None,
+}
+
+# 两个LLMClient在请求失败时返回以此开头的提示文本
+LLM_ERROR_PREFIX = "我遇到了一个错误"
+
+SUMMARY_PROMPT = (
+    "请将以下对话压缩为简洁的中文摘要，保留用户的目标、已确认的事实、"
+    "工具调用得到的关键结果和尚未完成的事项，不要编造内容。"
+)
+
+
+def estimate_tokens(text):
+    """粗略估算文本的token数：中日韩字符约1个token，其他字符约4个字符1个token"""
+    if not text:
+        return 0
+    chars = len(text)
+    # 常用中文字符的UTF-8编码为3字节，多出的字节数约为非ASCII字符数的2倍
+    wide = (len(text.encode("utf-8")) - chars) // 2
+    return wide + (chars - wide) // 4 + 1
+
+
+def message_tokens(message):
+    """估算单条消息的token数（含角色等固定开销）"""
+    return estimate_tokens(message.get("content") or "") + 4
+
+
+def budget_for_model(model_info, defaults=None):
+    """合并默认值与模型配置中的上下文预算"""
+    budget = {**DEFAULT_CONTEXT, **(defaults or {})}
+    budget.update((model_info or {}).get("context", {}))
+    return budget
+
+
+def _split_turns(messages):
+    """按用户消息把历史切分为轮次"""
+    turns = []
+    for message in messages:
+        if message.get("role") == "user" or not turns:
+            turns.append([message])
+        else:
+            turns[-1].append(message)
+    return turns
+
+
+class ContextWindow:
+    """单个对话的上下文窗口
+
+    Args:
+        budget: 由 budget_for_model 得到的预算配置
+        summarizer: 可选，summarizer(previous_summary, messages) 返回新的摘要文本，
+            在后台线程中调用
+    """
+
+    def __init__(self, budget=None, summarizer=None):
+        self.budget = budget or dict(DEFAULT_CONTEXT)
+        self.summarizer = summarizer
+        self.summary = None
+        self._summarized = 0  # 摘要覆盖的历史消息数（不含系统提示）
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pending = None
+
+    def reset(self):
+        """对话重新开始时清除摘要"""
+        with self._lock:
+            self.summary = None
+            self._summarized = 0
+
+    def fit(self, messages):
+        """返回预算内的消息列表，不修改传入的历史"""
+        with get_tracer().span("history.fit", messages=len(messages)) as span:
+            fitted, tokens = self._fit(messages)
+            span.set_attributes(kept=len(fitted), tokens=tokens)
+        HISTORY_TOKENS.observe(tokens)
+        return fitted
+
+    def _fit(self, messages):
+        """裁剪历史，返回 (消息列表, 估计的token数)"""
+        system = messages[:1] if messages and messages[0].get("role") == "system" else []
+        body = messages[len(system):]
+
+        # 当前轮次：最后一条用户消息及其之后的消息
+        current_start = 0
+        for index in range(len(body) - 1, -1, -1):
+            if body[index].get("role") == "user":
+                current_start = index
+                break
+        current = body[current_start:]
+        older = body[:current_start]
+
+        with self._lock:
+            summary = self.summary
+            summarized = min(self._summarized, len(older))
+
+        available = (
+            self.budget["max_tokens"]
+            - self.budget["reserve_tokens"]
+            - sum(message_tokens(message) for message in system + current)
+        )
+
+        prefix = list(system)
+        if summary:
+            summary_message = {"role": "system", "content": f"以下是较早对话的摘要：\n{summary}"}
+            available -= message_tokens(summary_message)
+            prefix.append(summary_message)
+
+        candidates = _split_turns(older[summarized:])
+        kept = []
+        for turn in reversed(candidates):
+            turn = [self._truncate(message) for message in turn]
+            cost = sum(message_tokens(message) for message in turn)
+            if cost > available:
+                break
+            available -= cost
+            kept[:0] = turn
+
+        dropped = sum(len(turn) for turn in candidates) - len(kept)
+        if dropped:
+            logger.debug(f"上下文超出预算，本次请求省略 {dropped} 条较早的消息")
+            self._schedule_compaction(older[summarized:summarized + dropped], summarized + dropped)
+
+        used = self.budget["max_tokens"] - self.budget["reserve_tokens"] - available
+        return prefix + kept + current, used
+
+    def _truncate(self, message):
+        """截断超过单条消息预算的历史消息（如大段网页正文）"""
+        limit = self.budget.get("max_message_tokens")
+        content = message.get("content") or ""
+        tokens = estimate_tokens(content)
+        if not limit or tokens <= limit:
+            return message
+
+        keep = max(1, len(content) * limit // tokens)
+        return {
+            **message,
+            "content": f"{content[:keep]}\n…（内容过长，已省略 {len(content) - keep} 个字符）",
+        }
+
+    def _schedule_compaction(self, messages, covered):
+        """在后台压缩被丢弃的消息，同一时间只有一个压缩任务"""
+        if self.summarizer is None:
+            return
+        with self._lock:
+            if self._pending is not None and not self._pending.done():
+                return
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="context-compaction")
+            previous = self.summary
+            self._pending = self._executor.submit(self._compact, previous, list(messages), covered)
+
+    def _compact(self, previous, messages, covered):
+        try:
+            summary = self.summarizer(previous, messages)
+        except Exception as e:
+            logger.warning(f"压缩对话历史失败: {str(e)}")
+            return
+        if not summary:
+            return
+
+        with self._lock:
+            if covered > self._summarized:
+                self.summary = summary
+                self._summarized = covered
+        logger.info(f"已将 {len(messages)} 条较早的消息压缩为摘要")
+
+    @property
+    def busy(self):
+        """是否有正在进行的压缩任务"""
+        pending = self._pending
+        return pending is not None and not pending.done()
+
+    def state(self):
+        """可序列化的摘要状态，用于把对话换出到磁盘"""
+        with self._lock:
+            return {"summary": self.summary, "summarized": self._summarized}
+
+    def restore(self, state):
+        """恢复 state() 保存的摘要状态"""
+        with self._lock:
+            self.summary = state.get("summary")
+            self._summarized = state.get("summarized", 0)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+
+def make_llm_summarizer(get_response, max_message_tokens=2000):
+    """用LLM客户端的get_response构建摘要函数"""
+    def summarize(previous, messages):
+        lines = []
+        if previous:
+            lines.append(f"[已有摘要]\n{previous}")
+        for message in messages:
+            content = message.get("content") or ""
+            tokens = estimate_tokens(content)
+            if tokens > max_message_tokens:
+                content = content[: len(content) * max_message_tokens // tokens] + "…"
+            lines.append(f"[{message.get('role')}]\n{content}")
+
+        reply = get_response([
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": "\n\n".join(lines)},
+        ])
+        if not reply or reply.startswith(LLM_ERROR_PREFIX):
+            raise RuntimeError(reply or "摘要为空")
+        return reply.strip()
+
+    return summarize
@@ -0,0 +1,169 @@
+"""
+对冲请求模块 - 主请求迟迟没有响应时再发一个重复请求，取先返回的结果
+
+主请求超过阈值仍未完成时，向同一模型或配置的更快的后备模型（如qwen-turbo）发出对冲请求，
+先成功的结果胜出，另一个请求被取消（关闭连接）。阈值按最近主请求耗时的分位数自适应计算，
+样本不足时使用 initial_delay。对冲请求受预算限制（最多占请求数的 max_ratio），
+避免提供商整体变慢时把流量翻倍。
+
+在models_config.json的模型配置中启用：
+
+    "hedging": {"percentile": 0.95, "fallback": "qwen-turbo", "max_ratio": 0.1}
+
+对冲次数和胜出次数记录在 llm_hedges_fired_total 和 llm_hedges_won_total 中，
+stats() 返回当前阈值和计数，用于调整分位数。
+"""
+
+import asyncio
+import logging
+import math
+import threading
+import time
+from collections import deque
+
+from .metrics import LLM_HEDGES_FIRED, LLM_HEDGES_WON
+from .resilience import RetryBudget
+from .tracing import current_span
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OPTIONS = {
+    "percentile": 0.95,
+    "initial_delay": 5.0,  # 样本不足时的阈值（秒）
+    "min_delay": 0.2,
+    "max_delay": 30.0,
+    "min_samples": 20,
+    "window": 256,  # 参与计算分位数的最近样本数
+    "fallback": None,  # 对冲请求使用的模型，未配置时使用同一模型
+    "max_ratio": 0.1,
+    "burst": 5,
+}
+
+
+class LatencyTracker:
+    """最近若干次请求耗时的滑动窗口"""
+
+    def __init__(self, window=256):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q):
+        """最近邻秩分位数，没有样本时返回None"""
+        with self._lock:
+            ordered = sorted(self._samples)
+        if not ordered:
+            return None
+        index = min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))
+        return ordered[index]
+
+    def __len__(self):
+        return len(self._samples)
+
+
+class HedgePolicy:
+    """单个模型的对冲策略，进程内共享以积累延迟样本"""
+
+    def __init__(self, name, options=None):
+        self.name = name
+        self.options = {**DEFAULT_OPTIONS, **(options or {})}
+        self.fallback = self.options["fallback"]
+        self.tracker = LatencyTracker(self.options["window"])
+        self.budget = RetryBudget(self.options["burst"], self.options["max_ratio"])
+        self.requests = 0
+        self.fired = 0
+        self.won = 0
+
+    def threshold(self):
+        """发出对冲请求前等待的秒数"""
+        options = self.options
+        if len(self.tracker) < options["min_samples"]:
+            return options["initial_delay"]
+        value = self.tracker.quantile(options["percentile"])
+        return min(options["max_delay"], max(options["min_delay"], value))
+
+    async def run(self, primary, hedge):
+        """执行主请求，超过阈值时发出对冲请求
+
+        Args:
+            primary: 无参协程函数，发出主请求
+            hedge: 无参协程函数，发出对冲请求
+
+        Returns:
+            先成功的请求的结果
+
+        Raises:
+            Exception: 所有已发出的请求都失败时，抛出主请求的错误
+        """
+        self.requests += 1
+        self.budget.deposit()
+        span = current_span()
+        delay = self.threshold()
+        start = time.monotonic()
+        primary_task = asyncio.ensure_future(primary())
+        tasks = {primary_task}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                result = primary_task.result()
+                self.tracker.observe(time.monotonic() - start)
+                span.set_attribute("hedged", False)
+                return result
+
+            if not self.budget.withdraw():
+                span.set_attribute("hedged", False)
+                result = await primary_task
+                self.tracker.observe(time.monotonic() - start)
+                return result
+
+            self.fired += 1
+            LLM_HEDGES_FIRED.labels(self.name).inc()
+            logger.debug(f"{self.name} 超过 {delay:.2f} 秒未响应，发出对冲请求")
+            hedge_task = asyncio.ensure_future(hedge())
+            tasks.add(hedge_task)
+
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.cancelled() or task.exception() is not None:
+                        continue
+                    won = task is hedge_task
+                    if won:
+                        self.won += 1
+                        LLM_HEDGES_WON.labels(self.name).inc()
+                    # 只记录主请求的耗时；对冲胜出时主请求被取消，记录其已等待的时间（实际耗时的下界），
+                    # 既不混入后备模型的延迟，也不会因丢弃慢请求而使阈值越来越低
+                    self.tracker.observe(time.monotonic() - start)
+                    span.set_attributes(hedged=True, hedge_won=won, hedge_delay_ms=round(delay * 1000, 3))
+                    return task.result()
+            return primary_task.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "fired": self.fired,
+            "won": self.won,
+            "threshold": round(self.threshold(), 4),
+            "samples": len(self.tracker),
+        }
+
+
+_policies = {}
+_policies_lock = threading.Lock()
+
+
+def get_hedge_policy(model_id, options=None):
+    """获取模型的共享对冲策略，首次获取时按options创建"""
+    with _policies_lock:
+        policy = _policies.get(model_id)
+        if policy is None:
+            policy = _policies[model_id] = HedgePolicy(model_id, options)
+        return policy
@@ -0,0 +1,179 @@
+"""
+HTTP连接池模块 - 为LLM提供商维护长连接的HTTP传输
+
+每个提供商（models_config.json中的providers）共享一个长期存在的httpx.Client，
+启用keep-alive和连接池，在端点支持时使用HTTP/2，
+并可选择对较大的请求体进行gzip压缩。
+对冲请求需要能够取消进行中的请求，使用按需创建的httpx.AsyncClient（只在共享异步运行时中使用）。
+"""
+
+import asyncio
+import gzip
+import json
+import logging
+import threading
+
+import httpx
+
+from .tracing import current_span
+
+logger = logging.getLogger(__name__)
+
+# HTTP/2 需要可选依赖 h2（pip install httpx[http2]），缺失时回退到HTTP/1.1
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# 默认传输参数，可在提供商配置的 "transport" 字段中覆盖
+DEFAULT_TRANSPORT_OPTIONS = {
+    "http2": True,
+    "max_connections": 20,
+    "max_keepalive_connections": 10,
+    "keepalive_expiry": 60.0,
+    "timeout": 60.0,
+    "connect_timeout": 10.0,
+    "gzip_min_bytes": 0,  # 0 表示不压缩请求体
+}
+
+
+class ProviderTransport:
+    """单个提供商的长连接传输，内部的httpx.Client可被多个线程共享"""
+
+    def __init__(self, provider_id, options=None):
+        self.provider_id = provider_id
+        self.options = {**DEFAULT_TRANSPORT_OPTIONS, **(options or {})}
+
+        http2 = bool(self.options["http2"])
+        if http2 and not HTTP2_AVAILABLE:
+            logger.info(f"未安装h2，提供商 {provider_id} 使用HTTP/1.1")
+            http2 = False
+
+        limits = httpx.Limits(
+            max_connections=self.options["max_connections"],
+            max_keepalive_connections=self.options["max_keepalive_connections"],
+            keepalive_expiry=self.options["keepalive_expiry"],
+        )
+        timeout = httpx.Timeout(
+            self.options["timeout"], connect=self.options["connect_timeout"]
+        )
+        self.client = httpx.Client(http2=http2, limits=limits, timeout=timeout)
+        self._client_options = {"http2": http2, "limits": limits, "timeout": timeout}
+        self._async_client = None
+        self._async_loop = None
+
+    def encode_body(self, payload, headers):
+        """序列化请求体，超过阈值时进行gzip压缩
+
+        Returns:
+            (请求体字节, 请求头) 元组
+        """
+        body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        headers = dict(headers)
+        headers.setdefault("Content-Type", "application/json")
+
+        min_bytes = self.options["gzip_min_bytes"]
+        if min_bytes and len(body) >= min_bytes:
+            body = gzip.compress(body, compresslevel=5)
+            headers["Content-Encoding"] = "gzip"
+
+        return body, headers
+
+    def post(self, url, headers, payload):
+        """发送POST请求并返回响应"""
+        body, headers = self.encode_body(payload, headers)
+        current_span().set_attribute("request_bytes", len(body))
+        return self.client.post(url, headers=headers, content=body)
+
+    def stream(self, url, headers, payload):
+        """发送流式POST请求，返回响应上下文管理器"""
+        body, headers = self.encode_body(payload, headers)
+        current_span().set_attribute("request_bytes", len(body))
+        return self.client.stream("POST", url, headers=headers, content=body)
+
+    def open_stream(self, url, headers, payload):
+        """发送流式POST请求，返回已收到响应头的响应，调用方负责 close()"""
+        body, headers = self.encode_body(payload, headers)
+        current_span().set_attribute("request_bytes", len(body))
+        request = self.client.build_request("POST", url, headers=headers, content=body)
+        return self.client.send(request, stream=True)
+
+    async def post_async(self, url, headers, payload):
+        """在共享异步运行时中发送POST请求，取消等待即关闭该请求的连接"""
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(**self._client_options)
+            self._async_loop = asyncio.get_running_loop()
+        body, headers = self.encode_body(payload, headers)
+        current_span().set_attribute("request_bytes", len(body))
+        return await self._async_client.post(url, headers=headers, content=body)
+
+    def close(self, timeout=5.0):
+        """关闭连接池，异步客户端在其所属的运行时中关闭，必须在停止异步运行时之前调用"""
+        self.client.close()
+        client, loop = self._async_client, self._async_loop
+        self._async_client = self._async_loop = None
+        if client is None:
+            return
+        if loop.is_closed() or not loop.is_running():
+            logger.warning(f"异步运行时已停止，提供商 {self.provider_id} 的异步连接未能关闭")
+            return
+
+        future = asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            return  # 在运行时自身的线程中调用时不能阻塞等待
+        try:
+            future.result(timeout)
+        except Exception as e:
+            logger.error(f"关闭提供商 {self.provider_id} 的异步连接出错: {str(e)}")
+
+
+class HTTPPool:
+    """按提供商管理长连接传输"""
+
+    def __init__(self):
+        self._transports = {}
+        self._lock = threading.Lock()
+
+    def get(self, provider_id, options=None):
+        """获取提供商的传输，首次使用时创建
+
+        Args:
+            provider_id: 提供商ID
+            options: 提供商配置中的 "transport" 字段
+
+        Returns:
+            ProviderTransport实例
+        """
+        with self._lock:
+            transport = self._transports.get(provider_id)
+            if transport is None:
+                transport = ProviderTransport(provider_id, options)
+                self._transports[provider_id] = transport
+                logger.info(f"已为提供商 {provider_id} 创建HTTP连接池")
+            return transport
+
+    def close(self):
+        """关闭所有提供商的连接池"""
+        with self._lock:
+            transports = list(self._transports.values())
+            self._transports.clear()
+
+        for transport in transports:
+            try:
+                transport.close()
+            except Exception as e:
+                logger.error(f"关闭提供商 {transport.provider_id} 的连接池出错: {str(e)}")
+
+
+# 进程内共享的连接池，所有MessageProcessor线程共用
+_http_pool = HTTPPool()
+
+
+def get_http_pool():
+    """获取进程内共享的HTTP连接池"""
+    return _http_pool
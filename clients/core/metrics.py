@@ -0,0 +1,322 @@
+"""
+指标模块 - 进程内的计数器、仪表和直方图，以Prometheus文本格式导出
+
+指标在模块导入时创建一次，热路径上只做一次字典查找和一次加锁的累加：
+
+    LLM_REQUEST_SECONDS.labels(model).observe(elapsed)
+
+已定义的指标：
+    llm_request_duration_seconds{model}        LLM请求耗时直方图
+    llm_request_errors_total{model}            LLM请求失败次数
+    llm_hedges_fired_total{model}              发出的对冲请求数
+    llm_hedges_won_total{model}                对冲请求先于主请求返回的次数
+    tool_call_duration_seconds{server,tool}    工具调用耗时直方图
+    tool_call_errors_total{server,tool}        工具调用失败次数
+    tool_cache_requests_total{server,result}   结果缓存查询次数（result为hit或miss）
+    history_tokens                             每次请求发送的历史token数直方图
+    mcp_server_processes{server}               存活的MCP服务器子进程数（抓取时计算）
+    retries_total{target}                      工具调用和LLM请求的重试次数
+    circuit_breaker_rejections_total{target}   熔断期间被直接拒绝的请求数
+    circuit_breaker_state{target}              熔断器状态（抓取时计算）
+
+设置环境变量 METRICS_PORT（可选 METRICS_HOST，默认127.0.0.1）后，
+入口程序通过 start_metrics_server() 用uvicorn在后台线程中提供 /metrics。
+"""
+
+import bisect
+import logging
+import math
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{_escape(extra[1])}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _CounterValue:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeValue(_CounterValue):
+    __slots__ = ()
+
+    def set(self, value):
+        self.value = value
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一个桶为 +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+
+class Metric:
+    """带标签的指标，labels() 返回对应标签值的子指标"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def _new_value(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """获取标签值对应的子指标，首次使用时创建"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"指标 {self.name} 需要标签 {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_value())
+        return child
+
+    def samples(self):
+        """产出 (名称后缀, 标签值, 额外标签, 数值)"""
+        for values, child in list(self._children.items()):
+            yield "", values, None, child.value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, values, extra, value in self.samples():
+            labels = _format_labels(self.labelnames, values, extra)
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def _new_value(self):
+        return _CounterValue()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def _new_value(self):
+        return _GaugeValue()
+
+    def set(self, value):
+        self.labels().set(value)
+
+
+class CallbackGauge(Metric):
+    """抓取时通过回调计算数值的仪表，回调返回 {标签值元组: 数值}"""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames, callback):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def samples(self):
+        try:
+            values = self.callback()
+        except Exception as e:
+            logger.warning(f"计算指标 {self.name} 出错: {str(e)}")
+            return
+        for labels, value in values.items():
+            yield "", labels, None, value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_value(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def samples(self):
+        for values, child in list(self._children.items()):
+            with child._lock:
+                counts = list(child.counts)
+                total, count = child.sum, child.count
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                yield "_bucket", values, ("le", _format_value(float(bound))), cumulative
+            yield "_sum", values, None, total
+            yield "_count", values, None, count
+
+
+class MetricsRegistry:
+    """按名称管理指标，同名指标只创建一次"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, name, factory):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = factory()
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(name, lambda: Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(name, lambda: Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(name, lambda: Histogram(name, documentation, labelnames, buckets))
+
+    def gauge_callback(self, name, documentation, labelnames, callback):
+        return self._register(name, lambda: CallbackGauge(name, documentation, labelnames, callback))
+
+    def render(self):
+        """以Prometheus文本格式输出所有指标"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# 进程内共享的指标注册表
+_registry = MetricsRegistry()
+
+
+def get_metrics():
+    """获取进程内共享的指标注册表"""
+    return _registry
+
+
+LLM_REQUEST_SECONDS = _registry.histogram(
+    "llm_request_duration_seconds", "LLM请求耗时（秒）", ("model",)
+)
+LLM_REQUEST_ERRORS = _registry.counter(
+    "llm_request_errors_total", "LLM请求失败次数", ("model",)
+)
+LLM_HEDGES_FIRED = _registry.counter(
+    "llm_hedges_fired_total", "发出的对冲请求数", ("model",)
+)
+LLM_HEDGES_WON = _registry.counter(
+    "llm_hedges_won_total", "对冲请求先于主请求返回的次数", ("model",)
+)
+TOOL_CALL_SECONDS = _registry.histogram(
+    "tool_call_duration_seconds", "工具调用耗时（秒）", ("server", "tool")
+)
+TOOL_CALL_ERRORS = _registry.counter(
+    "tool_call_errors_total", "工具调用失败次数（含返回isError的结果）", ("server", "tool")
+)
+TOOL_CACHE_REQUESTS = _registry.counter(
+    "tool_cache_requests_total", "工具结果缓存查询次数", ("server", "result")
+)
+LLM_CACHE_REQUESTS = _registry.counter(
+    "llm_cache_requests_total", "LLM响应缓存查询次数（hit/miss/bypass）", ("model", "result")
+)
+RETRIES = _registry.counter(
+    "retries_total", "工具调用和LLM请求的重试次数", ("target",)
+)
+CIRCUIT_REJECTIONS = _registry.counter(
+    "circuit_breaker_rejections_total", "熔断期间被直接拒绝的请求数", ("target",)
+)
+HISTORY_TOKENS = _registry.histogram(
+    "history_tokens", "每次LLM请求发送的历史token数（估计值）", buckets=TOKEN_BUCKETS
+)
+
+
+async def metrics_app(scope, receive, send):
+    """只提供 GET /metrics 的ASGI应用"""
+    if scope["type"] != "http":
+        return
+    if scope["path"] != "/metrics":
+        await send({"type": "http.response.start", "status": 404,
+                    "headers": [(b"content-type", b"text/plain")]})
+        await send({"type": "http.response.body", "body": b"not found"})
+        return
+
+    body = _registry.render().encode("utf-8")
+    await send({"type": "http.response.start", "status": 200,
+                "headers": [(b"content-type", CONTENT_TYPE.encode("ascii")),
+                            (b"content-length", str(len(body)).encode("ascii"))]})
+    await send({"type": "http.response.body", "body": body})
+
+
+def start_metrics_server(port=None, host=None):
+    """在后台线程中用uvicorn提供 /metrics
+
+    Args:
+        port: 监听端口；未提供时读取环境变量 METRICS_PORT，都没有时不启动
+        host: 监听地址；未提供时读取 METRICS_HOST，默认127.0.0.1
+
+    Returns:
+        uvicorn.Server实例；未启动时返回None
+    """
+    port = port or os.getenv("METRICS_PORT")
+    if not port:
+        return None
+    host = host or os.getenv("METRICS_HOST", "127.0.0.1")
+
+    import uvicorn
+
+    config = uvicorn.Config(metrics_app, host=host, port=int(port), log_level="warning",
+                            lifespan="off")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, name="metrics-server", daemon=True)
+    thread.start()
+    logger.info(f"指标服务已启动: http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,184 @@
+"""
+服务器副本池模块 - 为同一个MCP服务器维护多个stdio会话
+
+配置 "replicas": N 的服务器启动N个相同的子进程，工具调用分派给当前负载（进行中的调用数）
+最小的健康副本，一个慢工具不再阻塞其他调用。
+副本连续失败达到 max_failures 次后隔离 failure_cooldown 秒，期满后重新参与调度；
+已退出的副本在需要时重新启动。
+副本之间不共享进程内状态，只适用于无状态的服务器（webget在进程内保存已获取的网页，不适合多副本）。
+
+ServerPool 提供与 ServerConnection 相同的接口，CLI和GUI可以直接替换使用。
+"""
+
+import asyncio
+import logging
+import time
+
+from .connection import ServerConnection
+
+logger = logging.getLogger(__name__)
+
+# 未配置时的默认健康检查参数
+DEFAULT_MAX_FAILURES = 3
+DEFAULT_FAILURE_COOLDOWN = 30.0
+
+
+class Replica:
+    """副本及其健康状态"""
+
+    __slots__ = ("index", "connection", "failures", "quarantined_until", "calls")
+
+    def __init__(self, index, connection):
+        self.index = index
+        self.connection = connection
+        self.failures = 0
+        self.quarantined_until = 0.0
+        self.calls = 0
+
+    @property
+    def healthy(self):
+        return self.connection.ready and time.monotonic() >= self.quarantined_until
+
+    def load(self):
+        """调度排序键：进行中的调用少者优先，其次优先已启动的子进程，再次优先最久未使用的"""
+        connection = self.connection
+        return (connection.in_flight, connection.session is None, connection.last_used)
+
+
+class ServerPool:
+    """同一个MCP服务器的副本池"""
+
+    def __init__(self, name, config, on_tools_changed=None):
+        self.name = name
+        self.config = config
+        self.on_tools_changed = on_tools_changed
+        self.max_failures = config.get("max_failures", DEFAULT_MAX_FAILURES)
+        self.failure_cooldown = config.get("failure_cooldown", DEFAULT_FAILURE_COOLDOWN)
+
+        count = max(1, int(config.get("replicas", 1)))
+        self.replicas = [
+            Replica(index, ServerConnection(name, config, on_tools_changed=self._on_replica_tools_changed))
+            for index in range(count)
+        ]
+
+    @property
+    def ready(self):
+        return any(replica.connection.ready for replica in self.replicas)
+
+    @property
+    def session(self):
+        """第一个已启动子进程的副本会话，没有时为None"""
+        for replica in self.replicas:
+            if replica.connection.session is not None:
+                return replica.connection.session
+        return None
+
+    @property
+    def tools_version(self):
+        return sum(replica.connection.tools_version for replica in self.replicas)
+
+    @property
+    def in_flight(self):
+        return sum(replica.connection.in_flight for replica in self.replicas)
+
+    async def start(self):
+        """并发启动所有副本，至少一个副本就绪即视为启动成功"""
+        results = await asyncio.gather(
+            *(replica.connection.start() for replica in self.replicas),
+            return_exceptions=True,
+        )
+
+        errors = []
+        for replica, result in zip(self.replicas, results):
+            if isinstance(result, BaseException):
+                errors.append(result)
+                self._record_failure(replica, result, quarantine=True)
+
+        if len(errors) == len(self.replicas):
+            raise errors[0]
+        if len(self.replicas) > 1:
+            logger.info(
+                f"服务器 {self.name} 已启动 {len(self.replicas) - len(errors)}/{len(self.replicas)} 个副本"
+            )
+        return self.session
+
+    def _on_replica_tools_changed(self, connection):
+        if self.on_tools_changed:
+            self.on_tools_changed(self)
+
+    def invalidate_tools(self):
+        for replica in self.replicas:
+            replica.connection.invalidate_tools()
+
+    async def list_tools(self):
+        """从一个可用副本获取工具列表（所有副本提供相同的工具）"""
+        replica = await self._pick()
+        return await replica.connection.list_tools()
+
+    async def call_tool(self, tool_name, arguments):
+        """将工具调用分派给负载最小的健康副本"""
+        replica = await self._pick()
+        replica.calls += 1
+        try:
+            result = await replica.connection.call_tool(tool_name, arguments)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._record_failure(replica, e)
+            raise
+        replica.failures = 0
+        return result
+
+    async def _pick(self):
+        """选择负载最小的健康副本，必要时重新启动已退出的副本"""
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if healthy:
+            return min(healthy, key=Replica.load)
+
+        now = time.monotonic()
+        for replica in self.replicas:
+            if replica.connection.ready or now < replica.quarantined_until:
+                continue
+            try:
+                logger.info(f"服务器 {self.name} 重新启动副本 {replica.index}")
+                await replica.connection.start()
+            except Exception as e:
+                self._record_failure(replica, e, quarantine=True)
+                continue
+            replica.failures = 0
+            return replica
+
+        # 所有副本都被隔离时仍使用可用的副本，而不是直接拒绝调用
+        available = [replica for replica in self.replicas if replica.connection.ready]
+        if available:
+            return min(available, key=Replica.load)
+        raise RuntimeError(f"服务器 {self.name} 没有可用的副本")
+
+    def _record_failure(self, replica, error, quarantine=False):
+        replica.failures += 1
+        if quarantine or replica.failures >= self.max_failures:
+            replica.quarantined_until = time.monotonic() + self.failure_cooldown
+            logger.warning(
+                f"服务器 {self.name} 的副本 {replica.index} 连续失败 {replica.failures} 次，"
+                f"隔离 {self.failure_cooldown} 秒: {str(error)}"
+            )
+
+    def stats(self):
+        """每个副本的负载与健康状态"""
+        return [
+            {
+                "replica": replica.index,
+                "ready": replica.connection.ready,
+                "healthy": replica.healthy,
+                "in_flight": replica.connection.in_flight,
+                "calls": replica.calls,
+                "failures": replica.failures,
+            }
+            for replica in self.replicas
+        ]
+
+    async def close(self, timeout=5.0):
+        await asyncio.gather(
+            *(replica.connection.close(timeout) for replica in self.replicas),
+            return_exceptions=True,
+        )
@@ -0,0 +1,219 @@
+"""
+系统提示模块 - 构建告知LLM可用工具和调用格式的系统提示
+
+CLI（test_main.py）和GUI（ChatPanel）共用同一份提示文本和工具格式化代码。
+PromptBuilder 按工具目录的指纹缓存构建结果，目录不变时直接复用。
+
+工具描述有两种格式：
+    text     每个工具多行的自由文本（原有格式）
+    compact  每个工具一到两行，参数写成 名称[*] 类型[=默认值] 说明，
+             并去掉描述中与参数重复的 Args/Returns 段落，token更少
+
+提供商支持原生函数调用时，工具定义通过请求参数发送，系统提示中不再列出工具和JSON格式说明。
+"""
+
+import hashlib
+import json
+import logging
+import re
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+PROMPT_STYLE_TEXT = "text"
+PROMPT_STYLE_COMPACT = "compact"
+
+_SECTION_RE = re.compile(r"^(Args|Arguments|Parameters|Returns|Raises|Yields|Examples?)\s*:\s*$")
+_PARAM_RE = re.compile(r"^(\w+)\s*(?:\([^)]*\))?\s*:\s*(.*)$")
+
+
+def format_tool_text(tool):
+    """以多行自由文本格式化工具信息"""
+    args_desc = []
+    if "properties" in tool.input_schema:
+        for param_name, param_info in tool.input_schema["properties"].items():
+            arg_desc = (
+                f"- {param_name}: {param_info.get('description', 'No description')}"
+            )
+            if param_name in tool.input_schema.get("required", []):
+                arg_desc += " (required)"
+            args_desc.append(arg_desc)
+
+    return f"""
+Tool: {tool.name}
+Description: {tool.description}
+Arguments:
+{chr(10).join(args_desc)}
+"""
+
+
+def split_description(description):
+    """把docstring风格的工具描述拆分为摘要和参数说明
+
+    Returns:
+        (摘要文本, {参数名: 说明})
+    """
+    summary = []
+    params = {}
+    section = None
+    current = None
+    for raw in (description or "").splitlines():
+        line = raw.strip()
+        match = _SECTION_RE.match(line)
+        if match:
+            section = match.group(1)
+            current = None
+            continue
+        if not line:
+            continue
+        if section is None:
+            summary.append(line)
+        elif section in ("Args", "Arguments", "Parameters"):
+            match = _PARAM_RE.match(line)
+            if match:
+                current = match.group(1)
+                params[current] = match.group(2)
+            elif current:
+                params[current] += " " + line
+    return " ".join(summary), params
+
+
+def format_tool_compact(tool):
+    """以紧凑格式化工具信息"""
+    summary, documented = split_description(tool.description)
+    schema = tool.input_schema or {}
+    required = set(schema.get("required", []))
+
+    args = []
+    for param_name, param_info in schema.get("properties", {}).items():
+        arg = param_name + ("*" if param_name in required else "")
+        if param_info.get("type"):
+            arg += f" {param_info['type']}"
+        if "default" in param_info:
+            arg += f"={json.dumps(param_info['default'], ensure_ascii=False)}"
+        if "enum" in param_info:
+            arg += " {" + "|".join(str(value) for value in param_info["enum"]) + "}"
+        desc = param_info.get("description") or documented.get(param_name)
+        if desc:
+            arg += f" {desc}"
+        args.append(arg)
+
+    line = f"- {tool.name}: {summary}"
+    if args:
+        line += "\n  args: " + " | ".join(args)
+    return line
+
+
+def format_tools(tools, style=PROMPT_STYLE_TEXT):
+    """按指定格式格式化工具列表"""
+    if style == PROMPT_STYLE_COMPACT:
+        return "\n".join(format_tool_compact(tool) for tool in tools)
+    return "\n".join(format_tool_text(tool) for tool in tools)
+
+
+def catalog_fingerprint(tools):
+    """计算工具目录的指纹，工具名称、描述或参数变化时指纹随之变化"""
+    digest = hashlib.sha1()
+    for tool in tools:
+        digest.update(tool.name.encode("utf-8"))
+        digest.update((tool.description or "").encode("utf-8"))
+        digest.update(json.dumps(tool.input_schema, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+_AFTER_TOOLS = (
+    "After receiving the tools' responses:\n"
+    "1. Transform the raw data into a natural, conversational response\n"
+    "2. Keep responses concise but informative\n"
+    "3. Focus on the most relevant information\n"
+    "4. Use appropriate context from the user's question\n"
+    "5. Avoid simply repeating the raw data\n\n"
+)
+
+
+def build_native_system_prompt():
+    """构建原生函数调用模式下的系统提示，工具定义由请求参数提供"""
+    return (
+        "You are a helpful assistant with access to the provided tools. "
+        "Call a tool when it is needed to answer the user's question; "
+        "several independent tools may be called at once. "
+        "If no tool is needed, reply directly.\n\n"
+        f"{_AFTER_TOOLS}"
+        "Please use only the provided tools."
+    )
+
+
+_NATIVE_SYSTEM_PROMPT = build_native_system_prompt()
+
+
+def build_system_prompt(tools_description, style=PROMPT_STYLE_TEXT):
+    """根据格式化好的工具描述构建系统提示"""
+    notation = (
+        "Each tool is listed as '- name: description', followed by its arguments "
+        "as 'name type=default description'; arguments marked * are required.\n\n"
+        if style == PROMPT_STYLE_COMPACT
+        else ""
+    )
+    return (
+        "You are a helpful assistant with access to these tools:\n\n"
+        f"{notation}"
+        f"{tools_description}\n"
+        "Choose the appropriate tool based on the user's question. "
+        "If no tool is needed, reply directly.\n\n"
+        "IMPORTANT: When you need to use a tool, you must ONLY respond with "
+        "the exact JSON object format below, nothing else:\n"
+        "{\n"
+        '    "tool": "tool-name",\n'
+        '    "arguments": {\n'
+        '        "argument-name": "value"\n'
+        "    }\n"
+        "}\n\n"
+        "When several independent tool calls are needed (for example fetching "
+        "multiple pages), respond ONLY with a JSON array of such objects instead; "
+        "they will be executed in parallel:\n"
+        "[\n"
+        '    {"tool": "tool-name", "arguments": {"argument-name": "value"}},\n'
+        '    {"tool": "other-tool-name", "arguments": {"argument-name": "value"}}\n'
+        "]\n\n"
+        f"{_AFTER_TOOLS}"
+        "Please use only the tools that are explicitly defined above."
+    )
+
+
+class PromptBuilder:
+    """按工具目录指纹缓存的系统提示构建器
+
+    保留最近几个不同目录（如按相关性选出的子集和完整目录）的构建结果。
+    """
+
+    def __init__(self, style=PROMPT_STYLE_TEXT, max_entries=8):
+        self.style = style
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+
+    def build(self, tools, version=None, style=None, native=False):
+        """构建系统提示，目录和格式都未变化时返回缓存的结果
+
+        Args:
+            tools: Tool列表
+            version: 可选，ToolRegistry.version（或包含它的元组）；提供时以它代替逐个工具计算指纹
+            style: 可选，覆盖构建器的默认格式
+            native: 工具通过原生函数调用提供时为True，提示中不列出工具
+        """
+        if native:
+            return _NATIVE_SYSTEM_PROMPT
+
+        style = style or self.style
+        fingerprint = version if version is not None else catalog_fingerprint(tools)
+        key = (style, fingerprint)
+        prompt = self._cache.get(key)
+        if prompt is not None:
+            self._cache.move_to_end(key)
+            return prompt
+
+        prompt = build_system_prompt(format_tools(tools, style), style)
+        self._cache[key] = prompt
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        logger.debug(f"已重建系统提示: {len(tools)} 个工具, 格式 {style}, {len(prompt)} 个字符")
+        return prompt
@@ -0,0 +1,314 @@
+"""
+容错模块 - 为工具调用和LLM请求提供指数退避重试、重试预算和熔断
+
+每个依赖（MCP服务器、LLM提供商）对应一个进程内共享的 Resilience 实例，按名称获取：
+
+    resilience = get_resilience("server:webget", config.get("resilience"))
+    result = await resilience.call_async(connection.call_tool, tool_name, arguments)
+
+- 只重试可能自行恢复的错误：连接/超时错误、408/425/429/5xx 状态码、MCP请求超时；
+  参数错误、4xx 等确定性错误立即失败。
+- 重试间隔为带完全抖动（full jitter）的指数退避，429/503 响应的 Retry-After 会被遵守，
+  所有重试的总耗时不超过 max_elapsed，故障期间的尾延迟有上界。
+- 重试预算（令牌桶）：每个请求存入 retry_ratio 个令牌，每次重试取出一个，令牌不足时不再重试，
+  重试最多占请求数的 retry_ratio（外加 budget_tokens 的突发），依赖整体故障时不会因重试放大流量。
+- 熔断器连续 failure_threshold 次可重试错误后断开，reset_timeout 秒内直接抛出 CircuitOpenError；
+  之后放行一个探测请求，成功则恢复，失败则继续断开。
+
+在servers_config.json的服务器配置或models_config.json的提供商配置中覆盖默认参数：
+
+    "resilience": {"attempts": 3, "base_delay": 0.2, "max_delay": 2.0, "max_elapsed": 10.0,
+                   "failure_threshold": 5, "reset_timeout": 30.0}
+"""
+
+import asyncio
+import email.utils
+import logging
+import random
+import threading
+import time
+
+import anyio
+import httpx
+from mcp.shared.exceptions import McpError
+
+from .metrics import CIRCUIT_REJECTIONS, RETRIES, get_metrics
+from .tracing import current_span
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OPTIONS = {
+    "attempts": 3,  # 包括第一次请求在内的最大尝试次数
+    "base_delay": 0.2,
+    "max_delay": 2.0,
+    "max_elapsed": 10.0,
+    "failure_threshold": 5,
+    "reset_timeout": 30.0,
+    "budget_tokens": 10,
+    "retry_ratio": 0.2,
+}
+
+RETRYABLE_STATUS_CODES = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(RuntimeError):
+    """依赖处于熔断状态，请求未发出"""
+
+    def __init__(self, name, retry_in):
+        super().__init__(f"{name} 暂时不可用（熔断中，{retry_in:.0f} 秒后重试）")
+        self.name = name
+        self.retry_in = retry_in
+
+
+def is_retryable(error):
+    """判断错误是否值得重试（可能是暂时性的）"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRYABLE_STATUS_CODES
+    if isinstance(error, McpError):
+        return error.error.code == httpx.codes.REQUEST_TIMEOUT
+    if isinstance(error, (FileNotFoundError, PermissionError)):
+        return False
+    return isinstance(error, (
+        httpx.TransportError,
+        TimeoutError,
+        ConnectionError,
+        OSError,
+        anyio.ClosedResourceError,
+        anyio.BrokenResourceError,
+        anyio.EndOfStream,
+    ))
+
+
+def retry_safe(annotations):
+    """工具是否可以安全重试：注解表明既非只读也非幂等时，重试可能重复产生副作用"""
+    if not annotations:
+        return True
+    return bool(annotations.get("readOnlyHint") or annotations.get("idempotentHint"))
+
+
+def retry_after(error):
+    """读取429/503响应的Retry-After（秒），没有时返回None"""
+    if not isinstance(error, httpx.HTTPStatusError):
+        return None
+    value = error.response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryBudget:
+    """令牌桶重试预算，限制重试占请求数的比例"""
+
+    def __init__(self, max_tokens=10, retry_ratio=0.2):
+        self.max_tokens = float(max_tokens)
+        self.retry_ratio = retry_ratio
+        self.tokens = self.max_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        """每个请求调用一次"""
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.retry_ratio)
+
+    def withdraw(self):
+        """取出一次重试的令牌，预算不足时返回False"""
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class CircuitBreaker:
+    """连续失败计数的熔断器，线程安全"""
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """请求前调用，熔断中时抛出 CircuitOpenError"""
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            elapsed = time.monotonic() - self.opened_at
+            if self.state == OPEN and elapsed >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True  # 只放行一个探测请求
+                return
+            retry_in = max(0.0, self.reset_timeout - elapsed)
+        CIRCUIT_REJECTIONS.labels(self.name).inc()
+        raise CircuitOpenError(self.name, retry_in)
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info(f"{self.name} 已恢复，关闭熔断")
+            self.state = CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    logger.warning(
+                        f"{self.name} 连续失败 {self.failures} 次，熔断 {self.reset_timeout} 秒"
+                    )
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self._probing = False
+
+    def release(self):
+        """请求以不计入熔断的结果结束（如参数错误）时释放探测名额"""
+        with self._lock:
+            self._probing = False
+
+
+class Resilience:
+    """单个依赖的重试策略、重试预算和熔断器"""
+
+    def __init__(self, name, options=None):
+        self.name = name
+        self.options = {**DEFAULT_OPTIONS, **(options or {})}
+        self.attempts = max(1, int(self.options["attempts"]))
+        self.base_delay = self.options["base_delay"]
+        self.max_delay = self.options["max_delay"]
+        self.max_elapsed = self.options["max_elapsed"]
+        self.budget = RetryBudget(self.options["budget_tokens"], self.options["retry_ratio"])
+        self.breaker = CircuitBreaker(
+            name, self.options["failure_threshold"], self.options["reset_timeout"]
+        )
+
+    def backoff(self, attempt, error=None):
+        """第attempt次重试前的等待时间：完全抖动的指数退避，不短于Retry-After"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        hint = retry_after(error)
+        if hint is not None:
+            delay = max(delay, min(hint, self.max_delay))
+        return delay
+
+    def _on_error(self, error, attempt, start, attempts):
+        """记录失败并决定是否重试
+
+        Returns:
+            重试前的等待秒数；不再重试时返回None
+        """
+        if not is_retryable(error):
+            self.breaker.release()
+            return None
+
+        self.breaker.record_failure()
+        if attempt + 1 >= attempts or self.breaker.state == OPEN:
+            return None
+
+        delay = self.backoff(attempt, error)
+        if time.monotonic() - start + delay > self.max_elapsed or not self.budget.withdraw():
+            return None
+        RETRIES.labels(self.name).inc()
+        logger.warning(
+            f"{self.name} 请求失败: {str(error) or type(error).__name__}，"
+            f"{delay:.2f} 秒后第 {attempt + 1} 次重试"
+        )
+        return delay
+
+    def call(self, func, *args, attempts=None, **kwargs):
+        """同步调用func，按策略重试
+
+        Args:
+            attempts: 可选，覆盖本次调用的最大尝试次数（如非幂等工具只尝试一次）
+
+        Raises:
+            CircuitOpenError: 依赖处于熔断状态
+            Exception: 最后一次尝试的错误
+        """
+        attempts = attempts or self.attempts
+        self.budget.deposit()
+        start = time.monotonic()
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                delay = self._on_error(e, attempt, start, attempts)
+                if delay is None:
+                    current_span().set_attribute("retries", attempt)
+                    raise
+                attempt += 1
+                time.sleep(delay)
+                continue
+            self.breaker.record_success()
+            current_span().set_attribute("retries", attempt)
+            return result
+
+    async def call_async(self, func, *args, attempts=None, **kwargs):
+        """异步调用协程函数func，按策略重试，参数同 call()"""
+        attempts = attempts or self.attempts
+        self.budget.deposit()
+        start = time.monotonic()
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            try:
+                result = await func(*args, **kwargs)
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+            except Exception as e:
+                delay = self._on_error(e, attempt, start, attempts)
+                if delay is None:
+                    current_span().set_attribute("retries", attempt)
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            self.breaker.record_success()
+            current_span().set_attribute("retries", attempt)
+            return result
+
+
+# 进程内共享，同一依赖的CLI、GUI和服务端调用共用一个熔断器
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def get_resilience(name, options=None):
+    """获取依赖的共享容错实例，首次获取时按options创建"""
+    with _instances_lock:
+        instance = _instances.get(name)
+        if instance is None:
+            instance = _instances[name] = Resilience(name, options)
+        return instance
+
+
+def _breaker_states():
+    with _instances_lock:
+        instances = list(_instances.values())
+    return {(instance.name,): _STATE_VALUES[instance.breaker.state] for instance in instances}
+
+
+get_metrics().gauge_callback(
+    "circuit_breaker_state", "熔断器状态（0为关闭，1为半开，2为断开）", ("target",), _breaker_states
+)
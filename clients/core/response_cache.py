@@ -0,0 +1,222 @@
+"""
+LLM响应缓存模块 - 在本地SQLite文件中持久化缓存LLM响应
+
+回放、评估和重复提问时，模型、参数和消息完全相同的请求直接返回缓存的响应，不再请求提供商。
+缓存键为 模型ID + 请求参数（含原生工具定义）+ 规范化消息列表 的SHA-256，
+规范化时按键排序、去掉值为null的字段并使用紧凑JSON，字段顺序不同的相同消息得到相同的键。
+
+默认只缓存确定性请求：temperature大于0（或未设置，按提供商默认值视为采样）时跳过缓存，
+设置 cache_sampled 后才缓存采样请求。缓存总大小超过 max_bytes 时按最近访问时间（LRU）淘汰，
+ttl 大于0时过期的条目不再命中。错误响应不缓存。
+
+在models_config.json中启用（默认关闭）：
+
+    "response_cache": {"enabled": true, "path": "llm_cache.sqlite3", "max_bytes": 67108864,
+                       "ttl": 0, "cache_sampled": false}
+
+命中、未命中和跳过次数记录在 llm_cache_requests_total 中。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from .metrics import LLM_CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OPTIONS = {
+    "enabled": False,
+    "path": "llm_cache.sqlite3",
+    "max_bytes": 64 * 1024 * 1024,
+    "ttl": 0,  # 秒，0表示不过期
+    "cache_sampled": False,
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    response TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed);
+"""
+
+
+def canonical_messages(messages):
+    """将消息列表序列化为规范JSON"""
+    cleaned = [
+        {name: value for name, value in message.items() if value is not None}
+        for message in messages
+    ]
+    return json.dumps(cleaned, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def cache_key(model, parameters, messages):
+    """计算请求的缓存键"""
+    digest = hashlib.sha256()
+    digest.update(model.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(json.dumps(
+        parameters or {}, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str
+    ).encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(canonical_messages(messages).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """SQLite持久化的LLM响应缓存，可被多个线程共享"""
+
+    def __init__(self, path, max_bytes=DEFAULT_OPTIONS["max_bytes"], ttl=0, cache_sampled=False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.cache_sampled = cache_sampled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # GUI的多个工作线程共用一个连接，访问由 _lock 串行化
+        self._db = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        logger.info(f"LLM响应缓存已打开: {path}（{self._bytes} 字节）")
+
+    @classmethod
+    def from_config(cls, config=None):
+        """按models_config.json中的 "response_cache" 配置创建，未启用时返回None"""
+        options = {**DEFAULT_OPTIONS, **(config or {})}
+        if not options["enabled"]:
+            return None
+        return cls(options["path"], options["max_bytes"], options["ttl"], options["cache_sampled"])
+
+    def cacheable(self, parameters):
+        """请求是否可以使用缓存：采样请求只有在设置 cache_sampled 后才缓存"""
+        if self.cache_sampled:
+            return True
+        temperature = (parameters or {}).get("temperature")
+        return temperature is not None and temperature <= 0
+
+    def lookup(self, model, parameters, messages):
+        """查找缓存的响应
+
+        Returns:
+            (缓存键, 响应文本) 元组；请求不可缓存时缓存键为None，未命中时响应文本为None
+        """
+        if not self.cacheable(parameters):
+            LLM_CACHE_REQUESTS.labels(model, "bypass").inc()
+            return None, None
+
+        key = cache_key(model, parameters, messages)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT response, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.ttl and row[1] + self.ttl <= now:
+                self._delete([key])
+                row = None
+            if row is not None:
+                self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if row is None:
+            LLM_CACHE_REQUESTS.labels(model, "miss").inc()
+            logger.debug(f"LLM响应缓存未命中: {model} ({self._counters()})")
+            return key, None
+        LLM_CACHE_REQUESTS.labels(model, "hit").inc()
+        logger.info(f"LLM响应缓存命中: {model} ({self._counters()})")
+        return key, row[0]
+
+    def store(self, key, model, response):
+        """保存响应，超过 max_bytes 时淘汰最久未访问的条目"""
+        if key is None or not response or not isinstance(response, str):
+            return
+        size = len(response.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            old = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, size, now, now),
+            )
+            self._bytes += size - (old[0] if old else 0)
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """按LRU淘汰到 max_bytes 以内，调用方持有 _lock"""
+        # 其他进程可能同时写入同一文件，淘汰前按实际大小重新计算
+        self._bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        excess = self._bytes - self.max_bytes
+        if excess <= 0:
+            return
+        victims = []
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY accessed"):
+            victims.append(key)
+            excess -= size
+            if excess <= 0:
+                break
+        self._delete(victims)
+        logger.debug(f"LLM响应缓存淘汰 {len(victims)} 条，剩余 {self._bytes} 字节")
+
+    def _delete(self, keys):
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            freed = self._db.execute(
+                f"SELECT COALESCE(SUM(size), 0) FROM responses WHERE key IN ({placeholders})", batch
+            ).fetchone()[0]
+            self._db.execute(f"DELETE FROM responses WHERE key IN ({placeholders})", batch)
+            self._bytes -= freed
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._bytes = 0
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _counters(self):
+        return f"命中 {self.hits} / 未命中 {self.misses}"
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+# 进程内按文件共享，同一文件只打开一个连接
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_response_cache(config=None):
+    """按 "response_cache" 配置获取共享的响应缓存，未启用时返回None"""
+    options = {**DEFAULT_OPTIONS, **(config or {})}
+    if not options["enabled"]:
+        return None
+    path = os.path.abspath(options["path"])
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            cache = _caches[path] = ResponseCache.from_config(options)
+        return cache
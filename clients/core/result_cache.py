@@ -0,0 +1,112 @@
+"""
+工具结果缓存模块 - 缓存相同参数的工具调用结果
+
+缓存键为 工具名 + 规范化（键排序、紧凑）的JSON参数，按工具配置TTL，按LRU淘汰。
+在servers_config.json中按服务器配置：
+
+    "cache": {
+        "max_entries": 256,
+        "default_ttl": 0,
+        "tools": {"list_desktop_txt_files": {"ttl": 30}}
+    }
+
+只有 tools 中配置了ttl的工具，或标注为只读（readOnlyHint）且设置了 default_ttl 的工具才会缓存；
+工具注解表明既非只读也非幂等时，即使配置了ttl也不缓存。执行出错的结果不缓存。
+"""
+
+import json
+import logging
+import time
+from collections import OrderedDict
+
+from .metrics import TOOL_CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 256
+
+
+def canonical_arguments(arguments):
+    """将工具参数序列化为规范JSON，参数顺序不同的相同调用得到相同的键"""
+    return json.dumps(
+        arguments or {}, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str
+    )
+
+
+class ToolResultCache:
+    """单个服务器的工具结果缓存"""
+
+    def __init__(self, server, config=None):
+        config = config or {}
+        self.server = server
+        self.max_entries = config.get("max_entries", DEFAULT_MAX_ENTRIES)
+        self.default_ttl = config.get("default_ttl", 0)
+        self.tool_ttls = {
+            name: settings.get("ttl", 0) for name, settings in config.get("tools", {}).items()
+        }
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # (工具名, 规范参数) -> (过期时间, 结果)
+        self._rejected = set()
+
+    def ttl_for(self, tool_name, annotations=None):
+        """获取工具的缓存TTL（秒），0表示不缓存"""
+        annotations = annotations or {}
+        ttl = self.tool_ttls.get(tool_name)
+        if ttl is None:
+            return self.default_ttl if annotations.get("readOnlyHint") else 0
+
+        if annotations and not (annotations.get("readOnlyHint") or annotations.get("idempotentHint")):
+            if tool_name not in self._rejected:
+                self._rejected.add(tool_name)
+                logger.warning(
+                    f"工具 {tool_name} 的注解表明其既非只读也非幂等，忽略服务器 {self.server} 的缓存配置"
+                )
+            return 0
+        return ttl
+
+    def get(self, tool_name, arguments, annotations=None):
+        """查找未过期的缓存结果
+
+        Returns:
+            缓存的结果；工具不可缓存或未命中时返回None
+        """
+        if not self.ttl_for(tool_name, annotations):
+            return None
+
+        key = (tool_name, canonical_arguments(arguments))
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            self.hits += 1
+            TOOL_CACHE_REQUESTS.labels(self.server, "hit").inc()
+            logger.info(f"工具结果缓存命中: {self.server}.{tool_name} ({self._counters()})")
+            return entry[1]
+
+        if entry is not None:
+            del self._entries[key]
+        self.misses += 1
+        TOOL_CACHE_REQUESTS.labels(self.server, "miss").inc()
+        logger.info(f"工具结果缓存未命中: {self.server}.{tool_name} ({self._counters()})")
+        return None
+
+    def put(self, tool_name, arguments, result, annotations=None):
+        """缓存工具结果，执行出错的结果不缓存"""
+        ttl = self.ttl_for(tool_name, annotations)
+        if not ttl or getattr(result, "isError", False):
+            return
+
+        key = (tool_name, canonical_arguments(arguments))
+        self._entries[key] = (time.monotonic() + ttl, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def _counters(self):
+        return f"命中 {self.hits} / 未命中 {self.misses}"
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,63 @@
+"""
+模型路由模块 - 按对话阶段为LLM请求选择模型
+
+一轮工具调用对话包含两次LLM请求：第一次只需要输出一个很小的工具调用JSON（工具选择阶段），
+第二次根据工具结果生成回答（回答阶段）。路由把工具选择阶段发给便宜、低延迟的模型，
+回答阶段仍使用当前选择的（或配置的）较强模型。
+
+普通聊天不经过路由，直接由当前模型回答：对话与最相关工具的BM25得分低于 min_score 时视为普通聊天，
+得分只按有区分度的检索词计算（不含中文单字和英文虚词，见 tool_index.match_terms）。
+工具选择阶段的模型没有调用工具而直接回答时，默认改由回答阶段的模型重新回答，
+保证最终回复始终来自较强的模型。
+
+在models_config.json中配置：
+
+    "routing": {"enabled": true, "tool_selection": "qwen-turbo", "answer": null, "reanswer": true,
+                "min_score": 1.0}
+
+answer 为null时使用当前选择的模型。
+"""
+
+import logging
+
+from .tool_index import DEFAULT_MIN_SCORE
+
+logger = logging.getLogger(__name__)
+
+STAGE_TOOL_SELECTION = "tool_selection"
+STAGE_ANSWER = "answer"
+
+
+class ModelRouter:
+    """按对话阶段选择模型"""
+
+    def __init__(self, config=None):
+        config = config or {}
+        self.models = {
+            STAGE_TOOL_SELECTION: config.get(STAGE_TOOL_SELECTION),
+            STAGE_ANSWER: config.get(STAGE_ANSWER),
+        }
+        self.enabled = bool(config.get("enabled", False) and self.models[STAGE_TOOL_SELECTION])
+        self.reanswer = config.get("reanswer", True)
+        self.min_score = config.get("min_score", DEFAULT_MIN_SCORE)
+
+    def applies(self, tool_selector, tools, query, version=None):
+        """本轮是否经过路由：只有最相关工具的得分达到 min_score 时才是工具轮次
+
+        Args:
+            tool_selector: ToolSelector，用其BM25索引判断相关性
+            tools: 完整的Tool列表
+            query: 最近的对话文本
+            version: 可选，ToolRegistry.version
+        """
+        if not self.enabled or not tools:
+            return False
+        score = tool_selector.relevance(tools, query, version)
+        logger.debug(f"工具相关性得分 {score:.2f}（阈值 {self.min_score}）")
+        return score >= self.min_score
+
+    def model_for(self, stage, default):
+        """阶段使用的模型ID，未配置时返回default"""
+        if not self.enabled:
+            return default
+        return self.models.get(stage) or default
@@ -0,0 +1,279 @@
+"""
+会话存储模块 - 为服务端的每个对话保存独立的消息历史和上下文窗口
+
+服务端所有对话共享同一组MCP服务器和LLM连接，只有 messages 和 ContextWindow 按对话隔离。
+同一对话的请求通过 use() 依次执行，不同对话之间互不等待。
+
+配置了 spill_dir 时，空闲超过 idle_timeout 的对话（以及超过 max_sessions 时最久未使用的对话）
+被换出到磁盘，每个对话一个JSON文件，内存中不保留任何条目；下次访问时再从文件恢复。
+因此一个进程可以同时保持成千上万个打开的对话，内存只与活跃对话数有关。
+在servers_config.json中配置：
+
+    "sessions": {"idle_timeout": 600, "spill_dir": "sessions", "max_sessions": 1000, "sweep_interval": 60}
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SWEEP_INTERVAL = 60.0
+
+# 会话ID同时用作文件名，只允许安全的字符
+_SESSION_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,128}$")
+
+
+class Conversation:
+    """单个对话的状态"""
+
+    __slots__ = ("session_id", "messages", "context_window", "lock", "users", "created", "last_used")
+
+    def __init__(self, session_id, context_window, messages=None, created=None):
+        self.session_id = session_id
+        # 第一条始终是系统消息，每轮开始时按当前工具目录重建
+        self.messages = messages or [{"role": "system", "content": ""}]
+        self.context_window = context_window
+        self.lock = asyncio.Lock()
+        self.users = 0  # 正在使用该对话的请求数，使用中的对话不会被换出
+        self.created = created or time.time()
+        self.last_used = time.monotonic()
+
+    @property
+    def idle(self):
+        return not self.users and not self.context_window.busy
+
+    def touch(self):
+        self.last_used = time.monotonic()
+
+    def to_dict(self):
+        return {
+            "session_id": self.session_id,
+            "created": self.created,
+            # 系统消息每轮重建，不需要保存
+            "messages": self.messages[1:],
+            "context": self.context_window.state(),
+        }
+
+    def close(self):
+        self.context_window.close()
+
+
+class SessionStore:
+    """按会话ID管理对话，可把空闲对话换出到磁盘
+
+    Args:
+        context_window_factory: 无参调用，为新对话创建ContextWindow
+        max_sessions: 可选，内存中的对话数上限；超过时换出（未配置spill_dir时关闭）最久未使用的空闲对话，
+            刚创建或恢复的对话和使用中的对话不会被换出，其他对话都在使用时可暂时超过上限
+        idle_timeout: 可选，对话空闲多少秒后由 evict_idle() 换出
+        spill_dir: 可选，换出对话的目录；未配置时空闲对话直接关闭
+    """
+
+    def __init__(self, context_window_factory, max_sessions=None, idle_timeout=None, spill_dir=None):
+        self.context_window_factory = context_window_factory
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.spill_dir = spill_dir
+        self._conversations = {}
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, context_window_factory, config=None):
+        """按servers_config.json中的 "sessions" 配置创建"""
+        config = config or {}
+        return cls(
+            context_window_factory,
+            max_sessions=config.get("max_sessions"),
+            idle_timeout=config.get("idle_timeout"),
+            spill_dir=config.get("spill_dir"),
+        )
+
+    @staticmethod
+    def valid_id(session_id):
+        return isinstance(session_id, str) and bool(_SESSION_ID_RE.match(session_id))
+
+    def _spill_path(self, session_id):
+        return os.path.join(self.spill_dir, f"{session_id}.json")
+
+    def _spilled(self, session_id):
+        return bool(self.spill_dir) and os.path.exists(self._spill_path(session_id))
+
+    def create(self, session_id=None):
+        """创建新对话，未指定ID时随机生成
+
+        Raises:
+            ValueError: 会话ID不合法或已存在
+        """
+        session_id = session_id or uuid.uuid4().hex
+        if not self.valid_id(session_id):
+            raise ValueError(f"会话ID不合法: {session_id}")
+        if session_id in self._conversations or self._spilled(session_id):
+            raise ValueError(f"会话已存在: {session_id}")
+
+        conversation = Conversation(session_id, self.context_window_factory())
+        self._conversations[session_id] = conversation
+        self._enforce_limit(keep=session_id)
+        return conversation
+
+    def get(self, session_id):
+        """获取对话，已换出的对话从磁盘恢复；不存在时返回None"""
+        conversation = self._conversations.get(session_id)
+        if conversation is None and self.valid_id(session_id) and self._spilled(session_id):
+            conversation = self._load(session_id)
+        if conversation is not None:
+            conversation.touch()
+        return conversation
+
+    def get_or_create(self, session_id=None):
+        """获取对话，不存在时以该ID创建"""
+        if session_id:
+            conversation = self.get(session_id)
+            if conversation is not None:
+                return conversation
+        return self.create(session_id)
+
+    @asynccontextmanager
+    async def use(self, session_id=None, create=True):
+        """独占使用一个对话，期间它不会被换出，同一对话的其他请求排队等待
+
+        Raises:
+            KeyError: create为False且对话不存在
+        """
+        conversation = self.get_or_create(session_id) if create else self.get(session_id)
+        if conversation is None:
+            raise KeyError(session_id)
+
+        conversation.users += 1
+        try:
+            async with conversation.lock:
+                yield conversation
+        finally:
+            conversation.users -= 1
+            conversation.touch()
+
+    def delete(self, session_id):
+        """删除对话（包括已换出的文件）
+
+        Returns:
+            对话存在时返回True
+        """
+        conversation = self._conversations.pop(session_id, None)
+        if conversation is not None:
+            conversation.close()
+        removed = False
+        if self.valid_id(session_id) and self._spilled(session_id):
+            os.remove(self._spill_path(session_id))
+            removed = True
+        return conversation is not None or removed
+
+    def evict(self, session_id):
+        """把对话换出到磁盘并释放内存；未配置spill_dir时关闭对话"""
+        conversation = self._conversations.pop(session_id, None)
+        if conversation is None:
+            return False
+
+        if self.spill_dir:
+            path = self._spill_path(session_id)
+            temp_path = f"{path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(conversation.to_dict(), f, ensure_ascii=False)
+            os.replace(temp_path, path)
+        conversation.close()
+        return True
+
+    def _load(self, session_id):
+        """从磁盘恢复对话，恢复后删除文件"""
+        path = self._spill_path(session_id)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"恢复会话 {session_id} 失败: {str(e)}")
+            return None
+
+        context_window = self.context_window_factory()
+        context_window.restore(data.get("context") or {})
+        conversation = Conversation(
+            session_id,
+            context_window,
+            [{"role": "system", "content": ""}] + data.get("messages", []),
+            data.get("created"),
+        )
+        self._conversations[session_id] = conversation
+        os.remove(path)
+        self._enforce_limit(keep=session_id)
+        logger.debug(f"已从磁盘恢复会话 {session_id}")
+        return conversation
+
+    def evict_idle(self, now=None):
+        """换出空闲超过 idle_timeout 的对话
+
+        Returns:
+            换出的对话数
+        """
+        if not self.idle_timeout:
+            return 0
+        deadline = (now or time.monotonic()) - self.idle_timeout
+        expired = [
+            session_id
+            for session_id, conversation in self._conversations.items()
+            if conversation.idle and conversation.last_used < deadline
+        ]
+        for session_id in expired:
+            self.evict(session_id)
+        if expired:
+            logger.info(f"已换出 {len(expired)} 个空闲会话，内存中保留 {len(self._conversations)} 个")
+        return len(expired)
+
+    async def sweep(self, interval=DEFAULT_SWEEP_INTERVAL):
+        """定期换出空闲对话，直到任务被取消"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.evict_idle()
+            except Exception as e:
+                logger.error(f"换出空闲会话出错: {str(e)}")
+
+    def _enforce_limit(self, keep=None):
+        if not self.max_sessions:
+            return
+        while len(self._conversations) > self.max_sessions:
+            oldest = min(
+                (c for c in self._conversations.values() if c.idle and c.session_id != keep),
+                key=lambda c: c.last_used,
+                default=None,
+            )
+            if oldest is None:
+                return
+            logger.debug(f"会话数超过上限 {self.max_sessions}，换出最久未使用的会话 {oldest.session_id}")
+            self.evict(oldest.session_id)
+
+    def spilled_count(self):
+        """磁盘上已换出的对话数"""
+        if not self.spill_dir:
+            return 0
+        return sum(1 for entry in os.scandir(self.spill_dir) if entry.name.endswith(".json"))
+
+    def close(self):
+        """关闭所有对话；配置了spill_dir时先保存到磁盘，重启后仍可继续"""
+        for session_id in list(self._conversations):
+            try:
+                self.evict(session_id)
+            except OSError as e:
+                logger.error(f"保存会话 {session_id} 失败: {str(e)}")
+        self._conversations.clear()
+
+    def __contains__(self, session_id):
+        return session_id in self._conversations or (
+            self.valid_id(session_id) and self._spilled(session_id)
+        )
+
+    def __len__(self):
+        return len(self._conversations)
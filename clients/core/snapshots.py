@@ -0,0 +1,89 @@
+"""
+工具目录快照模块 - 持久化服务器的工具列表
+
+延迟启动（lazy）的服务器在未启动子进程时使用快照中的工具目录。
+快照按服务器名称保存，并记录启动配置的指纹，配置变化后旧快照自动失效。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from .tools import Tool
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "tool_snapshots.json")
+
+_lock = threading.Lock()
+
+
+def _fingerprint(config):
+    """计算服务器启动配置的指纹"""
+    launch = {key: config.get(key) for key in ("command", "args", "env")}
+    return hashlib.sha1(json.dumps(launch, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _read_all(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logger.warning(f"读取工具目录快照失败: {str(e)}")
+        return {}
+
+
+def load_snapshot(name, config, path=SNAPSHOT_PATH):
+    """读取服务器的工具目录快照
+
+    Returns:
+        Tool列表；没有快照或启动配置已变化时返回None
+    """
+    with _lock:
+        entry = _read_all(path).get(name)
+
+    if not entry or entry.get("fingerprint") != _fingerprint(config):
+        return None
+
+    return [
+        Tool(
+            tool["name"],
+            tool.get("description"),
+            tool.get("input_schema", {}),
+            name,
+            tool.get("annotations"),
+        )
+        for tool in entry.get("tools", [])
+    ]
+
+
+def save_snapshot(name, config, tools, path=SNAPSHOT_PATH):
+    """保存服务器的工具目录快照"""
+    entry = {
+        "fingerprint": _fingerprint(config),
+        "tools": [
+            {
+                "name": tool.name,
+                "description": tool.description,
+                "input_schema": tool.input_schema,
+                "annotations": tool.annotations,
+            }
+            for tool in tools
+        ],
+    }
+
+    with _lock:
+        snapshots = _read_all(path)
+        if snapshots.get(name) == entry:
+            return
+        snapshots[name] = entry
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(snapshots, f, indent=2, ensure_ascii=False)
+            logger.info(f"已保存服务器 {name} 的工具目录快照: {len(tools)} 个工具")
+        except Exception as e:
+            logger.warning(f"保存工具目录快照失败: {str(e)}")
@@ -0,0 +1,90 @@
+"""
+服务器启动模块 - 并发启动所有MCP服务器，每个服务器有独立的启动期限
+
+启动失败或超时的服务器被标记为降级（degraded），不会影响其他服务器和整个会话。
+CLI（ChatSession.start）和GUI（ServerManager.load_servers）共用这里的启动流程。
+"""
+
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# 未在servers_config.json中配置 startup_timeout 时的默认启动期限（秒）
+DEFAULT_STARTUP_TIMEOUT = 30.0
+
+STATUS_READY = "ready"
+STATUS_DEGRADED = "degraded"
+
+
+class StartupResult:
+    """单个服务器的启动结果"""
+
+    __slots__ = ("name", "status", "elapsed", "error")
+
+    def __init__(self, name, status, elapsed, error=None):
+        self.name = name
+        self.status = status
+        self.elapsed = elapsed
+        self.error = error
+
+    @property
+    def ready(self):
+        return self.status == STATUS_READY
+
+
+async def start_server(connection, default_timeout=DEFAULT_STARTUP_TIMEOUT):
+    """在期限内启动单个服务器
+
+    Args:
+        connection: ServerConnection实例，其配置中的 startup_timeout 优先于默认期限
+        default_timeout: 默认启动期限（秒）
+
+    Returns:
+        StartupResult
+    """
+    timeout = connection.config.get("startup_timeout", default_timeout)
+    start = time.perf_counter()
+    try:
+        await asyncio.wait_for(connection.start(), timeout)
+    except asyncio.TimeoutError:
+        error = f"启动超时（{timeout}秒）"
+    except Exception as e:
+        error = str(e) or type(e).__name__
+    else:
+        return StartupResult(connection.name, STATUS_READY, time.perf_counter() - start)
+
+    logger.error(f"服务器 {connection.name} 启动失败，已降级: {error}")
+    return StartupResult(connection.name, STATUS_DEGRADED, time.perf_counter() - start, error)
+
+
+async def start_servers(connections, default_timeout=DEFAULT_STARTUP_TIMEOUT, on_result=None):
+    """并发启动多个服务器
+
+    Args:
+        connections: ServerConnection列表
+        default_timeout: 默认启动期限（秒）
+        on_result: 每个服务器启动完成（成功或降级）时调用的回调，参数为StartupResult
+
+    Returns:
+        与connections顺序对应的StartupResult列表
+    """
+    async def start_one(connection):
+        result = await start_server(connection, default_timeout)
+        if on_result:
+            on_result(result)
+        return result
+
+    return await asyncio.gather(*(start_one(connection) for connection in connections))
+
+
+def format_startup_report(results):
+    """格式化启动报告，列出每个服务器的状态和就绪用时"""
+    lines = ["服务器启动报告:"]
+    for result in results:
+        line = f"  {result.name:<20} {result.status:<10} {result.elapsed * 1000:>8.0f} ms"
+        if result.error:
+            line += f"  {result.error}"
+        lines.append(line)
+    return "\n".join(lines)
@@ -0,0 +1,134 @@
+"""
+工具调用解析模块 - 从LLM回复中解析工具调用并合并执行结果
+
+LLM可以返回单个 {"tool", "arguments"} 对象，也可以返回由多个这种对象组成的
+JSON数组，数组中的调用相互独立，会被并发执行。
+
+只支持文本的提供商可能把调用JSON包在代码块里或夹在说明文字中，parse_tool_calls 会容忍这些情况；
+支持原生函数调用（function calling）的提供商返回结构化的 tool_calls，
+由 from_native_tool_calls 转换为同样的调用字典，再以 encode_tool_calls 写回对话历史。
+"""
+
+import json
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+_FENCE_RE = re.compile(r"```[a-zA-Z]*\s*(.*?)```", re.DOTALL)
+_JSON_START_RE = re.compile(r"[\[{]")
+_decoder = json.JSONDecoder()
+
+
+def _validate(data):
+    """检查解析结果是否为工具调用，是则返回调用列表"""
+    if isinstance(data, dict):
+        data = [data]
+    if not isinstance(data, list) or not data:
+        return None
+
+    for call in data:
+        if not isinstance(call, dict) or "tool" not in call or "arguments" not in call:
+            return None
+    return data
+
+
+def _loads(text):
+    try:
+        return _validate(json.loads(text))
+    except (json.JSONDecodeError, TypeError):
+        return None
+
+
+def parse_tool_calls(text):
+    """解析LLM回复中的工具调用
+
+    整段回复是调用JSON时直接解析；否则依次尝试代码块中的JSON和夹在文字中的第一个调用JSON。
+
+    Args:
+        text: LLM的回复文本
+
+    Returns:
+        工具调用字典列表；回复不是工具调用时返回None
+    """
+    if not isinstance(text, str):
+        return None
+
+    calls = _loads(text)
+    if calls is not None:
+        return calls
+
+    # 不含调用字段的普通回复无需继续查找
+    if '"tool"' not in text:
+        return None
+
+    for block in _FENCE_RE.findall(text):
+        calls = _loads(block)
+        if calls is not None:
+            return calls
+
+    for match in _JSON_START_RE.finditer(text):
+        try:
+            data, _ = _decoder.raw_decode(text, match.start())
+        except json.JSONDecodeError:
+            continue
+        calls = _validate(data)
+        if calls is not None:
+            return calls
+    return None
+
+
+def tool_specs(tools):
+    """把Tool列表转换为原生函数调用的 tools 参数"""
+    return [
+        {
+            "type": "function",
+            "function": {
+                "name": tool.name,
+                "description": tool.description or "",
+                "parameters": tool.input_schema or {"type": "object", "properties": {}},
+            },
+        }
+        for tool in tools
+    ]
+
+
+def from_native_tool_calls(tool_calls):
+    """把提供商返回的结构化 tool_calls 转换为工具调用字典列表
+
+    Returns:
+        工具调用字典列表；没有调用时返回None
+    """
+    calls = []
+    for tool_call in tool_calls or []:
+        function = tool_call.get("function") or {}
+        name = function.get("name")
+        if not name:
+            continue
+
+        arguments = function.get("arguments") or {}
+        if isinstance(arguments, str):
+            try:
+                arguments = json.loads(arguments) if arguments.strip() else {}
+            except json.JSONDecodeError:
+                logger.warning(f"无法解析工具 {name} 的参数: {arguments}")
+                arguments = {}
+        calls.append({"tool": name, "arguments": arguments})
+    return calls or None
+
+
+def encode_tool_calls(tool_calls):
+    """把工具调用写成与文本协议相同的JSON，作为助手消息保存在对话历史中"""
+    data = tool_calls[0] if len(tool_calls) == 1 else tool_calls
+    return json.dumps(data, ensure_ascii=False)
+
+
+def format_tool_results(tool_calls, results):
+    """将多个工具调用的结果合并为一条消息，供后续的LLM调用使用"""
+    if len(results) == 1:
+        return f"Tool execution result: {results[0]}"
+
+    lines = ["Tool execution results:"]
+    for index, (call, result) in enumerate(zip(tool_calls, results), start=1):
+        lines.append(f"[{index}] {call['tool']}: {result}")
+    return "\n".join(lines)
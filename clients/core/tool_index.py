@@ -0,0 +1,176 @@
+"""
+工具检索模块 - 用BM25从大型工具目录中选出与当前对话相关的工具
+
+索引完全在本地构建，不依赖向量或嵌入服务。每个工具的文档由工具名、描述摘要、
+参数名和参数说明组成；英文按单词切分（含下划线分隔的工具名），中日韩文字按单字和相邻二字切分。
+
+在servers_config.json中配置：
+
+    "tool_selection": {"enabled": true, "top_k": 8, "min_score": 1.0}
+
+工具总数不超过 top_k 时不做筛选，提示中始终包含全部工具。对话与最相关工具的得分低于 min_score
+（没有可靠的相关工具）时同样使用完整目录，不会得到一个空的或只含无关工具的提示。
+"""
+
+import heapq
+import logging
+import math
+import re
+from collections import Counter
+
+from .prompt import split_description
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOP_K = 8
+DEFAULT_MIN_SCORE = 1.0
+
+_WORD_RE = re.compile(r"[a-z0-9]+|[぀-ヿ㐀-鿿豈-﫿]+")
+_CJK_RE = re.compile(r"[぀-ヿ㐀-鿿豈-﫿]")
+
+
+# 判断对话与工具是否相关时忽略的英文虚词；单字检索词（中文单字如"的"、"是"）同样不参与判断
+STOPWORDS = frozenset(
+    "about an and any are as at be but by can could do does for from get have how if in into is it "
+    "its me my no not of on or our please should so than that the their them then there these this "
+    "to was we what when where which who why will with would you your".split()
+)
+
+
+def tokenize(text):
+    """把文本切分为检索词"""
+    tokens = []
+    for word in _WORD_RE.findall((text or "").lower()):
+        if not _CJK_RE.match(word):
+            tokens.append(word)
+            continue
+        tokens.extend(word)
+        tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+def match_terms(text):
+    """判断相关性使用的检索词：去掉单字和英文虚词"""
+    return [term for term in tokenize(text) if len(term) > 1 and term not in STOPWORDS]
+
+
+def tool_document(tool):
+    """组合工具名、描述摘要和参数说明作为检索文档"""
+    summary, documented = split_description(tool.description)
+    parts = [tool.name.replace("_", " "), summary]
+    for param_name, param_info in (tool.input_schema or {}).get("properties", {}).items():
+        parts.append(param_name)
+        parts.append(param_info.get("description") or documented.get(param_name, ""))
+    return " ".join(parts)
+
+
+class ToolIndex:
+    """工具目录上的BM25索引"""
+
+    def __init__(self, tools, k1=1.5, b=0.75):
+        self.tools = list(tools)
+        self.k1 = k1
+        self.b = b
+
+        self._postings = {}  # 检索词 -> [(工具序号, 词频)]
+        self._lengths = []
+        for index, tool in enumerate(self.tools):
+            counts = Counter(tokenize(tool_document(tool)))
+            self._lengths.append(sum(counts.values()))
+            for term, count in counts.items():
+                self._postings.setdefault(term, []).append((index, count))
+
+        total = len(self.tools)
+        self._avg_length = (sum(self._lengths) / total) if total else 0.0
+        # 文档长度归一化项只与文档有关，建索引时算好
+        self._norms = [
+            k1 * (1 - b + b * length / self._avg_length) if self._avg_length else k1
+            for length in self._lengths
+        ]
+        self._idf = {
+            term: math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self._postings.items()
+        }
+
+    def search(self, query, k=DEFAULT_TOP_K):
+        """返回与查询最相关的至多k个工具（得分为0的工具不返回）"""
+        scores = self._scores(set(tokenize(query)))
+        ranked = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [self.tools[index] for index, _ in ranked]
+
+    def best_score(self, query):
+        """只按有区分度的检索词（见 match_terms）计算的最高BM25得分，没有相关工具时为0"""
+        return max(self._scores(set(match_terms(query))).values(), default=0.0)
+
+    def _scores(self, terms):
+        """各工具对检索词集合的BM25得分"""
+        scores = {}
+        for term in terms:
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = self._idf[term] * (self.k1 + 1)
+            norms = self._norms
+            for index, count in postings:
+                scores[index] = scores.get(index, 0.0) + idf * count / (count + norms[index])
+        return scores
+
+
+def recent_query(messages, user_message=None, turns=2):
+    """用当前用户消息和之前最近几轮的用户消息组成检索查询"""
+    parts = [
+        message.get("content") or ""
+        for message in messages
+        if message.get("role") == "user"
+    ][-turns:]
+    if user_message:
+        parts.append(user_message)
+    return "\n".join(parts)
+
+
+class ToolSelector:
+    """按当前对话从工具目录中选择相关工具，目录版本变化时重建索引"""
+
+    def __init__(self, config=None):
+        config = config or {}
+        self.enabled = config.get("enabled", False)
+        self.top_k = config.get("top_k", DEFAULT_TOP_K)
+        self.min_score = config.get("min_score", DEFAULT_MIN_SCORE)
+        self._version = None
+        self._index = None
+
+    def select(self, tools, query, version=None):
+        """选择相关工具
+
+        Args:
+            tools: 完整的Tool列表
+            query: 检索查询文本
+            version: 可选，ToolRegistry.version，相同版本复用已建好的索引
+
+        Returns:
+            (选中的Tool列表, 是否为完整目录)；没有足够相关的工具时返回完整目录
+        """
+        if not self.enabled or len(tools) <= self.top_k:
+            return tools, True
+
+        index = self._index_for(tools, version)
+        selected = index.search(query, self.top_k)
+        if not selected or index.best_score(query) < self.min_score:
+            logger.debug("没有足够相关的工具，使用完整工具目录")
+            return tools, True
+        logger.debug(f"按相关性选择了 {len(selected)}/{len(tools)} 个工具: {[tool.name for tool in selected]}")
+        return selected, False
+
+    def relevance(self, tools, query, version=None):
+        """对话与目录中最相关工具的得分（不论是否启用了筛选），用于区分普通聊天"""
+        if not tools:
+            return 0.0
+        return self._index_for(tools, version).best_score(query)
+
+    def _index_for(self, tools, version):
+        """获取工具目录的索引，目录版本变化时重建"""
+        if self._index is None or version is None or version != self._version:
+            self._index = ToolIndex(tools)
+            self._version = version
+            logger.debug(f"已重建工具检索索引: {len(tools)} 个工具")
+        return self._index
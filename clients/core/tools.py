@@ -0,0 +1,165 @@
+"""
+工具注册表模块 - CLI和GUI共用的工具定义与按名称路由
+
+ToolRegistry 以字典维护 工具名 -> 工具（含所属服务器），路由为O(1)查找；
+服务器的工具列表变化时增量更新，并检测不同服务器之间的重名工具。
+"""
+
+import logging
+import threading
+
+from .prompt import PROMPT_STYLE_TEXT, format_tools
+
+logger = logging.getLogger(__name__)
+
+
+class Tool:
+    """表示MCP工具，使用__slots__以便大型工具目录占用更少内存"""
+
+    __slots__ = ("name", "description", "input_schema", "server", "annotations")
+
+    def __init__(self, name, description, input_schema, server=None, annotations=None):
+        self.name = name
+        self.description = description
+        self.input_schema = input_schema
+        self.server = server
+        self.annotations = annotations  # MCP工具注解（readOnlyHint等），未提供时为None
+
+    @classmethod
+    def from_mcp(cls, tool, server=None):
+        """从mcp.types.Tool创建"""
+        annotations = getattr(tool, "annotations", None)
+        if annotations is not None:
+            annotations = annotations.model_dump(exclude_none=True)
+        return cls(tool.name, tool.description, tool.inputSchema, server, annotations)
+
+    def format_for_llm(self, style=PROMPT_STYLE_TEXT):
+        """格式化工具信息供LLM使用"""
+        return format_tools([self], style)
+
+    def __repr__(self):
+        return f"Tool({self.name!r}, server={self.server!r})"
+
+
+class ToolRegistry:
+    """跨服务器的工具注册表
+
+    重名工具由先注册的服务器拥有，后注册者被记录为候补，
+    拥有者移除该工具后候补自动接替。每次目录发生变化 version 递增。
+    """
+
+    def __init__(self):
+        self._tools = {}  # 工具名 -> Tool（当前拥有者）
+        self._server_tools = {}  # 服务器名 -> {工具名: Tool}
+        self._lock = threading.Lock()
+        self.version = 0
+
+    def update_server(self, server, tools):
+        """用服务器的最新工具列表增量更新注册表
+
+        Args:
+            server: 服务器名称
+            tools: 该服务器当前提供的Tool列表
+
+        Returns:
+            注册表是否发生了变化
+        """
+        new_tools = {}
+        for tool in tools:
+            tool.server = server
+            new_tools[tool.name] = tool
+
+        with self._lock:
+            old_tools = self._server_tools.get(server, {})
+            if not self._differs(old_tools, new_tools):
+                return False
+
+            self._server_tools[server] = new_tools
+
+            for name in old_tools.keys() - new_tools.keys():
+                if self._tools.get(name) is old_tools[name]:
+                    self._release(name)
+
+            for name, tool in new_tools.items():
+                owner = self._tools.get(name)
+                if owner is None or owner.server == server:
+                    self._tools[name] = tool
+                else:
+                    logger.warning(
+                        f"工具名冲突: {name} 同时由 {owner.server} 和 {server} 提供，"
+                        f"使用 {owner.server} 的版本"
+                    )
+
+            self.version += 1
+            return True
+
+    def remove_server(self, server):
+        """移除服务器的所有工具"""
+        with self._lock:
+            old_tools = self._server_tools.pop(server, None)
+            if not old_tools:
+                return
+            for name, tool in old_tools.items():
+                if self._tools.get(name) is tool:
+                    self._release(name)
+            self.version += 1
+
+    def clear(self):
+        """清空注册表"""
+        with self._lock:
+            self._tools.clear()
+            self._server_tools.clear()
+            self.version += 1
+
+    def _release(self, name):
+        """移除工具的当前拥有者，存在候补时由候补接替"""
+        del self._tools[name]
+        for tools in self._server_tools.values():
+            candidate = tools.get(name)
+            if candidate is not None:
+                self._tools[name] = candidate
+                logger.info(f"工具 {name} 改由服务器 {candidate.server} 提供")
+                return
+
+    @staticmethod
+    def _differs(old_tools, new_tools):
+        if old_tools.keys() != new_tools.keys():
+            return True
+        return any(
+            old_tools[name].description != tool.description
+            or old_tools[name].input_schema != tool.input_schema
+            or old_tools[name].annotations != tool.annotations
+            for name, tool in new_tools.items()
+        )
+
+    def get(self, name):
+        """按名称获取工具，不存在时返回None"""
+        return self._tools.get(name)
+
+    def server_for(self, name):
+        """获取提供指定工具的服务器名称，不存在时返回None"""
+        tool = self._tools.get(name)
+        return tool.server if tool is not None else None
+
+    def collisions(self):
+        """获取重名工具及提供它们的服务器列表"""
+        with self._lock:
+            providers = {}
+            for server, tools in self._server_tools.items():
+                for name in tools:
+                    providers.setdefault(name, []).append(server)
+        return {name: servers for name, servers in providers.items() if len(servers) > 1}
+
+    def tools(self):
+        """获取所有可路由的工具"""
+        return list(self._tools.values())
+
+    def tools_for(self, server):
+        """获取指定服务器提供的工具"""
+        return list(self._server_tools.get(server, {}).values())
+
+    def __contains__(self, name):
+        return name in self._tools
+
+    def __len__(self):
+        return len(self._tools)
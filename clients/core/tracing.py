@@ -0,0 +1,373 @@
+"""
+追踪模块 - 记录一轮对话中各阶段（span）的耗时和属性，按trace id关联
+
+一轮用户对话以 chat.turn 为根span，提示构建、LLM请求、工具调用解析、工具执行、
+历史裁剪和界面渲染都是它的子span，属性中记录模型、工具、服务器、请求字节数和重试次数等。
+当前span保存在contextvars中，asyncio任务和 asyncio.to_thread 会自动继承；
+跨线程提交到共享运行时或Qt信号处理时，用 activate(span) 或 parent 参数显式指定父span。
+
+导出通过环境变量（可写在.env中）配置，两者可同时启用：
+
+    TRACE_JSONL                   每个span一行写入本地JSONL文件
+    OTEL_EXPORTER_OTLP_ENDPOINT   以OTLP/HTTP JSON格式发送到收集器的 /v1/traces（如 http://127.0.0.1:4318）
+    OTEL_SERVICE_NAME             上报的服务名，默认 mcp-client
+
+都未配置时追踪关闭，span() 返回空操作对象，几乎没有开销。
+结束的span由后台线程批量导出，不阻塞调用方。
+"""
+
+import contextvars
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SERVICE_NAME = "mcp-client"
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_STOP = object()  # 通知导出线程退出
+
+
+class Span:
+    """一个计时区间，用作上下文管理器时成为当前span"""
+
+    __slots__ = (
+        "tracer", "name", "trace_id", "span_id", "parent_id", "attributes",
+        "start_time", "end_time", "status", "error", "_start", "_tokens",
+    )
+
+    def __init__(self, tracer, name, parent=None, attributes=None):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = attributes or {}
+        self.start_time = time.time_ns()
+        self.end_time = None
+        self.status = "ok"
+        self.error = None
+        self._start = time.perf_counter_ns()
+        self._tokens = []
+
+    @property
+    def duration_ms(self):
+        end = self.end_time if self.end_time is not None else self.start_time + (
+            time.perf_counter_ns() - self._start
+        )
+        return (end - self.start_time) / 1e6
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    def record_error(self, error):
+        """标记span失败并记录错误信息"""
+        self.status = "error"
+        self.error = f"{type(error).__name__}: {error}" if isinstance(error, BaseException) else str(error)
+
+    def end(self):
+        """结束span并交给追踪器导出，重复调用无效"""
+        if self.end_time is not None:
+            return
+        self.end_time = self.start_time + (time.perf_counter_ns() - self._start)
+        self.tracer._finish(self)
+
+    def __enter__(self):
+        self._tokens.append(_current_span.set(self))
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.record_error(exc)
+        _current_span.reset(self._tokens.pop())
+        self.end()
+        return False
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    """追踪关闭时使用的空操作span"""
+
+    __slots__ = ()
+
+    trace_id = None
+    span_id = None
+    duration_ms = 0.0
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_attributes(self, **attributes):
+        pass
+
+    def record_error(self, error):
+        pass
+
+    def end(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class JsonlSpanExporter:
+    """把span逐行追加到本地JSONL文件"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def export(self, spans):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for span in spans:
+                f.write(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n")
+
+    def close(self):
+        pass
+
+
+def _otlp_value(value):
+    """把属性值转换为OTLP AnyValue"""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)}
+
+
+class OtlpSpanExporter:
+    """以OTLP/HTTP JSON格式把span发送到收集器"""
+
+    def __init__(self, endpoint, service_name=DEFAULT_SERVICE_NAME, timeout=5.0):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.service_name = service_name
+        self.client = httpx.Client(timeout=timeout)
+
+    def encode(self, spans):
+        """构造OTLP ExportTraceServiceRequest的JSON表示"""
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [
+                    {"key": "service.name", "value": {"stringValue": self.service_name}},
+                ]},
+                "scopeSpans": [{
+                    "scope": {"name": __name__},
+                    "spans": [self._encode_span(span) for span in spans],
+                }],
+            }]
+        }
+
+    @staticmethod
+    def _encode_span(span):
+        encoded = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(span.start_time),
+            "endTimeUnixNano": str(span.end_time),
+            "attributes": [
+                {"key": key, "value": _otlp_value(value)}
+                for key, value in span.attributes.items()
+                if value is not None
+            ],
+            "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+        }
+        if span.parent_id:
+            encoded["parentSpanId"] = span.parent_id
+        return encoded
+
+    def export(self, spans):
+        response = self.client.post(self.url, json=self.encode(spans))
+        response.raise_for_status()
+
+    def close(self):
+        self.client.close()
+
+
+class Tracer:
+    """创建span并在后台线程中批量导出已结束的span"""
+
+    def __init__(self, exporters=None, batch_size=64, flush_interval=1.0):
+        self.exporters = list(exporters or [])
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.exporters)
+
+    def span(self, name, parent=None, root=False, **attributes):
+        """创建span
+
+        Args:
+            name: span名称
+            parent: 可选，父span；默认为当前上下文中的span
+            root: 为True时开始新的trace，忽略当前span
+            **attributes: span属性
+
+        Returns:
+            Span；追踪关闭时返回空操作span
+        """
+        if not self.exporters:
+            return NOOP_SPAN
+        if root:
+            parent = None
+        elif parent is None:
+            parent = _current_span.get()
+        if parent is NOOP_SPAN:
+            parent = None
+        return Span(self, name, parent, attributes)
+
+    def _finish(self, span):
+        self._queue.put(span)
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="trace-export", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = []
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+
+            stop = False
+            while item is not None:
+                if isinstance(item, threading.Event):
+                    self._export(batch)
+                    batch = []
+                    item.set()
+                elif item is _STOP:
+                    stop = True
+                else:
+                    batch.append(item)
+                if len(batch) >= self.batch_size:
+                    self._export(batch)
+                    batch = []
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    item = None
+
+            self._export(batch)
+            if stop:
+                return
+
+    def _export(self, spans):
+        if not spans:
+            return
+        for exporter in self.exporters:
+            try:
+                exporter.export(spans)
+            except Exception as e:
+                logger.warning(f"导出 {len(spans)} 个span到 {type(exporter).__name__} 失败: {str(e)}")
+
+    def flush(self, timeout=5.0):
+        """等待已结束的span导出完成"""
+        if self._thread is None:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def shutdown(self, timeout=5.0):
+        """导出剩余的span并关闭导出器"""
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+            self._thread = None
+        for exporter in self.exporters:
+            try:
+                exporter.close()
+            except Exception as e:
+                logger.error(f"关闭导出器 {type(exporter).__name__} 出错: {str(e)}")
+
+
+def current_span():
+    """获取当前上下文中的span，没有时返回空操作span"""
+    return _current_span.get() or NOOP_SPAN
+
+
+@contextmanager
+def activate(span):
+    """在当前上下文中把span设为当前span（不结束它），用于跨线程传递父span"""
+    token = _current_span.set(span if isinstance(span, Span) else None)
+    try:
+        yield span
+    finally:
+        _current_span.reset(token)
+
+
+def configure_tracing(jsonl_path=None, otlp_endpoint=None, service_name=None):
+    """按参数（未提供时按环境变量）创建进程内共享的追踪器
+
+    Returns:
+        新的Tracer实例
+    """
+    global _tracer
+    jsonl_path = jsonl_path or os.getenv("TRACE_JSONL")
+    otlp_endpoint = otlp_endpoint or os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT")
+    service_name = service_name or os.getenv("OTEL_SERVICE_NAME") or DEFAULT_SERVICE_NAME
+
+    exporters = []
+    if jsonl_path:
+        exporters.append(JsonlSpanExporter(jsonl_path))
+    if otlp_endpoint:
+        exporters.append(OtlpSpanExporter(otlp_endpoint, service_name))
+
+    with _tracer_lock:
+        previous, _tracer = _tracer, Tracer(exporters)
+    if previous is not None:
+        previous.shutdown()
+    if exporters:
+        logger.info(f"已启用追踪: {[type(exporter).__name__ for exporter in exporters]}")
+    return _tracer
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer():
+    """获取进程内共享的追踪器，首次调用时按环境变量配置"""
+    tracer = _tracer
+    if tracer is None:
+        tracer = configure_tracing()
+    return tracer
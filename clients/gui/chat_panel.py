@@ -9,28 +9,51 @@ import json
 import logging
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QTextEdit, 
                             QLineEdit, QPushButton, QLabel, QProgressBar)
-from PyQt5.QtCore import Qt, pyqtSignal, QThread
+from PyQt5.QtCore import Qt, pyqtSignal, QThread, QTimer
 from PyQt5.QtGui import QFont, QColor
 
+from core.context_window import ContextWindow, make_llm_summarizer
+from core.prompt import PROMPT_STYLE_TEXT, PromptBuilder
+from core.routing import STAGE_ANSWER, STAGE_TOOL_SELECTION
+from core.tool_calls import format_tool_results, parse_tool_calls
+from core.tool_index import ToolSelector, recent_query
+from core.tracing import NOOP_SPAN, activate, get_tracer
+
 logger = logging.getLogger(__name__)
 
+# 流式输出时合并界面刷新的间隔（约30帧每秒）
+STREAM_FRAME_INTERVAL_MS = 33
+
 class MessageProcessor(QThread):
     """后台线程处理消息，避免UI阻塞"""
     
-    response_ready = pyqtSignal(str)
+    response_ready = pyqtSignal(str, object)  # 响应文本和解析出的工具调用（不是工具调用时为None）
+    response_chunk = pyqtSignal(str)  # 流式响应的增量片段
     tool_result_ready = pyqtSignal(str)
     final_response_ready = pyqtSignal(str)
     error_occurred = pyqtSignal(str)
     
-    def __init__(self, server_manager, model_selector, message, messages_history):
+    def __init__(self, server_manager, model_selector, message, messages_history,
+                 context_window=None, fallback_prompt=None, tools=None, trace_span=None,
+                 routing=None):
         super().__init__()
         self.server_manager = server_manager
         self.model_selector = model_selector
         self.message = message
-        self.messages_history = messages_history.copy()  # 复制历史记录避免竞态条件
+        self.messages_history = messages_history.copy()  # 复制历史记录避免竞态条件，已包含本轮用户消息
+        self.context_window = context_window
+        self.fallback_prompt = fallback_prompt  # 系统提示只含部分工具时的完整提示
+        self.tools = tools  # 以原生函数调用方式提供的工具，文本模式下为None
+        self.trace_span = trace_span  # 本轮对话的根span，处理线程中的span都是它的子span
+        self.routing = routing  # 工具轮次各阶段的模型，普通聊天为None
     
     def run(self):
         """运行消息处理流程"""
+        with activate(self.trace_span):
+            self.process()
+
+    def process(self):
+        """依次请求LLM、执行工具调用并请求最终响应"""
         try:
             # 获取当前选择的LLM客户端
             llm_client = self.model_selector.get_current_llm_client()
@@ -38,54 +61,98 @@ class MessageProcessor(QThread):
             if not llm_client:
                 self.error_occurred.emit("无法创建LLM客户端，请检查API密钥和模型配置")
                 return
-                
-            # 添加用户消息到历史
-            self.messages_history.append({"role": "user", "content": self.message})
-            
-            # 获取LLM响应
-            llm_response = llm_client.get_response(self.messages_history)
+
+            # 工具轮次用快速模型选择工具，用较强的模型回答
+            select_client = self.client_for(STAGE_TOOL_SELECTION, llm_client)
+            answer_client = self.client_for(STAGE_ANSWER, llm_client)
+            reanswer = select_client.model_id != answer_client.model_id and self.routing["reanswer"]
+
+            # 获取LLM响应；之后可能改由回答模型重新回答时不流式输出
+            llm_response = self.request_response(select_client, self.tools, stream=not reanswer)
             logger.debug(f"LLM原始响应: {llm_response}")
-            self.response_ready.emit(llm_response)
-            
-            # 尝试处理可能的工具调用
-            try:
-                tool_call = json.loads(llm_response)
-                logger.debug(f"尝试解析JSON: {tool_call}")
-                
-                if "tool" in tool_call and "arguments" in tool_call:
-                    # 这是工具调用
-                    logger.info(f"检测到工具调用: {tool_call['tool']}")
-                    
-                    # 执行工具
-                    tool_name = tool_call["tool"]
-                    arguments = tool_call["arguments"]
-                    
-                    # 执行工具并获取结果
-                    tool_result = self.server_manager.execute_tool(tool_name, arguments)
-                    logger.info(f"工具 {tool_name} 执行结果: {tool_result}")
-                    
-                    # 发出工具结果信号
-                    self.tool_result_ready.emit(str(tool_result))
-                    
-                    # 添加结果到历史
-                    self.messages_history.append({"role": "assistant", "content": llm_response})
-                    self.messages_history.append({"role": "system", "content": f"Tool execution result: {tool_result}"})
-                    
-                    # 获取最终响应
-                    final_response = llm_client.get_response(self.messages_history)
-                    logger.debug(f"最终响应: {final_response}")
-                    self.final_response_ready.emit(final_response)
-            except json.JSONDecodeError as e:
-                # 不是JSON，可能是普通文本响应
-                logger.debug(f"不是JSON响应: {e}")
-                # 无需额外处理，已经通过response_ready发送了响应
-                pass
+
+            # 尝试处理可能的工具调用（单个对象或对象数组），只在这里解析一次
+            tool_calls = self.parse_response(llm_response)
+
+            # 请求了提示中未列出且不存在的工具时，改用完整工具列表重新请求
+            if tool_calls and self.fallback_prompt and any(
+                call["tool"] not in self.server_manager.registry for call in tool_calls
+            ):
+                logger.info("模型请求了未知工具，使用完整工具列表重新请求")
+                self.messages_history[0] = {"role": "system", "content": self.fallback_prompt}
+                tools = self.server_manager.get_all_tools() if self.tools is not None else None
+                llm_response = self.request_response(select_client, tools, stream=not reanswer)
+                tool_calls = self.parse_response(llm_response)
+
+            # 工具选择模型直接回答时改由回答模型重新回答
+            if tool_calls is None and reanswer:
+                logger.info("工具选择模型没有调用工具，改由回答模型回答")
+                llm_response = self.request_response(answer_client, self.tools)
+                tool_calls = self.parse_response(llm_response)
+
+            self.response_ready.emit(llm_response, tool_calls)
+
+            if tool_calls is None:
+                # 不是工具调用，已经通过response_ready发送了响应
+                logger.debug("不是工具调用响应")
+                return
+
+            logger.info(f"检测到工具调用: {[call['tool'] for call in tool_calls]}")
+
+            # 并发执行所有工具调用并合并结果
+            tool_results = self.server_manager.execute_tools(tool_calls)
+            tool_result = format_tool_results(tool_calls, tool_results)
+            logger.info(f"工具执行结果: {tool_result}")
+
+            # 发出工具结果信号
+            self.tool_result_ready.emit(tool_result)
+
+            # 添加结果到历史
+            self.messages_history.append({"role": "assistant", "content": llm_response})
+            self.messages_history.append({"role": "system", "content": tool_result})
+
+            # 获取最终响应
+            final_response = self.request_response(answer_client)
+            logger.debug(f"最终响应: {final_response}")
+            self.final_response_ready.emit(final_response)
                 
         except Exception as e:
             error_msg = f"处理消息时出错: {str(e)}"
             logger.error(error_msg)
             self.error_occurred.emit(error_msg)
 
+    def client_for(self, stage, default):
+        """路由指定的阶段模型的客户端，普通聊天或与当前模型相同时返回default"""
+        if not self.routing:
+            return default
+        model_id = self.routing[stage]
+        if model_id == self.model_selector.get_current_model():
+            return default
+        return self.model_selector.get_llm_client(model_id) or default
+
+    def parse_response(self, llm_response):
+        """解析LLM响应中的工具调用"""
+        with get_tracer().span("tool_calls.parse", response_chars=len(llm_response)):
+            return parse_tool_calls(llm_response)
+
+    def request_response(self, llm_client, tools=None, stream=True):
+        """获取LLM响应，提供商支持时以流式方式逐段转发
+
+        提供原生函数调用的工具或stream为False时使用非流式请求，以便读取结构化的工具调用。
+        """
+        messages = self.messages_history
+        if self.context_window is not None:
+            messages = self.context_window.fit(messages)
+
+        if tools or not stream or not llm_client.supports_streaming():
+            return llm_client.get_response(messages, tools)
+
+        chunks = []
+        for chunk in llm_client.stream_response(messages):
+            chunks.append(chunk)
+            self.response_chunk.emit(chunk)
+        return "".join(chunks)
+
 
 class ChatPanel(QWidget):
     """聊天界面面板，处理用户与AI的对话"""
@@ -95,6 +162,31 @@ class ChatPanel(QWidget):
         self.server_manager = server_manager
         self.model_selector = model_selector
         self.messages_history = []
+
+        # 系统提示按工具目录版本缓存，目录不变时不重新格式化
+        self.prompt_builder = PromptBuilder()
+
+        # 工具较多时只在提示中列出与当前对话相关的工具
+        self.tool_selector = ToolSelector(server_manager.config.get("tool_selection"))
+        self._prompt_complete = True
+        self._prompt_tools = []
+
+        # 按当前模型的token预算裁剪发送的历史，较早的轮次在后台压缩为摘要
+        self.context_window = ContextWindow(
+            model_selector.get_context_budget(), summarizer=self.summarize_history
+        )
+
+        # 流式输出状态
+        self._stream_text = ""
+        self._stream_dirty = False
+        self._stream_anchor = None
+        self._thinking_shown = False
+        self._stream_timer = QTimer(self)
+        self._stream_timer.setInterval(STREAM_FRAME_INTERVAL_MS)
+        self._stream_timer.timeout.connect(self._flush_stream)
+
+        # 当前对话轮次的根span，界面渲染的span挂在它下面
+        self._turn_span = NOOP_SPAN
         
         # 初始化系统提示
         self.init_system_prompt()
@@ -102,63 +194,51 @@ class ChatPanel(QWidget):
         # 设置界面
         self.init_ui()
     
+    def build_system_message(self, query=None):
+        """构建系统提示，工具目录和提示格式都未变化时复用上次的结果
+
+        Args:
+            query: 可选，最近的对话文本；提供时只列出与之相关的工具
+        """
+        with get_tracer().span("prompt.build") as span:
+            tools = self.server_manager.get_all_tools()
+            version = self.server_manager.registry.version
+            self._prompt_complete = True
+            if query is not None:
+                tools, self._prompt_complete = self.tool_selector.select(tools, query, version)
+                if not self._prompt_complete:
+                    version = (version, tuple(tool.name for tool in tools))
+            self._prompt_tools = tools
+
+            model_info = self.model_selector.get_current_model_info() or {}
+            system_prompt = self.prompt_builder.build(
+                tools,
+                version=version,
+                style=model_info.get("prompt_style", PROMPT_STYLE_TEXT),
+                native=self.model_selector.supports_tool_calls(),
+            )
+            span.set_attributes(
+                tools=len(tools), complete=self._prompt_complete, prompt_chars=len(system_prompt)
+            )
+        return system_prompt
+
     def init_system_prompt(self):
         """初始化系统提示消息"""
-        # 获取所有工具
-        tools = self.server_manager.get_all_tools()
-
-        # 格式化工具描述
-        tools_description = "\n".join([self.format_tool(tool) for tool in tools])
-
-        system_message = (
-            "You are a helpful assistant with access to these tools:\n\n"
-            f"{tools_description}\n"
-            "Choose the appropriate tool based on the user's question. "
-            "If no tool is needed, reply directly.\n\n"
-            "IMPORTANT: When you need to use a tool, you must ONLY respond with "
-            "the exact JSON object format below, nothing else:\n"
-            "{\n"
-            '    "tool": "tool-name",\n'
-            '    "arguments": {\n'
-            '        "argument-name": "value"\n'
-            "    }\n"
-            "}\n\n"
-            "After receiving a tool's response:\n"
-            "1. Transform the raw data into a natural, conversational response\n"
-            "2. Keep responses concise but informative\n"
-            "3. Focus on the most relevant information\n"
-            "4. Use appropriate context from the user's question\n"
-            "5. Avoid simply repeating the raw data\n\n"
-            "Please use only the tools that are explicitly defined above."
-        )
+        system_message = self.build_system_message()
 
         # 添加到消息历史
         self.messages_history = [{"role": "system", "content": system_message}]
+        self.context_window.reset()
 
-        logger.debug(f"系统提示: {system_message}")
-        logger.debug(f"检测到的工具数量: {len(tools)}")
-        for tool in tools:
-            logger.debug(f"工具名称: {tool.name}, 描述: {tool.description}")
+    def summarize_history(self, previous, messages):
+        """用预算中配置的压缩模型（未配置时用当前模型）生成历史摘要，在后台线程中调用"""
+        model_id = self.context_window.budget.get("compaction_model") or self.model_selector.get_current_model()
+        llm_client = self.model_selector.get_llm_client(model_id)
+        if llm_client is None:
+            raise RuntimeError(f"无法创建压缩模型客户端: {model_id}")
+        return make_llm_summarizer(llm_client.get_response)(previous, messages)
 
    
-    def format_tool(self, tool):
-        args_desc = []
-        if "properties" in tool.input_schema:
-            for param_name, param_info in tool.input_schema["properties"].items():
-                arg_desc = (
-                    f"- {param_name}: {param_info.get('description', 'No description')}"
-                )
-                if param_name in tool.input_schema.get("required", []):
-                    arg_desc += " (required)"
-                args_desc.append(arg_desc)
-
-        return f"""
-Tool: {tool.name}
-Description: {tool.description}
-Arguments:
-{chr(10).join(args_desc)}
-"""
-    
     def init_ui(self):
         """初始化用户界面"""
         layout = QVBoxLayout(self)
@@ -214,8 +294,21 @@ Arguments:
         if not message:
             return
 
+        # 一轮对话从发送开始，到最终回复渲染完成结束
+        self._end_turn()
+        self._turn_span = get_tracer().span(
+            "chat.turn", root=True, model=self.model_selector.get_current_model()
+        )
+
         # 在每次发送消息前刷新系统提示，确保工具信息是最新的
-        self.refresh_system_prompt()
+        with activate(self._turn_span):
+            self.refresh_system_prompt(message)
+            native_tools = self._prompt_tools if self.model_selector.supports_tool_calls() else None
+            fallback_prompt = None if self._prompt_complete else self.build_system_message()
+            routing = self.route_stages(message)
+
+        # 用户消息加入面板的历史，上下文窗口按用户消息划分轮次，检索查询也取自之前的用户消息
+        self.messages_history.append({"role": "user", "content": message})
 
         # 清空输入框
         self.message_input.clear()
@@ -225,18 +318,28 @@ Arguments:
 
         # 显示"正在思考"的提示
         self.add_system_message("助手正在思考...")
+        self._thinking_shown = True
         self.send_button.setEnabled(False)
 
+        # 使用当前模型的上下文预算
+        self.context_window.budget = self.model_selector.get_context_budget()
+
         # 创建并启动处理线程
         self.processor = MessageProcessor(
             self.server_manager,
             self.model_selector,
             message,
-            self.messages_history
+            self.messages_history,
+            self.context_window,
+            fallback_prompt,
+            native_tools,
+            self._turn_span,
+            routing
         )
 
         # 连接信号
         self.processor.response_ready.connect(self.handle_llm_response)
+        self.processor.response_chunk.connect(self.handle_response_chunk)
         self.processor.tool_result_ready.connect(self.handle_tool_result)
         self.processor.final_response_ready.connect(self.handle_final_response)
         self.processor.error_occurred.connect(self.handle_error)
@@ -244,80 +347,127 @@ Arguments:
         # 启动线程
         self.processor.start()
         
-    def refresh_system_prompt(self):
-        """刷新系统提示以获取最新工具信息"""
-        # 获取所有工具
-        tools = self.server_manager.get_all_tools()
+    def route_stages(self, message):
+        """按模型路由配置确定本轮各阶段的模型
 
-        # 记录工具数量以进行调试
-        logger.debug(f"刷新系统提示，当前工具数量: {len(tools)}")
-        for tool in tools:
-            logger.debug(f"工具: {tool.name}")
+        Returns:
+            {阶段: 模型ID, "reanswer": bool}；普通聊天（没有相关工具）或未启用路由时为None
+        """
+        router = self.model_selector.router
+        query = recent_query(self.messages_history, message)
+        if not router.applies(self.tool_selector, self.server_manager.get_all_tools(), query,
+                              self.server_manager.registry.version):
+            return None
+        current_model = self.model_selector.get_current_model()
+        routing = {
+            STAGE_TOOL_SELECTION: router.model_for(STAGE_TOOL_SELECTION, current_model),
+            STAGE_ANSWER: router.model_for(STAGE_ANSWER, current_model),
+            "reanswer": router.reanswer,
+        }
+        self._turn_span.set_attributes(routed=True, tool_model=routing[STAGE_TOOL_SELECTION])
+        return routing
 
+    def refresh_system_prompt(self, message=None):
+        """刷新系统提示以获取最新工具信息
+
+        Args:
+            message: 可选，即将发送的用户消息，用于选择相关工具
+        """
         # 如果没有工具可用，记录警告但继续执行
-        if not tools:
+        if not self.server_manager.registry:
             logger.warning("无可用工具，可能服务器尚未准备好")
 
-        # 格式化工具描述
-        tools_description = "\n".join([self.format_tool(tool) for tool in tools])
-
-        # 更新系统提示
-        system_message = (
-            "You are a helpful assistant with access to these tools:\n\n"
-            f"{tools_description}\n"
-            "Choose the appropriate tool based on the user's question. "
-            "If no tool is needed, reply directly.\n\n"
-            "IMPORTANT: When you need to use a tool, you must ONLY respond with "
-            "the exact JSON object format below, nothing else:\n"
-            "{\n"
-            '    "tool": "tool-name",\n'
-            '    "arguments": {\n'
-            '        "argument-name": "value"\n'
-            "    }\n"
-            "}\n\n"
-            "After receiving a tool's response:\n"
-            "1. Transform the raw data into a natural, conversational response\n"
-            "2. Keep responses concise but informative\n"
-            "3. Focus on the most relevant information\n"
-            "4. Use appropriate context from the user's question\n"
-            "5. Avoid simply repeating the raw data\n\n"
-            "Please use only the tools that are explicitly defined above."
-        )
+        # 工具目录未变化时构建器直接返回缓存的提示
+        query = recent_query(self.messages_history, message) if message else None
+        system_message = self.build_system_message(query)
 
         # 更新消息历史中的系统提示
         if self.messages_history and self.messages_history[0]["role"] == "system":
-            self.messages_history[0] = {"role": "system", "content": system_message}
+            if self.messages_history[0]["content"] is not system_message:
+                self.messages_history[0] = {"role": "system", "content": system_message}
         else:
             # 如果历史中没有系统提示，则添加
             self.messages_history.insert(0, {"role": "system", "content": system_message})
-
-        logger.debug(f"已更新系统提示，包含工具数量: {len(tools)}")    
         
-    def handle_llm_response(self, response):
-        """处理LLM的初始响应"""
+    def handle_response_chunk(self, chunk):
+        """缓存流式片段，由定时器按固定帧率合并刷新"""
+        self._stream_text += chunk
+        self._stream_dirty = True
+        if not self._stream_timer.isActive():
+            self._stream_timer.start()
+
+    def _flush_stream(self):
+        """将缓存的流式文本就地渲染到当前助手消息中"""
+        if not self._stream_dirty:
+            self._stream_timer.stop()
+            return
+        self._stream_dirty = False
+
+        # 以JSON或JSON代码块开头的回复可能是工具调用，不直接显示
+        if self._stream_text.lstrip().startswith(("{", "[", "```json")):
+            return
+
+        cursor = self.chat_display.textCursor()
+        if self._stream_anchor is None:
+            self._remove_thinking_message()
+            cursor.movePosition(cursor.End)
+            self._stream_anchor = cursor.position()
+        else:
+            self._remove_stream_block()
+
+        self.add_assistant_message(self._stream_text)
+
+    def _remove_stream_block(self):
+        """移除正在流式渲染的消息块"""
+        cursor = self.chat_display.textCursor()
+        cursor.setPosition(self._stream_anchor)
+        cursor.movePosition(cursor.End, cursor.KeepAnchor)
+        cursor.removeSelectedText()
+
+    def _end_stream(self):
+        """结束流式渲染，移除临时消息块以便显示完整回复"""
+        self._stream_timer.stop()
+        if self._stream_anchor is not None:
+            self._remove_stream_block()
+        self._stream_text = ""
+        self._stream_dirty = False
+        self._stream_anchor = None
+
+    def _remove_thinking_message(self):
+        """移除"助手正在思考..."提示"""
+        if not self._thinking_shown:
+            return
         cursor = self.chat_display.textCursor()
         cursor.movePosition(cursor.End)
         cursor.movePosition(cursor.StartOfBlock, cursor.KeepAnchor)
         cursor.removeSelectedText()
+        self._thinking_shown = False
+
+    def handle_llm_response(self, response, tool_calls):
+        """处理LLM的初始响应
+
+        Args:
+            response: 响应文本
+            tool_calls: MessageProcessor解析出的工具调用，不是工具调用时为None
+        """
+        with get_tracer().span("ui.render", parent=self._turn_span, stage="llm_response"):
+            self._render_llm_response(response, tool_calls)
+
+    def _render_llm_response(self, response, tool_calls):
+        self._end_stream()
+        self._remove_thinking_message()
         
-        try:
-            # 尝试解析是否为工具调用
-            tool_call = json.loads(response)
-            if "tool" in tool_call and "arguments" in tool_call:
-                tool_name = tool_call["tool"]
+        if tool_calls is not None:
+            for tool_call in tool_calls:
                 args = json.dumps(tool_call["arguments"], indent=2, ensure_ascii=False)
-
-                logger.info(f"助手正在调用工具: {tool_name}")
+                logger.info(f"助手正在调用工具: {tool_call['tool']}")
                 logger.info(f"参数: {args}")
 
-                self.add_system_message("助手正在处理您的请求...")
+            self.add_system_message("助手正在处理您的请求...")
 
-                # 存储到历史
-                self.messages_history.append({"role": "assistant", "content": response})
-                return
-        except json.JSONDecodeError:
-            # 不是工具调用，显示为普通回复
-            pass
+            # 存储到历史
+            self.messages_history.append({"role": "assistant", "content": response})
+            return
             
         # 常规回复
         self.add_assistant_message(response)
@@ -327,26 +477,38 @@ Arguments:
         
         # 重新启用发送按钮
         self.send_button.setEnabled(True)
+        self._end_turn()
     
     def handle_tool_result(self, result):
         """处理工具执行结果"""
         # self.add_tool_result(result)
         logger.info(f"工具执行结果: {result}")
         
-        # 添加到历史
-        self.messages_history.append({"role": "system", "content": f"Tool execution result: {result}"})
+        # 添加到历史（结果已由MessageProcessor合并格式化）
+        self.messages_history.append({"role": "system", "content": result})
     
     def handle_final_response(self, response):
         """处理基于工具结果的最终响应"""
-        self.add_assistant_message(response)
+        with get_tracer().span("ui.render", parent=self._turn_span, stage="final_response"):
+            self._end_stream()
+            self.add_assistant_message(response)
         
         # 添加到历史
         self.messages_history.append({"role": "assistant", "content": response})
         
         # 重新启用发送按钮
         self.send_button.setEnabled(True)
+        self._end_turn()
     
     def handle_error(self, error_message):
         """处理错误"""
+        self._end_stream()
         self.add_system_message(f"错误: {error_message}")
-        self.send_button.setEnabled(True)
\ No newline at end of file
+        self.send_button.setEnabled(True)
+        self._turn_span.record_error(error_message)
+        self._end_turn()
+
+    def _end_turn(self):
+        """结束当前轮次的根span"""
+        self._turn_span.end()
+        self._turn_span = NOOP_SPAN
\ No newline at end of file
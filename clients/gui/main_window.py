@@ -18,6 +18,8 @@ from .tool_panel import ToolPanel
 from .model_selector import ModelSelector
 from .model_config_panel import ModelConfigPanel
 from .server_manager import ServerManager
+from core.async_runtime import get_runtime
+from core.http_pool import get_http_pool
 
 logger = logging.getLogger(__name__)
 
@@ -134,4 +136,8 @@ class MainWindow(QMainWindow):
         """窗口关闭事件处理"""
         # 确保服务器正确关闭
         self.server_manager.close_all_servers()
+
+        # 关闭共享的LLM连接池，对冲请求的异步连接需要在运行时停止之前关闭
+        get_http_pool().close()
+        get_runtime().stop()
         event.accept()
\ No newline at end of file
@@ -13,6 +13,11 @@ from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QLabel, QComboBox,
 from PyQt5.QtCore import pyqtSignal, Qt
 
 from .utils import create_llm_client
+from core.codec import ProviderCodec
+from core.context_window import budget_for_model
+from core.hedging import get_hedge_policy
+from core.response_cache import DEFAULT_OPTIONS as CACHE_OPTIONS, get_response_cache
+from core.routing import ModelRouter
 
 logger = logging.getLogger(__name__)
 
@@ -28,6 +33,8 @@ class ModelSelector(QWidget):
         self.api_key = os.getenv("LLM_API_KEY")
         
         # 加载模型配置
+        self.router = ModelRouter()
+        self.response_cache = None
         self.load_models_config()
         
         self.init_ui()
@@ -46,6 +53,22 @@ class ModelSelector(QWidget):
                 self.models[model_id] = model_info["display_name"]
             
             self.current_model = self.models_config.get("default_model", next(iter(self.models)))
+
+            # 每个提供商的请求模板和响应路径只编译一次
+            self.codecs = {
+                provider_id: ProviderCodec(provider_info)
+                for provider_id, provider_info in self.models_config.get("providers", {}).items()
+            }
+
+            # 工具轮次按阶段选择模型
+            self.router = ModelRouter(self.models_config.get("routing"))
+
+            # 可选的持久化响应缓存，相对路径相对于配置文件所在目录
+            cache_config = dict(self.models_config.get("response_cache") or {})
+            cache_config["path"] = os.path.join(
+                os.path.dirname(config_path), cache_config.get("path", CACHE_OPTIONS["path"])
+            )
+            self.response_cache = get_response_cache(cache_config)
             
             logger.info(f"成功加载模型配置: {len(self.models)} 个模型")
         else:
@@ -118,23 +141,56 @@ class ModelSelector(QWidget):
             return self.models_config["providers"][provider_id]
         return None
     
+    def get_context_budget(self):
+        """获取当前模型的上下文token预算"""
+        return budget_for_model(self.get_current_model_info())
+
+    def supports_tool_calls(self):
+        """当前模型的提供商是否启用了原生函数调用"""
+        model_info = self.get_current_model_info() or {}
+        codec = self.codecs.get(model_info.get("provider"))
+        return bool(codec and codec.supports_tool_calls)
+
     def get_current_llm_client(self):
         """获取当前模型的LLM客户端"""
+        return self.get_llm_client(self.current_model)
+
+    def get_llm_client(self, model_id, hedge=True):
+        """获取指定模型的LLM客户端
+
+        Args:
+            model_id: 模型ID
+            hedge: 为False时忽略模型的对冲配置（用于创建后备模型的客户端）
+        """
         if not self.api_key:
             logger.error("缺少API密钥，无法创建LLM客户端")
             return None
         
-        model_info = self.get_current_model_info()
+        model_info = self.models_config["models"].get(model_id)
         if not model_info:
-            logger.error(f"未找到模型信息: {self.current_model}")
+            logger.error(f"未找到模型信息: {model_id}")
             return None
             
         provider_id = model_info.get("provider")
         provider_info = self.get_provider_info(provider_id)
+
+        # 配置了对冲策略时，对冲请求发给后备模型（未配置后备模型时发给本模型）
+        hedging = None
+        fallback = None
+        hedging_config = model_info.get("hedging") if hedge else None
+        if hedging_config:
+            hedging = get_hedge_policy(model_id, hedging_config)
+            fallback_id = hedging_config.get("fallback")
+            if fallback_id and fallback_id != model_id:
+                fallback = self.get_llm_client(fallback_id, hedge=False)
         
         return create_llm_client(
             api_key=self.api_key,
-            model_id=self.current_model,
+            model_id=model_id,
             model_info=model_info,
-            provider_info=provider_info
+            provider_info=provider_info,
+            codec=self.codecs.get(provider_id),
+            hedging=hedging,
+            fallback=fallback,
+            response_cache=self.response_cache,
         )
\ No newline at end of file
@@ -5,34 +5,28 @@
 以及工具的获取和执行。
 """
 
-import json
-import logging
-import threading
 import asyncio
-from contextlib import AsyncExitStack 
-import shutil
-import os
+import logging
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QLabel, QListWidget, 
                            QListWidgetItem, QPushButton, QHBoxLayout)
-from PyQt5.QtCore import Qt, pyqtSignal, QObject, QThread
+from PyQt5.QtCore import Qt, pyqtSignal, QObject
 
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.stdio import stdio_client
+from core.async_runtime import get_runtime
+from core.pool import ServerPool
+from core.resilience import get_resilience, retry_safe
+from core.result_cache import ToolResultCache
+from core.startup import DEFAULT_STARTUP_TIMEOUT, format_startup_report, start_servers
+from core.tools import ToolRegistry
+from core.tracing import activate, current_span, get_tracer
 
 logger = logging.getLogger(__name__)
 
-# 工具类定义
-class Tool:
-    """表示MCP工具"""
-    
-    def __init__(self, name, description, input_schema):
-        self.name = name
-        self.description = description
-        self.input_schema = input_schema
+# 等待工具执行结果的超时时间（秒）
+TOOL_CALL_TIMEOUT = 120.0
 
-# 服务器工作线程
-class ServerWorker(QThread):
-    """后台线程处理服务器操作"""
+# 服务器工作对象
+class ServerWorker(QObject):
+    """在共享异步运行时中处理单个服务器的操作"""
     
     server_ready = pyqtSignal(str, object)  # 服务器就绪信号
     server_failed = pyqtSignal(str, str)  # 服务器失败信号
@@ -44,132 +38,50 @@ class ServerWorker(QThread):
         super().__init__()
         self.name = name
         self.config = config
-        self.session = None
-        self.command = "initialize"  # 初始命令
-        self.tool_name = None
-        self.tool_args = None
-        self.loop = None
-        self.exit_stack = None
-        self.result = None  # 存储工具执行结果
-        
-    def run(self):
-        """运行服务器操作"""
-        if self.command == "initialize":
-            self._initialize_server()
-        elif self.command == "list_tools":
-            self._list_tools()
-        elif self.command == "execute_tool":
-            self._execute_tool()
-    
-    def _initialize_server(self):
-        """初始化服务器连接"""
-        try:
-            # 创建事件循环
-            self.loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(self.loop)
-            
-            # 初始化服务器
-            command = (
-                shutil.which("npx")
-                if self.config["command"] == "npx"
-                else self.config["command"]
-            )
-            
-            if command is None:
-                self.server_failed.emit(self.name, "无法找到指定命令")
-                return
-            
-            server_params = StdioServerParameters(
-                command=command,
-                args=self.config["args"],
-                env={**os.environ, **self.config["env"]}
-                if self.config.get("env")
-                else None,
-            )
-            
-            # 使用 AsyncExitStack 来管理资源
-            async def setup_server():
-                self.exit_stack = AsyncExitStack()  # 从 contextlib 导入
-                stdio_transport = await self.exit_stack.enter_async_context(
-                    stdio_client(server_params)
-                )
-                read, write = stdio_transport
-                session = await self.exit_stack.enter_async_context(
-                    ClientSession(read, write)
-                )
-                await session.initialize()
-                return session
-            
-            self.session = self.loop.run_until_complete(setup_server())
-            
-            # 发出服务器就绪信号
-            self.server_ready.emit(self.name, self.session)
-            
-            # 获取工具列表
-            self._list_tools()
-            
-        except Exception as e:
-            error_msg = f"初始化服务器失败: {str(e)}"
-            logger.error(error_msg)
-            self.server_failed.emit(self.name, error_msg)
-    
-    def cleanup(self):
-        """清理服务器资源"""
-        if self.exit_stack and self.loop:
-            try:
-                # 创建一个新的事件循环用于清理
-                cleanup_loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(cleanup_loop)
-
-                # 关闭旧的循环中的任务
-                if not self.loop.is_closed():
-                    for task in asyncio.all_tasks(self.loop):
-                        task.cancel()
+        self.runtime = get_runtime()
+        self.connection = ServerPool(name, config, on_tools_changed=self._on_tools_changed)
+        self.result_cache = ToolResultCache(name, config.get("cache"))
+        self.resilience = get_resilience(f"server:{name}", config.get("resilience"))
+        self.annotations = {}  # 工具名 -> MCP工具注解
 
-                    # 给任务一点时间完成取消
-                    try:
-                        self.loop.run_until_complete(asyncio.sleep(0.1))
-                    except:
-                        pass
-
-                    self.loop.close()
+    @property
+    def session(self):
+        return self.connection.session
+        
+    def start(self, default_timeout=DEFAULT_STARTUP_TIMEOUT):
+        """提交服务器初始化任务"""
+        return self.runtime.submit(
+            start_servers([self.connection], default_timeout, on_result=self.on_started)
+        )
 
-                # 重新初始化资源以安全关闭
-                self.exit_stack = None
+    def on_started(self, result):
+        """服务器启动完成（就绪或降级）时调用，运行在运行时线程中"""
+        if not result.ready:
+            self.server_failed.emit(self.name, f"初始化服务器失败: {result.error}")
+            return
 
-            except Exception as e:
-                logger.error(f"清理服务器资源时出错: {str(e)}")
-            finally:
-                # 确保循环已关闭
-                if self.loop and not self.loop.is_closed():
-                    self.loop.close()
+        # 发出服务器就绪信号
+        self.server_ready.emit(self.name, self.session)
 
-        self.session = None
-        self.exit_stack = None
+        # 获取工具列表
+        self.runtime.submit(self._list_tools())
+    
+    def cleanup(self):
+        """清理服务器资源"""
+        try:
+            self.runtime.run(self.connection.close(), timeout=10.0)
+        except Exception as e:
+            logger.error(f"清理服务器资源时出错: {str(e)}")
    
-    def _list_tools(self):
+    async def _list_tools(self):
         """获取工具列表"""
-        if not self.session:
+        if not self.connection.ready:
             self.server_failed.emit(self.name, "服务器未初始化")
             return
 
         try:
-            # 使用现有事件循环而不是创建新的
-            if not self.loop or self.loop.is_closed():
-                self.loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(self.loop)
-
-            # 获取工具列表
-            async def get_tools():
-                tools_response = await self.session.list_tools()
-                tools = []
-                for item in tools_response:
-                    if isinstance(item, tuple) and item[0] == "tools":
-                        for tool in item[1]:
-                            tools.append(Tool(tool.name, tool.description, tool.inputSchema))
-                return tools
-
-            tools = self.loop.run_until_complete(get_tools())
+            tools = await self.connection.list_tools()
+            self.annotations = {tool.name: tool.annotations for tool in tools}
 
             # 发出工具列表就绪信号
             self.tools_ready.emit(self.name, tools)
@@ -179,49 +91,53 @@ class ServerWorker(QThread):
             logger.error(error_msg)
             self.server_failed.emit(self.name, error_msg)
     
-    def _execute_tool(self):
-        """执行工具，直接同步方式"""
-        if not self.session or not self.tool_name:
+    def _on_tools_changed(self, connection):
+        """服务器通知工具列表变化时重新获取（在运行时线程中调用）"""
+        self.runtime.submit(self._list_tools())
+    
+    async def _execute_tool(self, tool_name, arguments):
+        """执行工具，暂时性错误按服务器的重试策略重试，失败时返回错误信息"""
+        if not self.connection.ready or not tool_name:
             error_msg = "服务器未初始化或工具名称为空"
-            self.tool_failed.emit(self.name, self.tool_name, error_msg)
+            self.tool_failed.emit(self.name, tool_name, error_msg)
             return error_msg
             
-        try:
-            # 确保我们有一个工作的事件循环
-            if not self.loop or self.loop.is_closed():
-                self.loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(self.loop)
-            
-            # 定义异步执行函数
-            async def exec_tool():
-                try:
-                    logger.debug(f"开始调用工具 {self.tool_name} 参数: {self.tool_args}")
-                    return await self.session.call_tool(self.tool_name, self.tool_args)
-                except Exception as e:
-                    logger.error(f"工具调用异步异常: {e}")
-                    raise
-            
-            # 执行异步函数并获取结果
-            logger.debug("开始执行工具异步调用")
-            result = self.loop.run_until_complete(exec_tool())
-            logger.debug(f"工具执行完成，结果: {result}")
-            
-            # 发出信号
-            self.tool_executed.emit(self.name, self.tool_name, result)
-            return result
-            
-        except Exception as e:
-            error_msg = f"执行工具失败: {str(e)}"
-            logger.error(error_msg)
-            self.tool_failed.emit(self.name, self.tool_name, error_msg)
-            return error_msg
+        with get_tracer().span("tool.execute", server=self.name, tool=tool_name) as span:
+            annotations = self.annotations.get(tool_name)
+            result = self.result_cache.get(tool_name, arguments, annotations)
+            span.set_attribute("cache_hit", result is not None)
+            if result is not None:
+                self.tool_executed.emit(self.name, tool_name, result)
+                return result
+
+            try:
+                result = await self.resilience.call_async(
+                    self.connection.call_tool,
+                    tool_name,
+                    arguments,
+                    attempts=None if retry_safe(annotations) else 1,
+                )
+                logger.debug(f"工具执行完成，结果: {result}")
+                self.result_cache.put(tool_name, arguments, result, annotations)
+
+                # 发出信号
+                self.tool_executed.emit(self.name, tool_name, result)
+                return result
+
+            except Exception as e:
+                span.record_error(e)
+                error_msg = f"执行工具失败: {str(e)}"
+                logger.error(error_msg)
+                self.tool_failed.emit(self.name, tool_name, error_msg)
+                return error_msg
 
     def execute_tool(self, tool_name, arguments):
-        """设置工具执行任务"""
-        self.command = "execute_tool"
-        self.tool_name = tool_name
-        self.tool_args = arguments
-        self.start()
+        """提交工具执行任务
+
+        Returns:
+            concurrent.futures.Future，结果为工具执行结果或错误信息
+        """
+        return self.runtime.submit(self._execute_tool(tool_name, arguments))
 
 
 class ServerManager(QWidget):
@@ -234,7 +150,8 @@ class ServerManager(QWidget):
         self.config = config
         self.servers = {}  # 服务器字典
         self.workers = {}  # 工作线程字典
-        self.tools = {}  # 工具字典，按服务器分组
+        self.registry = ToolRegistry()  # 工具注册表，工具名 -> 所属服务器
+        self.startup_timeout = config.get("startup_timeout", DEFAULT_STARTUP_TIMEOUT)
         
         self.init_ui()
         self.load_servers()
@@ -268,14 +185,30 @@ class ServerManager(QWidget):
         layout.addLayout(button_layout)
     
     def load_servers(self):
-        """加载服务器配置"""
-        if "mcpServers" in self.config:
-            for name, srv_config in self.config["mcpServers"].items():
-                self.add_server(name, srv_config)
+        """加载服务器配置，并发启动所有服务器"""
+        if "mcpServers" not in self.config:
+            return
+
+        workers = [
+            self.add_server(name, srv_config, start=False)
+            for name, srv_config in self.config["mcpServers"].items()
+        ]
+        if workers:
+            get_runtime().submit(self._start_workers(workers))
+
+    async def _start_workers(self, workers):
+        """在共享运行时中并发启动服务器并记录启动报告"""
+        by_name = {worker.name: worker for worker in workers}
+        results = await start_servers(
+            [worker.connection for worker in workers],
+            self.startup_timeout,
+            on_result=lambda result: by_name[result.name].on_started(result),
+        )
+        logger.info(format_startup_report(results))
     
-    def add_server(self, name, config):
+    def add_server(self, name, config, start=True):
         """添加服务器"""
-        # 创建服务器线程
+        # 创建服务器工作对象
         worker = ServerWorker(name, config)
         
         # 连接信号
@@ -285,16 +218,18 @@ class ServerManager(QWidget):
         worker.tool_executed.connect(self.on_tool_executed)
         worker.tool_failed.connect(self.on_tool_failed)
         
-        # 存储工作线程
+        # 存储工作对象
         self.workers[name] = worker
         
-        # 启动工作线程
-        worker.start()
+        # 在共享运行时中启动服务器
+        if start:
+            worker.start(self.startup_timeout)
         
         # 添加到服务器列表
         item = QListWidgetItem(f"{name} (连接中...)")
         item.setData(Qt.UserRole, name)
         self.server_list.addItem(item)
+        return worker
     
     def on_server_ready(self, name, session):
         """服务器就绪处理函数"""
@@ -324,11 +259,10 @@ class ServerManager(QWidget):
         """工具列表就绪处理函数"""
         logger.info(f"服务器 {name} 提供 {len(tools)} 个工具")
         
-        # 存储工具
-        self.tools[name] = tools
-        
-        # 发出更新信号
-        self.servers_updated.emit()
+        # 增量更新工具注册表
+        if self.registry.update_server(name, tools):
+            # 发出更新信号
+            self.servers_updated.emit()
     
     def on_tool_executed(self, server_name, tool_name, result):
         """工具执行完成处理函数"""
@@ -344,13 +278,11 @@ class ServerManager(QWidget):
         # 清空服务器列表
         self.server_list.clear()
         
-        # 清空工具缓存
-        self.tools.clear()
+        # 清空工具注册表
+        self.registry.clear()
         
-        # 关闭所有工作线程
-        for worker in self.workers.values():
-            worker.terminate()
-            worker.wait()
+        # 关闭所有服务器连接
+        self.close_all_servers()
         
         self.workers.clear()
         
@@ -368,21 +300,13 @@ class ServerManager(QWidget):
         
         # 从配置中获取服务器配置
         if name in self.config["mcpServers"]:
-            # 关闭现有工作线程
+            # 关闭现有连接
             if name in self.workers:
-                # 先执行清理
-                try:
-                    self.workers[name].cleanup()
-                except Exception as e:
-                    logger.error(f"重启服务器时清理资源出错: {str(e)}")
-                    
-                self.workers[name].terminate()
-                self.workers[name].wait()
+                self.workers[name].cleanup()
                 del self.workers[name]
             
-            # 从工具缓存中移除
-            if name in self.tools:
-                del self.tools[name]
+            # 从工具注册表中移除
+            self.registry.remove_server(name)
             
             # 移除列表项
             for i in range(self.server_list.count()):
@@ -396,44 +320,68 @@ class ServerManager(QWidget):
     
     def get_all_tools(self):
         """获取所有可用工具"""
-        all_tools = []
-        for tools in self.tools.values():
-            all_tools.extend(tools)
-        return all_tools
+        return self.registry.tools()
     
     def execute_tool(self, tool_name, arguments):
-        """执行指定工具 - 直接同步方式"""
-        # 查找拥有此工具的服务器
-        for server_name, tools in self.tools.items():
-            for tool in tools:
-                if tool.name == tool_name:
-                    logger.info(f"找到工具 {tool_name} 在服务器 {server_name} 上，准备执行")
-                    
-                    # 获取已初始化的工作线程
-                    worker = self.workers[server_name]
-                    
-                    # 设置执行参数
-                    worker.tool_name = tool_name
-                    worker.tool_args = arguments
-                    
-                    # 直接调用执行方法
-                    result = worker._execute_tool()
-                    return result
-        
-        error_msg = f"未找到工具: {tool_name}"
-        logger.warning(error_msg)
-        return error_msg
+        """执行指定工具，阻塞等待共享运行时返回结果"""
+        return self.execute_tools([{"tool": tool_name, "arguments": arguments}])[0]
+
+    def execute_tools(self, tool_calls):
+        """在共享运行时中并发执行多个工具调用
+
+        Args:
+            tool_calls: {"tool", "arguments"} 字典列表
+
+        Returns:
+            与调用顺序对应的结果列表，单个调用失败时对应位置为错误信息
+        """
+        async def execute_one(tool_call):
+            worker = self.find_worker(tool_call["tool"])
+            if worker is None:
+                error_msg = f"未找到工具: {tool_call['tool']}"
+                logger.warning(error_msg)
+                return error_msg
+            return await worker._execute_tool(tool_call["tool"], tool_call["arguments"])
+
+        # 运行时线程不继承调用线程的上下文，显式传递当前span作为工具调用的父span
+        parent = current_span()
+
+        async def execute_all():
+            with activate(parent):
+                results = await asyncio.gather(
+                    *(execute_one(tool_call) for tool_call in tool_calls),
+                    return_exceptions=True,
+                )
+            return [
+                f"执行工具失败: {str(result)}" if isinstance(result, Exception) else result
+                for result in results
+            ]
+
+        try:
+            return get_runtime().run(execute_all(), timeout=TOOL_CALL_TIMEOUT)
+        except Exception as e:
+            error_msg = f"执行工具失败: {str(e) or type(e).__name__}"
+            logger.error(error_msg)
+            return [error_msg] * len(tool_calls)
+
+    def find_worker(self, tool_name):
+        """查找提供指定工具的服务器工作对象"""
+        server_name = self.registry.server_for(tool_name)
+        return self.workers.get(server_name) if server_name else None
     
     def close_all_servers(self):
         """关闭所有服务器"""
-        for worker in self.workers.values():
-            # 先执行清理
-            if hasattr(worker, 'cleanup'):
-                try:
-                    worker.cleanup()
-                except Exception as e:
-                    logger.error(f"关闭服务器时出错: {str(e)}")
+        connections = [worker.connection for worker in self.workers.values()]
+        if not connections:
+            return
 
-            # 然后终止线程
-            worker.terminate()
-            worker.wait()
\ No newline at end of file
+        async def close_all():
+            await asyncio.gather(
+                *(connection.close() for connection in connections),
+                return_exceptions=True,
+            )
+
+        try:
+            get_runtime().run(close_all(), timeout=15.0)
+        except Exception as e:
+            logger.error(f"关闭服务器时出错: {str(e)}")
@@ -6,127 +6,63 @@
 """
 
 import logging
+import time
 import httpx
 import json
 from PyQt5.QtWidgets import QMessageBox
 
+from core.async_runtime import get_runtime
+from core.codec import ProviderCodec
+from core.http_pool import get_http_pool
+from core.metrics import LLM_REQUEST_ERRORS, LLM_REQUEST_SECONDS
+from core.resilience import CircuitOpenError, get_resilience
+from core.tool_calls import encode_tool_calls
+from core.tracing import activate, current_span, get_tracer
+
 logger = logging.getLogger(__name__)
 
 class LLMClient:
     """LLM客户端类，用于与大语言模型API通信"""
     
-    def __init__(self, api_key, model_id, model_info, provider_info, parameters=None):
+    def __init__(self, api_key, model_id, model_info, provider_info, parameters=None, codec=None,
+                 hedging=None, fallback=None, response_cache=None):
         self.api_key = api_key
         self.model_id = model_id
         self.model_info = model_info
         self.provider_info = provider_info
+
+        # 优先使用加载配置时预编译的编解码器
+        self.codec = codec or ProviderCodec(provider_info)
         
         # 使用提供的参数或模型默认参数
         self.parameters = parameters or model_info.get("default_parameters", {})
-    
-    def _prepare_headers(self):
-        """准备请求头"""
-        if not self.provider_info or "headers" not in self.provider_info:
-            return {"Content-Type": "application/json", "Authorization": f"Bearer {self.api_key}"}
-            
-        headers = {}
-        for key, value in self.provider_info["headers"].items():
-            # 替换变量
-            if isinstance(value, str):
-                value = value.replace("{api_key}", self.api_key)
-            headers[key] = value
-            
-        return headers
-    
-    def _prepare_payload(self, messages):
-        """准备请求负载"""
-        if not self.provider_info or "request_format" not in self.provider_info:
-            # 默认格式（千问形式）
-            return {
-                "model": self.model_id,
-                "input": {"messages": messages},
-                "parameters": self.parameters
-            }
-            
-        # 获取请求格式模板
-        template = self.provider_info["request_format"]
-        
-        # 递归处理模板，替换特殊变量
-        def process_template(template, data):
-            if isinstance(template, dict):
-                result = {}
-                for k, v in template.items():
-                    result[k] = process_template(v, data)
-                return result
-            elif isinstance(template, list):
-                return [process_template(item, data) for item in template]
-            elif isinstance(template, str):
-                # 处理特殊变量
-                if template == "{model_id}":
-                    return self.model_id
-                elif template == "{messages}":
-                    return messages
-                elif template == "{parameters}":
-                    return self.parameters
-                elif template in data:
-                    # 处理参数中的变量
-                    return data[template.strip("{}")]
-                return template
-            else:
-                return template
-                
-        # 处理请求格式
-        payload = process_template(template, self.parameters)
-        return payload
-    
-    def _extract_content(self, response_data):
-        """从响应数据中提取内容"""
-        if not self.provider_info or "response_format" not in self.provider_info:
-            # 默认格式（千问形式）
-            try:
-                return response_data["output"]["choices"][0]["message"]["content"]
-            except (KeyError, IndexError):
-                logger.error(f"无法从响应中提取内容: {response_data}")
-                return "无法解析模型响应"
-        
-        # 使用配置的内容路径
-        content_path = self.provider_info["response_format"].get("content_path")
-        if not content_path:
-            logger.error("未配置内容路径")
-            return "未配置内容路径"
-            
-        # 解析内容路径
-        path_parts = content_path.split(".")
-        data = response_data
-        
-        for part in path_parts:
-            # 处理数组索引，如 choices[0]
-            if "[" in part and "]" in part:
-                name, index_str = part.split("[", 1)
-                index = int(index_str.split("]")[0])
-                
-                if name not in data:
-                    logger.error(f"路径不存在: {part} in {data}")
-                    return "路径不存在"
-                    
-                data = data[name][index]
-            else:
-                if part not in data:
-                    logger.error(f"路径不存在: {part} in {data}")
-                    return "路径不存在"
-                    
-                data = data[part]
-                
-        return data
-    
-    def get_response(self, messages):
+
+        # 同一提供商的所有客户端共享一个长连接传输
+        provider_id = model_info.get("provider", "default")
+        transport_options = (provider_info or {}).get("transport")
+        self.transport = get_http_pool().get(provider_id, transport_options)
+
+        # 同一提供商共享重试预算和熔断器
+        self.resilience = get_resilience(f"llm:{provider_id}", (provider_info or {}).get("resilience"))
+
+        # 可选的对冲策略，对冲请求发给fallback客户端（未提供时发给本模型）
+        self.hedging = hedging
+        self.fallback = fallback
+
+        # 可选的持久化响应缓存（ResponseCache）
+        self.response_cache = response_cache
+
+    def get_response(self, messages, tools=None):
         """从LLM获取响应
         
         Args:
             messages: 消息历史列表
+            tools: 可选，以原生函数调用方式提供给模型的Tool列表（提供商不支持时忽略）
             
         Returns:
-            LLM的响应文本
+            LLM的响应文本；模型调用工具时为与文本协议相同的调用JSON；
+            按提供商的重试策略重试后仍失败时为错误信息。
+            启用响应缓存时，与之前完全相同的请求直接返回缓存的响应
         """
         # 获取基础URL
         base_url = self.model_info.get("base_url")
@@ -136,19 +72,50 @@ class LLMClient:
             return f"配置错误: {error_message}"
 
         # 准备请求头和负载
-        headers = self._prepare_headers()
-        payload = self._prepare_payload(messages)
+        headers, payload, native_tools = self._build_request(messages, tools)
 
+        span = get_tracer().span(
+            "llm.request",
+            model=self.model_id,
+            messages=len(messages),
+            tools=len(native_tools) if native_tools else 0,
+            retries=0,
+        )
+        cache_key = None
         try:
-            with httpx.Client(timeout=60.0) as client:
-                response = client.post(base_url, headers=headers, json=payload)
-                response.raise_for_status()
-                data = response.json()
+            with span:
+                if self.response_cache is not None:
+                    cache_key, cached = self.response_cache.lookup(
+                        self.model_id, self._request_parameters(native_tools), messages
+                    )
+                    span.set_attribute("cache_hit", cached is not None)
+                    if cached is not None:
+                        return cached
+                if self.hedging is None:
+                    client = self
+                    data = self.resilience.call(self._post, base_url, headers, payload)
+                else:
+                    client, data, native_tools = get_runtime().run(
+                        self._post_hedged(span, messages, tools, headers, payload, native_tools)
+                    )
 
-                # 提取内容
-                return self._extract_content(data)
+            # 优先读取结构化的工具调用，其次提取内容
+            tool_calls = client.codec.decode_tool_calls(data) if native_tools else None
+            if tool_calls:
+                response = encode_tool_calls(tool_calls)
+            else:
+                try:
+                    response = client.codec.decode_content(data)
+                except ValueError:
+                    # 解析失败的说明照常返回，但不写入缓存
+                    return client.codec.decode(data)
 
-        except httpx.RequestError as e:
+            # 对冲请求由后备模型胜出时，它的回复不作为本模型的缓存结果
+            if cache_key is not None and client is self:
+                self.response_cache.store(cache_key, self.model_id, response)
+            return response
+
+        except (httpx.HTTPError, CircuitOpenError) as e:
             error_message = f"获取LLM响应出错: {str(e)}"
             logger.error(error_message)
 
@@ -162,7 +129,212 @@ class LLMClient:
                 "请再试一次或者重新表述您的请求。"
             )
 
-def create_llm_client(api_key, model_id, model_info=None, provider_info=None, parameters=None):
+    def _build_request(self, messages, tools=None):
+        """构造请求头和负载
+
+        Returns:
+            (请求头, 负载, 实际提供的原生工具列表) 元组
+        """
+        headers = self.codec.build_headers(self.api_key)
+        native_tools = tools if tools and self.codec.supports_tool_calls else None
+        parameters = self._request_parameters(native_tools)
+        return headers, self.codec.encode(self.model_id, messages, parameters), native_tools
+
+    def _request_parameters(self, native_tools=None):
+        """请求参数，提供原生工具时包含工具定义"""
+        if native_tools:
+            return self.codec.encode_tools(self.parameters, native_tools)
+        return self.parameters
+
+    async def _post_hedged(self, span, messages, tools, headers, payload, native_tools):
+        """在共享异步运行时中按对冲策略发送请求，较慢的请求被取消
+
+        Returns:
+            (胜出的客户端, 响应数据, 该请求提供的原生工具列表) 元组
+        """
+        hedge_client = self.fallback if self.fallback and self.fallback.model_info.get("base_url") else self
+        if hedge_client is self:
+            hedge_headers, hedge_payload, hedge_tools = headers, payload, native_tools
+        else:
+            hedge_headers, hedge_payload, hedge_tools = hedge_client._build_request(messages, tools)
+
+        async def primary():
+            data = await self.resilience.call_async(
+                self._post_async, self.model_info["base_url"], headers, payload
+            )
+            return self, data, native_tools
+
+        async def hedge():
+            data = await hedge_client.resilience.call_async(
+                hedge_client._post_async, hedge_client.model_info["base_url"], hedge_headers, hedge_payload
+            )
+            return hedge_client, data, hedge_tools
+
+        with activate(span):
+            return await self.hedging.run(primary, hedge)
+
+    async def _post_async(self, base_url, headers, payload):
+        """发送一次可取消的请求并解析JSON响应，在共享异步运行时中运行"""
+        span = current_span()
+        start = time.perf_counter()
+        try:
+            response = await self.transport.post_async(base_url, headers, payload)
+            span.set_attributes(
+                status_code=response.status_code,
+                response_bytes=len(response.content),
+            )
+            response.raise_for_status()
+            return response.json()
+        except Exception:
+            LLM_REQUEST_ERRORS.labels(self.model_id).inc()
+            raise
+        finally:
+            LLM_REQUEST_SECONDS.labels(self.model_id).observe(time.perf_counter() - start)
+
+    def _post(self, base_url, headers, payload):
+        """发送一次请求并解析JSON响应"""
+        span = current_span()
+        start = time.perf_counter()
+        try:
+            response = self.transport.post(base_url, headers, payload)
+            span.set_attributes(
+                status_code=response.status_code,
+                response_bytes=len(response.content),
+            )
+            response.raise_for_status()
+            return response.json()
+        except Exception:
+            LLM_REQUEST_ERRORS.labels(self.model_id).inc()
+            raise
+        finally:
+            LLM_REQUEST_SECONDS.labels(self.model_id).observe(time.perf_counter() - start)
+
+    def _open_stream(self, base_url, headers, payload):
+        """发送流式请求并检查状态码，出错时关闭响应"""
+        response = self.transport.open_stream(base_url, headers, payload)
+        current_span().set_attribute("status_code", response.status_code)
+        if response.is_error:
+            try:
+                response.read()
+            finally:
+                response.close()
+            response.raise_for_status()
+        return response
+
+    def supports_streaming(self):
+        """当前提供商是否启用了SSE流式响应"""
+        return self.codec.supports_streaming
+
+    def supports_tool_calls(self):
+        """当前提供商是否启用了原生函数调用"""
+        return self.codec.supports_tool_calls
+
+    def stream_response(self, messages):
+        """以SSE流式方式从LLM获取响应
+
+        收到响应头之前的错误按提供商的重试策略重试，开始输出后不再重试。
+        启用响应缓存时，命中的响应作为一个片段产出，完整结束（收到 [DONE] 或结束原因）且有内容的流式响应才写入缓存
+
+        Args:
+            messages: 消息历史列表
+
+        Yields:
+            响应文本的增量片段
+        """
+        base_url = self.model_info.get("base_url")
+        if not base_url:
+            error_message = f"模型 {self.model_id} 缺少base_url配置"
+            logger.error(error_message)
+            yield f"配置错误: {error_message}"
+            return
+
+        # 流式请求使用提供商配置的额外请求头和参数
+        stream_config = self.codec.stream_config
+        headers = {**self.codec.build_headers(self.api_key), **stream_config.get("headers", {})}
+        parameters = {**self.parameters, **stream_config.get("parameters", {})}
+        payload = self.codec.encode(self.model_id, messages, parameters)
+
+        # 生成器在调用方的上下文中运行，span不设为当前span，只在发送请求时激活以记录请求大小
+        span = get_tracer().span(
+            "llm.request", model=self.model_id, messages=len(messages), stream=True, retries=0
+        )
+        chunks = 0
+        start = time.perf_counter()
+        cache_key = None
+        received = []
+        finished = False  # 收到 [DONE] 或结束原因时才算完整结束
+        try:
+            if self.response_cache is not None:
+                cache_key, cached = self.response_cache.lookup(self.model_id, parameters, messages)
+                span.set_attribute("cache_hit", cached is not None)
+                if cached is not None:
+                    chunks = 1
+                    yield cached
+                    return
+            with activate(span):
+                response = self.resilience.call(self._open_stream, base_url, headers, payload)
+            try:
+                for event in self._iter_sse_events(response):
+                    if event == "[DONE]":
+                        finished = True
+                        break
+                    try:
+                        data = json.loads(event)
+                    except json.JSONDecodeError:
+                        logger.warning(f"无法解析SSE事件: {event}")
+                        continue
+
+                    delta = self.codec.decode_delta(data)
+                    if delta:
+                        if not chunks:
+                            span.set_attribute("first_chunk_ms", round(span.duration_ms, 3))
+                        chunks += 1
+                        if cache_key is not None:
+                            received.append(delta)
+                        yield delta
+                    if self.codec.decode_finish_reason(data):
+                        finished = True
+            finally:
+                response.close()
+            # 中途断开或没有任何内容的响应不缓存
+            if cache_key is not None and finished and received:
+                self.response_cache.store(cache_key, self.model_id, "".join(received))
+
+        except (httpx.HTTPError, CircuitOpenError) as e:
+            span.record_error(e)
+            LLM_REQUEST_ERRORS.labels(self.model_id).inc()
+            error_message = f"获取LLM响应出错: {str(e)}"
+            logger.error(error_message)
+
+            if isinstance(e, httpx.HTTPStatusError):
+                logger.error(f"状态码: {e.response.status_code}")
+                logger.error(f"响应详情: {e.response.text}")
+
+            yield (
+                f"我遇到了一个错误: {error_message}. "
+                "请再试一次或者重新表述您的请求。"
+            )
+        finally:
+            span.set_attribute("chunks", chunks)
+            span.end()
+            LLM_REQUEST_SECONDS.labels(self.model_id).observe(time.perf_counter() - start)
+
+    def _iter_sse_events(self, response):
+        """将SSE响应拆分为事件，产出每个事件的data内容"""
+        data_lines = []
+        for line in response.iter_lines():
+            if not line:
+                if data_lines:
+                    yield "\n".join(data_lines)
+                    data_lines = []
+                continue
+            if line.startswith("data:"):
+                data_lines.append(line[5:].lstrip())
+        if data_lines:
+            yield "\n".join(data_lines)
+
+def create_llm_client(api_key, model_id, model_info=None, provider_info=None, parameters=None,
+                      codec=None, hedging=None, fallback=None, response_cache=None):
     """创建LLM客户端
     
     Args:
@@ -171,11 +343,16 @@ def create_llm_client(api_key, model_id, model_info=None, provider_info=None, pa
         model_info: 模型信息
         provider_info: 提供商信息
         parameters: 模型参数
+        codec: 预编译的提供商编解码器
+        hedging: 可选，对冲策略（HedgePolicy）
+        fallback: 可选，接收对冲请求的LLMClient
+        response_cache: 可选，持久化响应缓存（ResponseCache）
         
     Returns:
         LLMClient实例
     """
-    return LLMClient(api_key, model_id, model_info, provider_info, parameters)
+    return LLMClient(api_key, model_id, model_info, provider_info, parameters, codec, hedging, fallback,
+                     response_cache)
 
 def show_error_dialog(parent, title, message):
     """显示错误对话框
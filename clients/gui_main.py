@@ -9,6 +9,8 @@ import sys
 import logging
 from PyQt5.QtWidgets import QApplication
 from gui.main_window import MainWindow
+from core.metrics import start_metrics_server
+from core.tracing import get_tracer
 from dotenv import load_dotenv
 
 # 配置日志
@@ -22,6 +24,9 @@ def main():
     """初始化并启动GUI应用程序"""
     # 加载环境变量
     load_dotenv()
+
+    # 配置了 METRICS_PORT 时在后台提供 /metrics
+    start_metrics_server()
     
     # 创建Qt应用
     app = QApplication(sys.argv)
@@ -31,8 +36,10 @@ def main():
     window = MainWindow()
     window.show()
     
-    # 执行应用
-    sys.exit(app.exec_())
+    # 执行应用，退出前导出剩余的追踪数据
+    exit_code = app.exec_()
+    get_tracer().shutdown()
+    sys.exit(exit_code)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,390 @@
+"""ASGI chat service for the MCP client.
+
+Serves many concurrent conversations on one event loop. All conversations
+share one ChatSession, and with it one set of MCP server sessions and the
+pooled LLM connections; only each conversation's messages and context
+window are kept per session. Requests for the same session run one at a
+time, while different sessions proceed concurrently.
+
+Idle sessions are written to disk and dropped from memory after a timeout,
+so one process can keep thousands of conversations open; a spilled session
+is restored transparently on its next request. Configure this with the
+"sessions" block of servers_config.json (see core.sessions).
+
+Endpoints:
+    POST   /sessions               create a session -> {"session_id"}
+    GET    /sessions/{id}          the session's message history
+    DELETE /sessions/{id}          close a session
+    POST   /chat                   {"session_id"?, "message"} -> the turn result
+    POST   /chat/stream            the same, as server-sent events per stage
+    GET    /healthz                server and session status
+    GET    /metrics                Prometheus metrics
+
+Usage (from the clients directory):
+    python service_main.py --host 127.0.0.1 --port 8000
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable
+
+import uvicorn
+
+from core.http_pool import get_http_pool
+from core.metrics import get_metrics, metrics_app
+from core.sessions import DEFAULT_SWEEP_INTERVAL, Conversation, SessionStore
+from core.tracing import get_tracer
+from test_main import ChatSession, Configuration, build_chat_session
+
+logger = logging.getLogger(__name__)
+
+Receive = Callable[[], Awaitable[dict[str, Any]]]
+Send = Callable[[dict[str, Any]], Awaitable[None]]
+
+# Upper bound on a request body, to reject oversized payloads early
+MAX_BODY_BYTES = 1024 * 1024
+
+
+class HTTPError(Exception):
+    """An error answered with the given status code and message."""
+
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status: int = status
+        self.message: str = message
+
+
+class ChatService:
+    """A raw ASGI application serving chat sessions over one ChatSession."""
+
+    def __init__(
+        self,
+        chat_session: ChatSession,
+        max_sessions: int | None = None,
+        llm_workers: int = 64,
+        idle_timeout: float | None = None,
+        spill_dir: str | None = None,
+        sweep_interval: float = DEFAULT_SWEEP_INTERVAL,
+    ) -> None:
+        """Create the service.
+
+        Args:
+            chat_session: The shared chat session; its servers are started
+                at lifespan startup.
+            max_sessions: Optional cap on sessions held in memory; the least
+                recently used idle session is spilled to disk (or closed,
+                without spill_dir) when it is exceeded.
+            llm_workers: Worker threads for the blocking LLM calls, i.e. the
+                number of LLM requests that can be in flight at once.
+            idle_timeout: Seconds after which an idle session is evicted.
+            spill_dir: Directory evicted sessions are written to; without
+                it, evicted sessions are closed for good.
+            sweep_interval: Seconds between idle-session sweeps.
+        """
+        self.chat_session: ChatSession = chat_session
+        self.sessions: SessionStore = SessionStore(
+            chat_session.create_context_window, max_sessions, idle_timeout, spill_dir
+        )
+        self.llm_workers: int = llm_workers
+        self.sweep_interval: float = sweep_interval
+        self._executor: ThreadPoolExecutor | None = None
+        self._sweeper: asyncio.Task[None] | None = None
+
+        get_metrics().gauge_callback(
+            "chat_sessions",
+            "Chat sessions held in memory or spilled to disk",
+            ("state",),
+            lambda: {
+                ("active",): len(self.sessions),
+                ("spilled",): self.sessions.spilled_count(),
+            },
+        )
+
+    async def __call__(self, scope: dict[str, Any], receive: Receive, send: Send) -> None:
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        try:
+            await self.route(scope, receive, send)
+        except HTTPError as e:
+            await self.send_json(send, {"error": e.message}, e.status)
+        except Exception as e:
+            logger.exception("Unhandled error serving %s", scope["path"])
+            await self.send_json(send, {"error": f"{type(e).__name__}: {e}"}, 500)
+
+    async def lifespan(self, receive: Receive, send: Send) -> None:
+        """Start the shared servers on startup and release everything on shutdown."""
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await self.startup()
+                except Exception as e:
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def startup(self) -> None:
+        """Size the LLM thread pool, start the MCP servers once and begin sweeping idle sessions."""
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.llm_workers, thread_name_prefix="llm"
+        )
+        asyncio.get_running_loop().set_default_executor(self._executor)
+        await self.chat_session.start_servers()
+        await self.chat_session.refresh_tools()
+        if self.sessions.idle_timeout:
+            self._sweeper = asyncio.create_task(self.sessions.sweep(self.sweep_interval))
+
+    async def shutdown(self) -> None:
+        """Close sessions (spilling them to disk if configured), servers and connection pools."""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+        self.sessions.close()
+        self.chat_session.context_window.close()
+        await self.chat_session.cleanup_servers()
+        get_http_pool().close()
+        get_tracer().shutdown()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    async def route(self, scope: dict[str, Any], receive: Receive, send: Send) -> None:
+        """Dispatch a request to its handler."""
+        method = scope["method"]
+        path = scope["path"].rstrip("/") or "/"
+
+        if path == "/metrics":
+            await metrics_app(scope, receive, send)
+        elif path == "/healthz" and method == "GET":
+            await self.send_json(send, self.health())
+        elif path == "/sessions" and method == "POST":
+            body = await self.read_json(receive, required=False)
+            conversation = self.create_session(body.get("session_id"))
+            await self.send_json(send, {"session_id": conversation.session_id}, 201)
+        elif path.startswith("/sessions/"):
+            await self.handle_session(method, path[len("/sessions/"):], send)
+        elif path == "/chat" and method == "POST":
+            await self.handle_chat(await self.read_json(receive), send)
+        elif path == "/chat/stream" and method == "POST":
+            await self.handle_chat_stream(await self.read_json(receive), send)
+        else:
+            raise HTTPError(404, f"No route for {method} {path}")
+
+    def health(self) -> dict[str, Any]:
+        """Report server readiness and the number of open sessions."""
+        return {
+            "status": "ok",
+            "servers": {
+                server.name: server.connection.ready
+                for server in self.chat_session.servers
+            },
+            "tools": len(self.chat_session.tool_registry),
+            "sessions": len(self.sessions),
+            "spilled_sessions": self.sessions.spilled_count(),
+        }
+
+    def create_session(self, session_id: str | None = None) -> Conversation:
+        """Create a session, rejecting an ID that is already in use."""
+        try:
+            return self.sessions.create(session_id)
+        except ValueError as e:
+            raise HTTPError(409, str(e)) from e
+
+    async def handle_session(self, method: str, session_id: str, send: Send) -> None:
+        """Serve GET and DELETE on /sessions/{id}."""
+        if method == "DELETE":
+            if not self.sessions.delete(session_id):
+                raise HTTPError(404, f"Unknown session: {session_id}")
+            await self.send_json(send, {"session_id": session_id, "deleted": True})
+            return
+        if method != "GET":
+            raise HTTPError(405, f"Method {method} not allowed")
+
+        conversation = self.sessions.get(session_id)
+        if conversation is None:
+            raise HTTPError(404, f"Unknown session: {session_id}")
+        await self.send_json(
+            send, {"session_id": session_id, "messages": conversation.messages[1:]}
+        )
+
+    def parse_chat(self, body: dict[str, Any]) -> tuple[str | None, str]:
+        """Validate a chat request, returning its session ID and message."""
+        message = body.get("message")
+        if not isinstance(message, str) or not message.strip():
+            raise HTTPError(400, "'message' must be a non-empty string")
+        session_id = body.get("session_id")
+        if session_id is not None and not SessionStore.valid_id(session_id):
+            raise HTTPError(400, "'session_id' must be 1-128 letters, digits, '-' or '_'")
+        return session_id, message.strip()
+
+    async def handle_chat(self, body: dict[str, Any], send: Send) -> None:
+        """Run one turn and answer with the whole result."""
+        session_id, message = self.parse_chat(body)
+        async with self.sessions.use(session_id) as conversation:
+            turn = await self.chat_session.run_turn(
+                conversation.messages, message, conversation.context_window
+            )
+        await self.send_json(send, {"session_id": conversation.session_id, **turn.to_dict()})
+
+    async def handle_chat_stream(self, body: dict[str, Any], send: Send) -> None:
+        """Run one turn and send each stage as a server-sent event."""
+        session_id, message = self.parse_chat(body)
+        session_id = session_id or self.sessions.create().session_id
+        events: asyncio.Queue[tuple[str, Any]] = asyncio.Queue()
+
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream; charset=utf-8"),
+                (b"cache-control", b"no-cache"),
+            ],
+        })
+        await self.send_event(send, "session", {"session_id": session_id})
+
+        async def run() -> None:
+            async with self.sessions.use(session_id) as conversation:
+                turn = await self.chat_session.run_turn(
+                    conversation.messages,
+                    message,
+                    conversation.context_window,
+                    lambda event, data: events.put_nowait((event, data)),
+                )
+            events.put_nowait(("done", turn.to_dict()))
+
+        task = asyncio.create_task(run())
+        try:
+            while True:
+                getter = asyncio.ensure_future(events.get())
+                await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+                if getter.done():
+                    event, data = getter.result()
+                else:
+                    getter.cancel()
+                    if events.empty():
+                        task.result()  # raises if the turn failed
+                        break
+                    event, data = events.get_nowait()
+                await self.send_event(send, event, data)
+                if event == "done":
+                    break
+        except Exception as e:
+            logger.error(f"Streaming turn failed: {e}")
+            await self.send_event(send, "error", {"error": f"{type(e).__name__}: {e}"})
+        finally:
+            if not task.done():
+                task.cancel()
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    @staticmethod
+    async def read_json(receive: Receive, required: bool = True) -> dict[str, Any]:
+        """Read and decode a JSON object request body."""
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > MAX_BODY_BYTES:
+                raise HTTPError(413, "Request body too large")
+            chunks.append(chunk)
+            if not message.get("more_body"):
+                break
+
+        raw = b"".join(chunks)
+        if not raw.strip():
+            if required:
+                raise HTTPError(400, "Request body must be a JSON object")
+            return {}
+        try:
+            body = json.loads(raw)
+        except ValueError as e:
+            raise HTTPError(400, f"Invalid JSON: {e}") from e
+        if not isinstance(body, dict):
+            raise HTTPError(400, "Request body must be a JSON object")
+        return body
+
+    @staticmethod
+    async def send_json(send: Send, data: Any, status: int = 200) -> None:
+        body = json.dumps(data, ensure_ascii=False, default=str).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json; charset=utf-8"),
+                (b"content-length", str(len(body)).encode("ascii")),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    @staticmethod
+    async def send_event(send: Send, event: str, data: Any) -> None:
+        payload = json.dumps(data, ensure_ascii=False, default=str)
+        await send({
+            "type": "http.response.body",
+            "body": f"event: {event}\ndata: {payload}\n\n".encode("utf-8"),
+            "more_body": True,
+        })
+
+
+def create_app(
+    config: Configuration | None = None,
+    server_config: dict[str, Any] | None = None,
+    **options: Any,
+) -> ChatService:
+    """Build the service from the configuration files.
+
+    Args:
+        config: The environment configuration; loaded when omitted.
+        server_config: The parsed servers_config.json; loaded when omitted.
+        **options: Passed on to ChatService, overriding the "sessions"
+            block of the server configuration.
+
+    Returns:
+        The ASGI application.
+    """
+    config = config or Configuration()
+    server_config = server_config or config.load_config("servers_config.json")
+    session_options = dict(server_config.get("sessions", {}))
+    session_options.update({key: value for key, value in options.items() if value is not None})
+    return ChatService(build_chat_session(config, server_config), **session_options)
+
+
+def main() -> None:
+    """Parse arguments and serve the application with uvicorn."""
+    parser = argparse.ArgumentParser(description="Serve the MCP chat client over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--config", default="servers_config.json")
+    parser.add_argument("--max-sessions", type=int, default=None)
+    parser.add_argument("--llm-workers", type=int, default=64)
+    parser.add_argument("--idle-timeout", type=float, default=None)
+    parser.add_argument("--spill-dir", default=None)
+    parser.add_argument("--log-level", default="INFO")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    config = Configuration()
+    app = create_app(
+        config,
+        config.load_config(args.config),
+        max_sessions=args.max_sessions,
+        llm_workers=args.llm_workers,
+        idle_timeout=args.idle_timeout,
+        spill_dir=args.spill_dir,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level=args.log_level.lower())
+
+
+if __name__ == "__main__":
+    main()
@@ -2,14 +2,40 @@ import asyncio
 import json
 import logging
 import os
-import shutil
-from contextlib import AsyncExitStack
-from typing import Any
+import time
+from typing import Any, Callable
 
 import httpx
 from dotenv import load_dotenv
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.stdio import stdio_client
+from mcp import ClientSession
+
+from core.async_runtime import get_runtime
+from core.context_window import ContextWindow, budget_for_model, make_llm_summarizer
+from core.hedging import HedgePolicy, get_hedge_policy
+from core.http_pool import get_http_pool
+from core.metrics import LLM_REQUEST_ERRORS, LLM_REQUEST_SECONDS, start_metrics_server
+from core.pool import ServerPool
+from core.resilience import CircuitOpenError, get_resilience, retry_safe
+from core.response_cache import ResponseCache, get_response_cache
+from core.result_cache import ToolResultCache
+from core.routing import STAGE_ANSWER, STAGE_TOOL_SELECTION, ModelRouter
+from core.prompt import PROMPT_STYLE_TEXT, PromptBuilder
+from core.startup import (
+    DEFAULT_STARTUP_TIMEOUT,
+    StartupResult,
+    format_startup_report,
+    start_servers,
+)
+from core.tool_calls import (
+    encode_tool_calls,
+    format_tool_results,
+    from_native_tool_calls,
+    parse_tool_calls,
+    tool_specs,
+)
+from core.tool_index import ToolSelector, recent_query
+from core.tools import Tool, ToolRegistry
+from core.tracing import activate, current_span, get_tracer
 
 # 修改日志级别为DEBUG，获取更详细的输出
 logging.basicConfig(
@@ -18,6 +44,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 阿里云千问API的URL
+DASHSCOPE_URL = "https://dashscope.aliyuncs.com/api/v1/services/aigc/text-generation/generation"
+
 
 class Configuration:
     """Manages configuration and environment variables for the MCP client."""
@@ -63,6 +92,15 @@ class Configuration:
             raise ValueError("LLM_API_KEY not found in environment variables")
         return self.api_key
 
+    @property
+    def llm_api_url(self) -> str:
+        """Get the LLM endpoint URL, overridable with LLM_API_URL.
+
+        Returns:
+            The endpoint URL as a string.
+        """
+        return os.getenv("LLM_API_URL") or DASHSCOPE_URL
+
 
 class Server:
     """Manages MCP server connections and tool execution."""
@@ -70,175 +108,142 @@ class Server:
     def __init__(self, name: str, config: dict[str, Any]) -> None:
         self.name: str = name
         self.config: dict[str, Any] = config
-        self.stdio_context: Any | None = None
-        self.session: ClientSession | None = None
+        self.connection: ServerPool = ServerPool(name, config)
+        self.result_cache: ToolResultCache = ToolResultCache(name, config.get("cache"))
+        self.resilience = get_resilience(f"server:{name}", config.get("resilience"))
+        self._annotations: dict[str, dict[str, Any] | None] = {}
         self._cleanup_lock: asyncio.Lock = asyncio.Lock()
-        self.exit_stack: AsyncExitStack = AsyncExitStack()
+
+    @property
+    def session(self) -> ClientSession | None:
+        """The initialized client session, or None."""
+        return self.connection.session
+
+    @property
+    def tools_version(self) -> int:
+        """Version of the cached tool list, bumped whenever it is invalidated."""
+        return self.connection.tools_version
 
     async def initialize(self) -> None:
         """Initialize the server connection."""
-        command = (
-            shutil.which("npx")
-            if self.config["command"] == "npx"
-            else self.config["command"]
-        )
-        if command is None:
-            raise ValueError("The command must be a valid string and cannot be None.")
-
-        server_params = StdioServerParameters(
-            command=command,
-            args=self.config["args"],
-            env={**os.environ, **self.config["env"]}
-            if self.config.get("env")
-            else None,
-        )
         try:
-            stdio_transport = await self.exit_stack.enter_async_context(
-                stdio_client(server_params)
-            )
-            read, write = stdio_transport
-            session = await self.exit_stack.enter_async_context(
-                ClientSession(read, write)
-            )
-            await session.initialize()
-            self.session = session
+            await self.connection.start()
         except Exception as e:
             logging.error(f"Error initializing server {self.name}: {e}")
-            await self.cleanup()
             raise
 
-    async def list_tools(self) -> list[Any]:
+    async def list_tools(self) -> list[Tool]:
         """List available tools from the server.
 
+        The list is cached per session and only fetched again after a
+        tools/list_changed notification or a reconnect.
+
         Returns:
             A list of available tools.
 
         Raises:
             RuntimeError: If the server is not initialized.
         """
-        if not self.session:
+        if not self.connection.ready:
             raise RuntimeError(f"Server {self.name} not initialized")
 
-        tools_response = await self.session.list_tools()
-        tools = []
-
-        for item in tools_response:
-            if isinstance(item, tuple) and item[0] == "tools":
-                for tool in item[1]:
-                    tools.append(Tool(tool.name, tool.description, tool.inputSchema))
-
+        tools = await self.connection.list_tools()
+        self._annotations = {tool.name: tool.annotations for tool in tools}
         return tools
 
-    async def execute_tool(
-        self,
-        tool_name: str,
-        arguments: dict[str, Any],
-        retries: int = 2,
-        delay: float = 1.0,
-    ) -> Any:
-        """Execute a tool with retry mechanism.
+    async def execute_tool(self, tool_name: str, arguments: dict[str, Any]) -> Any:
+        """Execute a tool with the server's retry policy and circuit breaker.
+
+        Results of tools configured for caching are served from the result
+        cache while they are fresh. Transient errors are retried with
+        exponential backoff, except for tools annotated as neither read-only
+        nor idempotent, which are attempted once.
 
         Args:
             tool_name: Name of the tool to execute.
             arguments: Tool arguments.
-            retries: Number of retry attempts.
-            delay: Delay between retries in seconds.
 
         Returns:
             Tool execution result.
 
         Raises:
             RuntimeError: If server is not initialized.
+            CircuitOpenError: If the server is failing and calls are short-circuited.
             Exception: If tool execution fails after all retries.
         """
-        if not self.session:
+        if not self.connection.ready:
             raise RuntimeError(f"Server {self.name} not initialized")
 
-        attempt = 0
-        while attempt < retries:
-            try:
-                logging.info(f"Executing {tool_name}...")
-                result = await self.session.call_tool(tool_name, arguments)
-
-                return result
+        with get_tracer().span("tool.execute", server=self.name, tool=tool_name) as span:
+            annotations = self._annotations.get(tool_name)
+            cached = self.result_cache.get(tool_name, arguments, annotations)
+            span.set_attribute("cache_hit", cached is not None)
+            if cached is not None:
+                return cached
 
-            except Exception as e:
-                attempt += 1
-                logging.warning(
-                    f"Error executing tool: {e}. Attempt {attempt} of {retries}."
+            logging.info(f"Executing {tool_name}...")
+            try:
+                result = await self.resilience.call_async(
+                    self.connection.call_tool,
+                    tool_name,
+                    arguments,
+                    attempts=None if retry_safe(annotations) else 1,
                 )
-                if attempt < retries:
-                    logging.info(f"Retrying in {delay} seconds...")
-                    await asyncio.sleep(delay)
-                else:
-                    logging.error("Max retries reached. Failing.")
-                    raise
+            except Exception as e:
+                logging.error(f"Error executing tool {tool_name}: {e}")
+                raise
+            self.result_cache.put(tool_name, arguments, result, annotations)
+            return result
 
     async def cleanup(self) -> None:
         """Clean up server resources."""
         async with self._cleanup_lock:
             try:
-                await self.exit_stack.aclose()
-                self.session = None
-                self.stdio_context = None
+                await self.connection.close()
             except Exception as e:
                 logging.error(f"Error during cleanup of server {self.name}: {e}")
 
-class Tool:
-    """Represents a tool with its properties and formatting."""
-
-    def __init__(
-        self, name: str, description: str, input_schema: dict[str, Any]
-    ) -> None:
-        self.name: str = name
-        self.description: str = description
-        self.input_schema: dict[str, Any] = input_schema
-
-    def format_for_llm(self) -> str:
-        """Format tool information for LLM.
-
-        Returns:
-            A formatted string describing the tool.
-        """
-        args_desc = []
-        if "properties" in self.input_schema:
-            for param_name, param_info in self.input_schema["properties"].items():
-                arg_desc = (
-                    f"- {param_name}: {param_info.get('description', 'No description')}"
-                )
-                if param_name in self.input_schema.get("required", []):
-                    arg_desc += " (required)"
-                args_desc.append(arg_desc)
-
-        return f"""
-Tool: {self.name}
-Description: {self.description}
-Arguments:
-{chr(10).join(args_desc)}
-"""
-
-
 class LLMClient:
     """Manages communication with the LLM provider."""
 
-    def __init__(self, api_key: str) -> None:
+    def __init__(
+        self,
+        api_key: str,
+        model: str = "qwen-max",
+        url: str = DASHSCOPE_URL,
+        hedging: HedgePolicy | None = None,
+        response_cache: ResponseCache | None = None,
+    ) -> None:
         self.api_key: str = api_key
-
-    def get_response(self, messages: list[dict[str, str]]) -> str:
+        self.model: str = model
+        self.url: str = url
+        self.hedging: HedgePolicy | None = hedging
+        self.response_cache: ResponseCache | None = response_cache
+        self.transport = get_http_pool().get("aliyun")
+        self.resilience = get_resilience("llm:aliyun")
+
+    def get_response(
+        self, messages: list[dict[str, str]], tools: list[Tool] | None = None
+    ) -> str:
         """Get a response from the LLM.
 
         Args:
             messages: A list of message dictionaries.
+            tools: Tools to offer through native function calling, if any.
 
         Returns:
-            The LLM's response as a string.
+            The LLM's response as a string. Native tool calls are returned in
+            the same JSON format as text-mode tool calls. If the request still
+            fails after the provider's retry policy, an error message is
+            returned instead.
 
-        Raises:
-            httpx.RequestError: If the request to the LLM fails.
-        """
-        # 阿里云千问API的URL
-        url = "https://dashscope.aliyuncs.com/api/v1/services/aigc/text-generation/generation"
+        With a hedging policy, a duplicate request (to the policy's fallback
+        model, if any) is sent when the first one is slower than the policy's
+        threshold, and whichever answers first is used.
 
+        With a response cache, a request identical to an earlier one (same
+        model, parameters and messages) is answered from the cache.
+        """
         headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.api_key}",
@@ -247,7 +252,7 @@ class LLMClient:
 
         # 千问API的请求格式
         payload = {
-            "model": "qwen-max",  # 可选择千问的不同模型：qwen-max、qwen-plus、qwen-turbo
+            "model": self.model,  # 可选择千问的不同模型：qwen-max、qwen-plus、qwen-turbo
             "input": {
                 "messages": messages
             },
@@ -258,16 +263,41 @@ class LLMClient:
                 "result_format": "message"  # 以对话形式返回结果
             }
         }
-
+        if tools:
+            payload["parameters"]["tools"] = tool_specs(tools)
+
+        span = get_tracer().span(
+            "llm.request",
+            model=self.model,
+            messages=len(messages),
+            tools=len(tools) if tools else 0,
+            retries=0,
+        )
+        cache_key = None
         try:
-            with httpx.Client(timeout=60.0) as client:
-                response = client.post(url, headers=headers, json=payload)
-                response.raise_for_status()
-                data = response.json()
+            with span:
+                if self.response_cache is not None:
+                    cache_key, cached = self.response_cache.lookup(
+                        self.model, payload["parameters"], messages
+                    )
+                    span.set_attribute("cache_hit", cached is not None)
+                    if cached is not None:
+                        return cached
+                if self.hedging is None:
+                    model = self.model
+                    data = self.resilience.call(self._post, headers, payload)
+                else:
+                    model, data = get_runtime().run(self._post_hedged(span, headers, payload))
+            message = data["output"]["choices"][0]["message"]
 
-                return data["output"]["choices"][0]["message"]["content"]
+            tool_calls = from_native_tool_calls(message.get("tool_calls"))
+            response = encode_tool_calls(tool_calls) if tool_calls else message["content"]
+            # A reply from the hedging fallback model is not cached for this model
+            if cache_key is not None and model == self.model:
+                self.response_cache.store(cache_key, self.model, response)
+            return response
 
-        except httpx.RequestError as e:
+        except (httpx.HTTPError, CircuitOpenError) as e:
             error_message = f"Error getting LLM response: {str(e)}"
             logging.error(error_message)
 
@@ -281,12 +311,206 @@ class LLMClient:
                 "请再试一次或者重新表述您的请求。"
             )
 
+    def _post(self, headers: dict[str, str], payload: dict[str, Any]) -> dict[str, Any]:
+        """Send one request attempt and decode the JSON response."""
+        span = current_span()
+        start = time.perf_counter()
+        try:
+            response = self.transport.post(self.url, headers, payload)
+            span.set_attributes(
+                status_code=response.status_code,
+                response_bytes=len(response.content),
+            )
+            response.raise_for_status()
+            return response.json()
+        except Exception:
+            LLM_REQUEST_ERRORS.labels(payload["model"]).inc()
+            raise
+        finally:
+            LLM_REQUEST_SECONDS.labels(payload["model"]).observe(time.perf_counter() - start)
+
+    async def _post_async(
+        self, headers: dict[str, str], payload: dict[str, Any]
+    ) -> dict[str, Any]:
+        """Send one cancellable request attempt on the shared async runtime."""
+        span = current_span()
+        start = time.perf_counter()
+        try:
+            response = await self.transport.post_async(self.url, headers, payload)
+            span.set_attributes(
+                status_code=response.status_code,
+                response_bytes=len(response.content),
+            )
+            response.raise_for_status()
+            return response.json()
+        except Exception:
+            LLM_REQUEST_ERRORS.labels(payload["model"]).inc()
+            raise
+        finally:
+            LLM_REQUEST_SECONDS.labels(payload["model"]).observe(time.perf_counter() - start)
+
+    async def _post_hedged(
+        self, span: Any, headers: dict[str, str], payload: dict[str, Any]
+    ) -> tuple[str, dict[str, Any]]:
+        """Send the request under the hedging policy; the slower request is cancelled.
+
+        Returns:
+            The model that answered first and its decoded JSON response.
+        """
+        hedge_payload = {**payload, "model": self.hedging.fallback or self.model}
+
+        async def send(request_payload: dict[str, Any]) -> tuple[str, dict[str, Any]]:
+            data = await self.resilience.call_async(self._post_async, headers, request_payload)
+            return request_payload["model"], data
+
+        with activate(span):
+            return await self.hedging.run(lambda: send(payload), lambda: send(hedge_payload))
+
+class TurnResult:
+    """The outcome of one user turn, with per-stage timings in seconds."""
+
+    def __init__(self, user_input: str) -> None:
+        self.user_input: str = user_input
+        self.response: str = ""
+        self.tool_calls: list[dict[str, Any]] | None = None
+        self.tool_result: str | None = None
+        self.timings: dict[str, float] = {}
+        self.trace_id: str | None = None
+
+    def to_dict(self) -> dict[str, Any]:
+        """Convert the turn to a JSON-serializable dictionary."""
+        return {
+            "user": self.user_input,
+            "response": self.response,
+            "tool_calls": self.tool_calls,
+            "tool_result": self.tool_result,
+            "timings": {stage: round(value, 4) for stage, value in self.timings.items()},
+            "trace_id": self.trace_id,
+        }
+
+
 class ChatSession:
     """Orchestrates the interaction between user, LLM, and tools."""
 
-    def __init__(self, servers: list[Server], llm_client: LLMClient) -> None:
+    def __init__(
+        self,
+        servers: list[Server],
+        llm_client: LLMClient,
+        startup_timeout: float = DEFAULT_STARTUP_TIMEOUT,
+        context_window: ContextWindow | None = None,
+        prompt_style: str = PROMPT_STYLE_TEXT,
+        tool_selector: ToolSelector | None = None,
+        function_calling: bool = False,
+        router: ModelRouter | None = None,
+    ) -> None:
         self.servers: list[Server] = servers
         self.llm_client: LLMClient = llm_client
+        self.router: ModelRouter = router or ModelRouter()
+        self.startup_timeout: float = startup_timeout
+        self.context_window: ContextWindow = context_window or ContextWindow()
+        self.prompt_builder: PromptBuilder = PromptBuilder(prompt_style)
+        self.tool_selector: ToolSelector = tool_selector or ToolSelector()
+        self.function_calling: bool = function_calling
+        self.tool_registry: ToolRegistry = ToolRegistry()
+        self._servers_by_name: dict[str, Server] = {
+            server.name: server for server in servers
+        }
+        self._tool_versions: dict[str, int] = {}
+        self._routed_clients: dict[str, LLMClient] = {llm_client.model: llm_client}
+
+    async def start_servers(self) -> list[StartupResult]:
+        """Start all servers concurrently, each within its own deadline.
+
+        Servers that fail or time out are marked degraded and skipped; the
+        session continues with the servers that came up.
+
+        Returns:
+            One startup result per server, in configuration order.
+        """
+        results = await start_servers(
+            [server.connection for server in self.servers], self.startup_timeout
+        )
+        logging.info(format_startup_report(results))
+
+        if not any(result.ready for result in results):
+            logging.warning("No server is available; continuing without tools.")
+        return results
+
+    async def refresh_tools(self) -> bool:
+        """Refresh the tool registry from servers whose tool list changed.
+
+        Returns:
+            True if the registry changed and the system prompt needs rebuilding.
+        """
+        changed = False
+        for server in self.servers:
+            version = server.tools_version
+            if not server.connection.ready or self._tool_versions.get(server.name) == version:
+                continue
+            tools = await server.list_tools()
+            self._tool_versions[server.name] = version
+            changed = self.tool_registry.update_server(server.name, tools) or changed
+        return changed
+
+    def prepare_prompt(
+        self, query: str | None = None
+    ) -> tuple[dict[str, str], list[Tool], bool]:
+        """Build the system message and pick the tools offered to the LLM.
+
+        The prompt is cached by the registry version and only re-formatted
+        when the tool catalog changes.
+
+        Args:
+            query: Recent conversation text. When given and tool selection is
+                enabled, only the most relevant tools are included.
+
+        Returns:
+            The system message, the tools it offers, and whether those are
+            all registered tools.
+        """
+        with get_tracer().span("prompt.build") as span:
+            tools = self.tool_registry.tools()
+            version: Any = self.tool_registry.version
+            complete = True
+            if query is not None:
+                tools, complete = self.tool_selector.select(tools, query, version)
+                if not complete:
+                    version = (version, tuple(tool.name for tool in tools))
+
+            system_prompt = self.prompt_builder.build(
+                tools, version=version, native=self.function_calling
+            )
+            span.set_attributes(
+                tools=len(tools), complete=complete, prompt_chars=len(system_prompt)
+            )
+        return {"role": "system", "content": system_prompt}, tools, complete
+
+    def build_system_message(self, query: str | None = None) -> dict[str, str]:
+        """Build the system message describing the registered tools."""
+        return self.prepare_prompt(query)[0]
+
+    def needs_full_catalog(
+        self, tool_calls: list[dict[str, Any]] | None, complete: bool
+    ) -> bool:
+        """Check whether the LLM asked for a tool that was left out of the prompt.
+
+        Args:
+            tool_calls: The tool calls parsed from the LLM response, or None.
+            complete: Whether the prompt listed all registered tools.
+
+        Returns:
+            True if the prompt only listed selected tools and the response
+            calls a tool that is not registered.
+        """
+        if complete:
+            return False
+        return bool(tool_calls) and any(
+            tool_call["tool"] not in self.tool_registry for tool_call in tool_calls
+        )
+
+    def create_context_window(self) -> ContextWindow:
+        """Create an empty context window with this session's budget."""
+        return ContextWindow(self.context_window.budget, self.context_window.summarizer)
 
     async def cleanup_servers(self) -> None:
         """Clean up all servers properly."""
@@ -300,92 +524,215 @@ class ChatSession:
             except Exception as e:
                 logging.warning(f"Warning during final cleanup: {e}")
 
-    async def process_llm_response(self, llm_response: str) -> str:
-        """Process the LLM response and execute tools if needed.
+    async def execute_tool_call(self, tool_call: dict[str, Any]) -> str:
+        """Execute a single tool call on the server that provides the tool.
+
+        Errors are returned as text so that one failing call does not affect
+        the other calls of the same turn.
 
         Args:
-            llm_response: The response from the LLM.
+            tool_call: A dictionary with "tool" and "arguments" keys.
 
         Returns:
-            The result of tool execution or the original response.
+            The tool result or an error message.
         """
-        import json
+        logging.info(f"Executing tool: {tool_call['tool']}")
+        logging.info(f"With arguments: {tool_call['arguments']}")
 
+        server_name = self.tool_registry.server_for(tool_call["tool"])
+        if server_name is None:
+            return f"No server found with tool: {tool_call['tool']}"
+
+        server = self._servers_by_name[server_name]
         try:
-            tool_call = json.loads(llm_response)
-            if "tool" in tool_call and "arguments" in tool_call:
-                logging.info(f"Executing tool: {tool_call['tool']}")
-                logging.info(f"With arguments: {tool_call['arguments']}")
-
-                for server in self.servers:
-                    tools = await server.list_tools()
-                    if any(tool.name == tool_call["tool"] for tool in tools):
-                        try:
-                            result = await server.execute_tool(
-                                tool_call["tool"], tool_call["arguments"]
-                            )
-
-                            if isinstance(result, dict) and "progress" in result:
-                                progress = result["progress"]
-                                total = result["total"]
-                                percentage = (progress / total) * 100
-                                logging.info(
-                                    f"Progress: {progress}/{total} "
-                                    f"({percentage:.1f}%)"
-                                )
-
-                            return f"Tool execution result: {result}"
-                        except Exception as e:
-                            error_msg = f"Error executing tool: {str(e)}"
-                            logging.error(error_msg)
-                            return error_msg
-
-                return f"No server found with tool: {tool_call['tool']}"
-            return llm_response
-        except json.JSONDecodeError:
+            result = await server.execute_tool(tool_call["tool"], tool_call["arguments"])
+
+            if isinstance(result, dict) and "progress" in result:
+                progress = result["progress"]
+                total = result["total"]
+                percentage = (progress / total) * 100
+                logging.info(f"Progress: {progress}/{total} ({percentage:.1f}%)")
+
+            return str(result)
+        except Exception as e:
+            error_msg = f"Error executing tool: {str(e)}"
+            logging.error(error_msg)
+            return error_msg
+
+    async def process_llm_response(
+        self,
+        llm_response: str,
+        tool_calls: list[dict[str, Any]] | None = None,
+    ) -> str:
+        """Process the LLM response and execute tools if needed.
+
+        The response may contain a single tool call or a JSON array of
+        independent tool calls, which are executed concurrently.
+
+        Args:
+            llm_response: The response from the LLM.
+            tool_calls: Tool calls already parsed from the response; parsed
+                here when omitted.
+
+        Returns:
+            The merged result of tool execution or the original response.
+        """
+        if tool_calls is None:
+            tool_calls = parse_tool_calls(llm_response)
+        if tool_calls is None:
             return llm_response
 
+        results = await asyncio.gather(
+            *(self.execute_tool_call(tool_call) for tool_call in tool_calls)
+        )
+        return format_tool_results(tool_calls, results)
+
+    def client_for(self, stage: str) -> LLMClient:
+        """Get the LLM client the router assigns to a stage of a tool turn.
+
+        Args:
+            stage: STAGE_TOOL_SELECTION or STAGE_ANSWER.
+
+        Returns:
+            A client for the stage's model, sharing the session client's
+            endpoint and credentials.
+        """
+        model = self.router.model_for(stage, self.llm_client.model)
+        client = self._routed_clients.get(model)
+        if client is None:
+            client = LLMClient(
+                self.llm_client.api_key,
+                model,
+                self.llm_client.url,
+                response_cache=self.llm_client.response_cache,
+            )
+            self._routed_clients[model] = client
+        return client
+
+    async def ask_llm(
+        self,
+        messages: list[dict[str, str]],
+        context_window: ContextWindow,
+        tools: list[Tool] | None = None,
+        llm_client: LLMClient | None = None,
+    ) -> str:
+        """Send the budgeted history to the LLM without blocking the event loop."""
+        return await asyncio.to_thread(
+            (llm_client or self.llm_client).get_response,
+            context_window.fit(messages),
+            tools if self.function_calling else None,
+        )
+
+    async def run_turn(
+        self,
+        messages: list[dict[str, str]],
+        user_input: str,
+        context_window: ContextWindow | None = None,
+        on_event: Callable[[str, Any], None] | None = None,
+    ) -> TurnResult:
+        """Run one user turn: LLM call, tool calls if requested, final LLM call.
+
+        Args:
+            messages: The conversation history. messages[0] is the system
+                message; the turn is appended in place.
+            user_input: The user's message.
+            context_window: The conversation's context window; defaults to the
+                session's own.
+            on_event: Optional callback called as each stage completes, with
+                ("tool_calls", calls), ("tool_result", text) and
+                ("response", text).
+
+        Returns:
+            The turn's response, tool calls and per-stage timings.
+        """
+        context_window = context_window or self.context_window
+        turn = TurnResult(user_input)
+        with get_tracer().span("chat.turn", root=True, model=self.llm_client.model) as span:
+            turn.trace_id = span.trace_id
+            await self._run_turn(messages, turn, context_window, on_event)
+            span.set_attributes(
+                tool_calls=len(turn.tool_calls or []),
+                messages=len(messages),
+            )
+        return turn
+
+    async def _run_turn(
+        self,
+        messages: list[dict[str, str]],
+        turn: TurnResult,
+        context_window: ContextWindow,
+        on_event: Callable[[str, Any], None] | None = None,
+    ) -> None:
+        """Run the stages of one turn, filling in turn."""
+        user_input = turn.user_input
+        tracer = get_tracer()
+        emit = on_event or (lambda event, data: None)
+        await self.refresh_tools()
+
+        # List only the tools relevant to the recent conversation
+        query = recent_query(messages, user_input)
+        messages[0], tools, complete = self.prepare_prompt(query)
+        messages.append({"role": "user", "content": user_input})
+
+        # Tool turns pick the tool with a fast model and answer with the
+        # strong one; plain chat goes straight to the session's model
+        routed = self.router.applies(
+            self.tool_selector, self.tool_registry.tools(), query, self.tool_registry.version
+        )
+        select_client = self.client_for(STAGE_TOOL_SELECTION) if routed else self.llm_client
+        answer_client = self.client_for(STAGE_ANSWER) if routed else self.llm_client
+        current_span().set_attributes(routed=routed, tool_model=select_client.model)
+
+        start = time.perf_counter()
+        llm_response = await self.ask_llm(messages, context_window, tools, select_client)
+        with tracer.span("tool_calls.parse", response_chars=len(llm_response)):
+            tool_calls = parse_tool_calls(llm_response)
+
+        if self.needs_full_catalog(tool_calls, complete):
+            logging.info("Unknown tool requested; retrying with all tools.")
+            messages[0], tools, complete = self.prepare_prompt()
+            llm_response = await self.ask_llm(messages, context_window, tools, select_client)
+            with tracer.span("tool_calls.parse", response_chars=len(llm_response)):
+                tool_calls = parse_tool_calls(llm_response)
+
+        if tool_calls is None and select_client is not answer_client and self.router.reanswer:
+            logging.info("Tool selection model answered directly; re-asking the answer model.")
+            llm_response = await self.ask_llm(messages, context_window, tools, answer_client)
+            with tracer.span("tool_calls.parse", response_chars=len(llm_response)):
+                tool_calls = parse_tool_calls(llm_response)
+        turn.timings["llm_1"] = time.perf_counter() - start
+        logging.info("\nAssistant: %s", llm_response)
+
+        messages.append({"role": "assistant", "content": llm_response})
+        if tool_calls is None:
+            turn.response = llm_response
+            emit("response", llm_response)
+            return
+        emit("tool_calls", tool_calls)
+
+        start = time.perf_counter()
+        result = await self.process_llm_response(llm_response, tool_calls)
+        turn.timings["tools"] = time.perf_counter() - start
+        messages.append({"role": "system", "content": result})
+        emit("tool_result", result)
+
+        start = time.perf_counter()
+        final_response = await self.ask_llm(messages, context_window, llm_client=answer_client)
+        turn.timings["llm_2"] = time.perf_counter() - start
+        logging.info("\nFinal response: %s", final_response)
+        messages.append({"role": "assistant", "content": final_response})
+        emit("response", final_response)
+
+        turn.response = final_response
+        turn.tool_calls = tool_calls
+        turn.tool_result = result
+
     async def start(self) -> None:
         """Main chat session handler."""
         try:
-            for server in self.servers:
-                try:
-                    await server.initialize()
-                except Exception as e:
-                    logging.error(f"Failed to initialize server: {e}")
-                    await self.cleanup_servers()
-                    return
-
-            all_tools = []
-            for server in self.servers:
-                tools = await server.list_tools()
-                all_tools.extend(tools)
-
-            tools_description = "\n".join([tool.format_for_llm() for tool in all_tools])
-
-            system_message = (
-                "You are a helpful assistant with access to these tools:\n\n"
-                f"{tools_description}\n"
-                "Choose the appropriate tool based on the user's question. "
-                "If no tool is needed, reply directly.\n\n"
-                "IMPORTANT: When you need to use a tool, you must ONLY respond with "
-                "the exact JSON object format below, nothing else:\n"
-                "{\n"
-                '    "tool": "tool-name",\n'
-                '    "arguments": {\n'
-                '        "argument-name": "value"\n'
-                "    }\n"
-                "}\n\n"
-                "After receiving a tool's response:\n"
-                "1. Transform the raw data into a natural, conversational response\n"
-                "2. Keep responses concise but informative\n"
-                "3. Focus on the most relevant information\n"
-                "4. Use appropriate context from the user's question\n"
-                "5. Avoid simply repeating the raw data\n\n"
-                "Please use only the tools that are explicitly defined above."
-            )
-
-            messages = [{"role": "system", "content": system_message}]
+            await self.start_servers()
+            await self.refresh_tools()
+            messages = [self.build_system_message()]
 
             while True:
                 try:
@@ -394,44 +741,81 @@ class ChatSession:
                         logging.info("\nExiting...")
                         break
 
-                    messages.append({"role": "user", "content": user_input})
-
-                    llm_response = self.llm_client.get_response(messages)
-                    logging.info("\nAssistant: %s", llm_response)
-
-                    result = await self.process_llm_response(llm_response)
-
-                    if result != llm_response:
-                        messages.append({"role": "assistant", "content": llm_response})
-                        messages.append({"role": "system", "content": result})
-
-                        final_response = self.llm_client.get_response(messages)
-                        logging.info("\nFinal response: %s", final_response)
-                        messages.append(
-                            {"role": "assistant", "content": final_response}
-                        )
-                    else:
-                        messages.append({"role": "assistant", "content": llm_response})
+                    await self.run_turn(messages, user_input)
 
                 except KeyboardInterrupt:
                     logging.info("\nExiting...")
                     break
 
         finally:
+            self.context_window.close()
             await self.cleanup_servers()
 
 
-async def main() -> None:
-    """Initialize and run the chat session."""
-    config = Configuration()
-    server_config = config.load_config("servers_config.json")
+def build_chat_session(config: Configuration, server_config: dict[str, Any]) -> ChatSession:
+    """Create the servers, LLM client and chat session from the configuration.
+
+    Args:
+        config: The environment configuration.
+        server_config: The parsed servers_config.json.
+
+    Returns:
+        A chat session whose servers are not started yet.
+    """
     servers = [
         Server(name, srv_config)
         for name, srv_config in server_config["mcpServers"].items()
     ]
-    llm_client = LLMClient(config.llm_api_key)
-    chat_session = ChatSession(servers, llm_client)
-    await chat_session.start()
+    # Keep the history sent to the LLM within the model's token budget
+    models_config = (
+        config.load_config("models_config.json")
+        if os.path.exists("models_config.json")
+        else {}
+    )
+    response_cache = get_response_cache(models_config.get("response_cache"))
+    llm_client = LLMClient(
+        config.llm_api_key, url=config.llm_api_url, response_cache=response_cache
+    )
+    model_info = models_config.get("models", {}).get(llm_client.model, {})
+    if model_info.get("hedging"):
+        llm_client.hedging = get_hedge_policy(llm_client.model, model_info["hedging"])
+    provider_info = models_config.get("providers", {}).get(
+        model_info.get("provider"), {}
+    )
+    budget = budget_for_model(model_info)
+    compaction_client = LLMClient(
+        config.llm_api_key,
+        budget["compaction_model"] or llm_client.model,
+        config.llm_api_url,
+        response_cache=response_cache,
+    )
+    context_window = ContextWindow(
+        budget, summarizer=make_llm_summarizer(compaction_client.get_response)
+    )
+
+    return ChatSession(
+        servers,
+        llm_client,
+        server_config.get("startup_timeout", DEFAULT_STARTUP_TIMEOUT),
+        context_window,
+        model_info.get("prompt_style", PROMPT_STYLE_TEXT),
+        ToolSelector(server_config.get("tool_selection")),
+        provider_info.get("function_calling", {}).get("enabled", False),
+        ModelRouter(models_config.get("routing")),
+    )
+
+
+async def main() -> None:
+    """Initialize and run the chat session."""
+    config = Configuration()
+    server_config = config.load_config("servers_config.json")
+    chat_session = build_chat_session(config, server_config)
+    start_metrics_server()
+    try:
+        await chat_session.start()
+    finally:
+        get_http_pool().close()
+        get_tracer().shutdown()
 
 
 if __name__ == "__main__":
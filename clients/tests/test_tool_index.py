@@ -0,0 +1,54 @@
+"""Tests for per-turn tool selection (core/tool_index.py)."""
+
+from core.tool_index import ToolSelector
+from core.tools import Tool
+
+URL_SCHEMA = {"properties": {"url": {"type": "string", "description": "要获取的网页URL"}}}
+
+TOOLS = [
+    Tool("count_desktop_txt_files", "统计桌面上 .txt 文件的数量。", {}),
+    Tool("list_desktop_txt_files", "获取桌面上所有 .txt 文件的列表。", {}),
+    Tool("fetch_webpage", "获取指定URL的网页内容。", URL_SCHEMA),
+    Tool("list_fetched_pages", "列出所有已获取的网页。", {}),
+    Tool("extract_links", "从已获取的网页中提取所有链接。", URL_SCHEMA),
+]
+
+
+def make_selector(**config):
+    return ToolSelector({"enabled": True, "top_k": 2, **config})
+
+
+def test_relevant_query_selects_subset():
+    selected, complete = make_selector().select(TOOLS, "帮我统计桌面上有几个txt文件", version=1)
+
+    assert not complete
+    assert selected[0].name == "count_desktop_txt_files"
+    assert len(selected) == 2
+
+
+def test_query_matching_nothing_falls_back_to_full_catalog():
+    selected, complete = make_selector().select(TOOLS, "tell me a joke", version=1)
+
+    assert complete
+    assert selected == TOOLS
+
+
+def test_stopwords_and_single_characters_do_not_count_as_matches():
+    selector = make_selector()
+
+    assert selector.relevance(TOOLS, "写一首关于春天的诗", version=1) == 0.0
+    assert selector.select(TOOLS, "写一首关于春天的诗", version=1) == (TOOLS, True)
+
+
+def test_score_below_floor_falls_back_to_full_catalog():
+    query = "请获取所有信息"
+    score = make_selector().relevance(TOOLS, query, version=1)
+
+    assert 0 < score
+    assert make_selector(min_score=score + 1).select(TOOLS, query, version=1) == (TOOLS, True)
+
+
+def test_disabled_selector_returns_full_catalog():
+    selector = ToolSelector({"enabled": False, "top_k": 2})
+
+    assert selector.select(TOOLS, "帮我统计桌面上有几个txt文件") == (TOOLS, True)
@@ -1,11 +1,12 @@
 import os
 from pathlib import Path
 from mcp.server.fastmcp import FastMCP
+from mcp.types import ToolAnnotations
 
 # 创建 MCP Server
 mcp = FastMCP("桌面 TXT 文件统计器")
 
-@mcp.tool()
+@mcp.tool(annotations=ToolAnnotations(readOnlyHint=True))
 def count_desktop_txt_files() -> int:
     """统计桌面上 .txt 文件的数量。"""
     # 获取桌面路径
@@ -15,7 +16,7 @@ def count_desktop_txt_files() -> int:
     txt_files = list(desktop_path.glob("*.txt"))
     return len(txt_files)
 
-@mcp.tool()
+@mcp.tool(annotations=ToolAnnotations(readOnlyHint=True))
 def list_desktop_txt_files() -> str:
     """获取桌面上所有 .txt 文件的列表。"""
     # 获取桌面路径